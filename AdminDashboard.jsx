@@ -19,11 +19,11 @@ const AdminDashboard = () => {
         setLoading(true);
         const [analyticsRes, ordersRes] = await Promise.all([
           apiClient.get('/shopkeeper/analytics', { params: { shop_id: user.shop_id } }),
-          apiClient.get('/shopkeeper/orders', { params: { shop_id: user.shop_id } })
+          apiClient.get('/shopkeeper/orders', { params: { shop_id: user.shop_id, limit: 5 } })
         ]);
         
         setAnalytics(analyticsRes.data);
-        setOrders(ordersRes.data.slice(0, 5));
+        setOrders(ordersRes.data.items);
         setError(null);
       } catch (err) {
         console.error("Error fetching dashboard data:", err);
@@ -3,55 +3,144 @@ import { Link } from 'react-router-dom';
 import apiClient from '../../services/apiClient.js';
 import './BrowsePage.css';
 
+const PAGE_SIZE = 24;
+const SEARCH_DELAY_MS = 250; // wait for the user to stop typing
+
 const BrowsePage = () => {
   const [cakes, setCakes] = useState([]);
+  const [facets, setFacets] = useState({ shapes: [], shops: [], price: {} });
+  const [total, setTotal] = useState(0);
+  const [nextCursor, setNextCursor] = useState(null);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
 
+  // --- Search and filters (sent to /customer/cakes/search) ---
+  const [query, setQuery] = useState('');
+  const [debouncedQuery, setDebouncedQuery] = useState('');
+  const [shape, setShape] = useState('');
+  const [shopId, setShopId] = useState('');
+  const [minPrice, setMinPrice] = useState('');
+  const [maxPrice, setMaxPrice] = useState('');
+  const [sort, setSort] = useState('relevance');
+
   useEffect(() => {
-    const fetchCakes = async () => {
-      try {
-        setLoading(true);
-        const response = await apiClient.get('/customer/cakes');
-        setCakes(response.data);
-      } catch (err) {
-        setError("Failed to load cakes. Please try again later.");
-      } finally {
-        setLoading(false);
-      }
-    };
-    fetchCakes();
-  }, []);
+    const timer = setTimeout(() => setDebouncedQuery(query.trim()), SEARCH_DELAY_MS);
+    return () => clearTimeout(timer);
+  }, [query]);
 
-  if (loading) return <div className="browse-page-container"><p>Loading cakes...</p></div>;
-  if (error) return <div className="browse-page-container error"><p>{error}</p></div>;
+  const fetchCakes = async (cursor = null) => {
+    try {
+      if (!cursor) setLoading(true);
+      const response = await apiClient.get('/customer/cakes/search', {
+        params: {
+          q: debouncedQuery || undefined,
+          shape: shape || undefined,
+          shop_id: shopId || undefined,
+          min_price: minPrice || undefined,
+          max_price: maxPrice || undefined,
+          sort,
+          limit: PAGE_SIZE,
+          cursor: cursor || undefined,
+        }
+      });
+      const { items, next_cursor } = response.data;
+      setCakes(prev => (cursor ? [...prev, ...items] : items));
+      setNextCursor(next_cursor);
+      setTotal(response.data.total);
+      setFacets(response.data.facets);
+      setError(null);
+    } catch (err) {
+      setError(err.response?.data?.error || "Failed to load cakes. Please try again later.");
+    } finally {
+      setLoading(false);
+    }
+  };
+
+  useEffect(() => {
+    fetchCakes();
+  }, [debouncedQuery, shape, shopId, minPrice, maxPrice, sort]);
 
   return (
     <div className="browse-page-container">
       <h1>Choose Your Cake</h1>
       <p>Select a cake from one of our partner shops to start designing.</p>
-      
-      <div className="cake-grid">
-        {cakes.length === 0 && <p>No cakes available at the moment.</p>}
-        {cakes.map(cake => (
-          <div key={cake.id} className="cake-card">
-            <div className="cake-image-placeholder">
-              <span>🎂</span>
-            </div>
-            <div className="cake-card-content">
-              <h3>{cake.name}</h3>
-              <p className="shop-name">from <strong>{cake.shop_name}</strong></p>
-              {/* --- FIX: Changed $ to ₹ --- */}
-              <p className="base-price">Starts at ₹{cake.base_price.toFixed(2)}</p>
-              <Link to={`/designer/${cake.id}`} className="design-link">
-                Customize This Cake
-              </Link>
-            </div>
-          </div>
-        ))}
+
+      <div className="browse-filters">
+        <input
+          type="search"
+          className="browse-search"
+          placeholder="Search cakes, flavors or shops..."
+          value={query}
+          onChange={(e) => setQuery(e.target.value)}
+        />
+        <select value={shape} onChange={(e) => setShape(e.target.value)}>
+          <option value="">All shapes</option>
+          {facets.shapes.map(facet => (
+            <option key={facet.value} value={facet.value}>{facet.value} ({facet.count})</option>
+          ))}
+        </select>
+        <select value={shopId} onChange={(e) => setShopId(e.target.value)}>
+          <option value="">All shops</option>
+          {facets.shops.map(facet => (
+            <option key={facet.shop_id} value={facet.shop_id}>{facet.shop_name} ({facet.count})</option>
+          ))}
+        </select>
+        <input
+          type="number"
+          min="0"
+          placeholder={facets.price.min != null ? `Min ₹${facets.price.min}` : 'Min ₹'}
+          value={minPrice}
+          onChange={(e) => setMinPrice(e.target.value)}
+        />
+        <input
+          type="number"
+          min="0"
+          placeholder={facets.price.max != null ? `Max ₹${facets.price.max}` : 'Max ₹'}
+          value={maxPrice}
+          onChange={(e) => setMaxPrice(e.target.value)}
+        />
+        <select value={sort} onChange={(e) => setSort(e.target.value)}>
+          <option value="relevance">Best match</option>
+          <option value="price_asc">Price: low to high</option>
+          <option value="price_desc">Price: high to low</option>
+          <option value="name">Name</option>
+        </select>
       </div>
+
+      {error && <div className="error"><p>{error}</p></div>}
+      {loading ? (
+        <p>Loading cakes...</p>
+      ) : (
+        <>
+          <p className="browse-result-count">{total} {total === 1 ? 'cake' : 'cakes'}</p>
+          <div className="cake-grid">
+            {cakes.length === 0 && <p>No cakes match your search.</p>}
+            {cakes.map(cake => (
+              <div key={cake.id} className="cake-card">
+                <div className="cake-image-placeholder">
+                  <span>🎂</span>
+                </div>
+                <div className="cake-card-content">
+                  <h3>{cake.name}</h3>
+                  <p className="shop-name">from <strong>{cake.shop_name}</strong></p>
+                  {/* --- FIX: Changed $ to ₹ --- */}
+                  <p className="base-price">Starts at ₹{cake.base_price.toFixed(2)}</p>
+                  <Link to={`/designer/${cake.id}`} className="design-link">
+                    Customize This Cake
+                  </Link>
+                </div>
+              </div>
+            ))}
+          </div>
+          {nextCursor && (
+            <button className="design-link load-more-btn" onClick={() => fetchCakes(nextCursor)}>
+              Load more
+            </button>
+          )}
+        </>
+      )}
     </div>
   );
 };
 
-export default BrowsePage;
\ No newline at end of file
+export default BrowsePage;
@@ -6,7 +6,7 @@ const ChatContext = createContext(null);
 const SOCKET_URL = 'http://127.0.0.1:5000';
 
 export const ChatProvider = ({ children }) => {
-  const { user } = useAuth();
+  const { user, token } = useAuth();
   const [socket, setSocket] = useState(null);
   const [conversations, setConversations] = useState({}); // Stores messages { shop_id: [msgs...], customer_id: [msgs...] }
   
@@ -19,11 +19,8 @@ export const ChatProvider = ({ children }) => {
       setSocket(newSocket);
 
       // Register the user with the socket server
-      newSocket.emit('register_user', {
-        user_id: user.id,
-        role: user.role,
-        shop_id: user.shop_id // Will be null for customers, set for shopkeepers
-      });
+      // The server reads user id, role and shop id from the signed token
+      newSocket.emit('register_user', { token });
 
       // Listen for incoming messages
       newSocket.on('receive_message', (messageData) => {
@@ -55,7 +52,7 @@ export const ChatProvider = ({ children }) => {
       setSocket(null);
       setConversations({});
     }
-  }, [user]);
+  }, [user, token]);
 
   // Function to send a message (Customer)
   const sendCustomerMessage = (message, shop_id) => {
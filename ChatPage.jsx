@@ -9,32 +9,69 @@ const ChatPage = () => {
   const { user } = useAuth();
   const [newMessage, setNewMessage] = useState('');
   
-  const [customerList, setCustomerList] = useState([]);
+  const [customerList, setCustomerList] = useState([]); // inbox threads, most recent first
+  const [nextCursor, setNextCursor] = useState(null);
   const [selectedCustomerId, setSelectedCustomerId] = useState(null);
   const [loading, setLoading] = useState(true);
   const messagesEndRef = useRef(null);
 
+  const fetchConversations = async (cursor = null) => {
+    try {
+      if (!cursor) setLoading(true);
+      const response = await apiClient.get('/shopkeeper/conversations', {
+        params: { cursor: cursor || undefined }
+      });
+      const { items, next_cursor } = response.data;
+      setCustomerList(prev => (cursor ? [...prev, ...items] : items));
+      setNextCursor(next_cursor);
+    } catch (err) {
+      console.error("Failed to fetch conversations", err);
+    } finally {
+      setLoading(false);
+    }
+  };
+
   useEffect(() => {
     if (user?.shop_id) {
-      const fetchConversations = async () => {
-        try {
-          setLoading(true);
-          const response = await apiClient.get('/shopkeeper/conversations', {
-            params: { shop_id: user.shop_id }
-          });
-          setCustomerList(response.data);
-        } catch (err) {
-          console.error("Failed to fetch conversations", err);
-        } finally {
-          setLoading(false);
-        }
-      };
       fetchConversations();
     }
   }, [user]);
 
+  const markRead = (customerId) => {
+    setCustomerList(prev => prev.map(c => (c.customer_id === customerId ? { ...c, unread: 0 } : c)));
+    apiClient.post(`/shopkeeper/chat/${customerId}/read`).catch(err => console.error("Failed to mark chat read", err));
+  };
+
+  // Keep the inbox order, previews and unread badges current as messages arrive
+  useEffect(() => {
+    if (!socket) return;
+    const handleMessage = (messageData) => {
+      const customerId = messageData.customer_id;
+      const isOpen = customerId === selectedCustomerId;
+      if (!customerList.some(c => c.customer_id === customerId)) {
+        fetchConversations(); // a thread we haven't loaded: reload the first page
+        return;
+      }
+      setCustomerList(prev => {
+        const thread = prev.find(c => c.customer_id === customerId);
+        if (!thread) return prev;
+        const updated = {
+          ...thread,
+          last_message: messageData.message,
+          last_sender_id: messageData.sender_id,
+          unread: isOpen ? 0 : (thread.unread || 0) + 1,
+        };
+        return [updated, ...prev.filter(c => c.customer_id !== customerId)];
+      });
+      if (isOpen) markRead(customerId);
+    };
+    socket.on('receive_message', handleMessage);
+    return () => socket.off('receive_message', handleMessage);
+  }, [socket, selectedCustomerId, customerList]);
+
   const selectCustomer = async (customerId) => {
     setSelectedCustomerId(customerId);
+    if (customerList.find(c => c.customer_id === customerId)?.unread) markRead(customerId);
     if (!conversations[customerId]) {
       try {
         const response = await apiClient.get(`/shopkeeper/chat/${customerId}`, {
@@ -42,7 +79,7 @@ const ChatPage = () => {
         });
         setConversations(prev => ({
           ...prev,
-          [customerId]: response.data
+          [customerId]: response.data.items
         }));
       } catch (err) {
         console.error("Failed to fetch chat history", err);
@@ -60,6 +97,12 @@ const ChatPage = () => {
     e.preventDefault();
     if (newMessage.trim() && selectedCustomerId) {
       sendShopkeeperMessage(newMessage, selectedCustomerId);
+      setCustomerList(prev => {
+        const thread = prev.find(c => c.customer_id === selectedCustomerId);
+        if (!thread) return prev;
+        const updated = { ...thread, last_message: newMessage, last_sender_id: user.id };
+        return [updated, ...prev.filter(c => c.customer_id !== selectedCustomerId)];
+      });
       setNewMessage('');
     }
   };
@@ -81,9 +124,22 @@ const ChatPage = () => {
               className={`customer-item ${selectedCustomerId === cust.customer_id ? 'active' : ''}`}
               onClick={() => selectCustomer(cust.customer_id)}
             >
-              {cust.customer_email}
+              <span className="customer-item-email">
+                {cust.customer_email}
+                {cust.unread > 0 && <span className="unread-badge">{cust.unread}</span>}
+              </span>
+              {cust.last_message && (
+                <span className="customer-item-preview">
+                  {cust.last_sender_id === user.id ? 'You: ' : ''}{cust.last_message}
+                </span>
+              )}
             </button>
           ))}
+          {nextCursor && (
+            <button className="customer-item" onClick={() => fetchConversations(nextCursor)}>
+              Load more
+            </button>
+          )}
         </div>
       </div>
       
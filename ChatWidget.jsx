@@ -11,6 +11,30 @@ const ChatWidget = ({ shopId }) => {
   const { user } = useAuth();
   const messages = conversations[shopId] || [];
   const messagesEndRef = useRef(null);
+  const [unread, setUnread] = useState(0); // shop messages not yet seen
+  const seenCount = useRef(messages.length);
+
+  useEffect(() => {
+    if (!user || !shopId) return;
+    apiClient.get(`/customer/chat/unread/${user.id}`)
+      .then(response => setUnread(response.data.unread[shopId] || 0))
+      .catch(err => console.error("Failed to fetch unread count", err));
+  }, [shopId, user?.id]);
+
+  // Opening the widget (or a message arriving while it's open) marks the thread read
+  useEffect(() => {
+    const latest = messages[messages.length - 1];
+    if (!isOpen) {
+      if (messages.length > seenCount.current && latest && latest.sender_id !== user?.id) {
+        setUnread(count => count + messages.length - seenCount.current);
+      }
+    } else if (unread > 0 || messages.length > seenCount.current) {
+      setUnread(0);
+      apiClient.post(`/customer/chat/${shopId}/${user.id}/read`, latest?.id ? { last_message_id: latest.id } : {})
+        .catch(() => {}); // no thread yet
+    }
+    seenCount.current = messages.length;
+  }, [isOpen, messages.length]);
 
   useEffect(() => {
     if (isOpen && messages.length === 0) {
@@ -20,7 +44,7 @@ const ChatWidget = ({ shopId }) => {
           const response = await apiClient.get(`/customer/chat/${shopId}/${user.id}`);
           setConversations(prev => ({
             ...prev,
-            [shopId]: response.data
+            [shopId]: response.data.items
           }));
         } catch (err) {
           console.error("Failed to fetch chat history", err);
@@ -78,6 +102,7 @@ const ChatWidget = ({ shopId }) => {
       )}
       <button onClick={() => setIsOpen(!isOpen)} className="chat-bubble-toggle">
         {isOpen ? 'Close' : 'Chat'}
+        {!isOpen && unread > 0 && <span className="chat-unread-badge">{unread}</span>}
       </button>
     </div>
   );
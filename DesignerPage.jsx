@@ -73,19 +73,12 @@ const DesignerPage = () => {
     else setCustomText('');
   };
 
-  const handleReviewOrder = () => {
+  const handleReviewOrder = async () => {
     if (!user) { alert("Please log in."); navigate('/login'); return; }
     
     const snapshot = canvasRef.current.takeSnapshot(); // --- Re-added snapshot ---
     
     const basePrice = cakeData.cake.base_price;
-    const sizeModifier = size === '1kg' ? 10 : size === '2kg' ? 20 : 0;
-    let decoPrice = 0;
-    if (topDecoration !== 'none') decoPrice += 3;
-    if (sideDecoration !== 'none') decoPrice += 4;
-    if (topping !== 'none') decoPrice += 2;
-    const finalPrice = basePrice + sizeModifier + decoPrice;
-    
     const orderItem = {
       cake_id: cakeData.cake.id,
       flavor: selectedFlavor.name,
@@ -93,13 +86,25 @@ const DesignerPage = () => {
       shape: shape,
       size: size,
       custom_text: customText,
-      price: finalPrice, 
       top_decoration: topDecorationStyles[topDecoration].name,
       side_decoration: sideDecorationStyles[sideDecoration].name,
       topping: toppingStyles[topping].name,
       basePrice: basePrice,
       occasion: occasion
     };
+
+    // --- The server prices the cake; the order is checked against the same prices ---
+    let finalPrice;
+    try {
+      const response = await apiClient.post('/customer/quote', { items: [orderItem] });
+      const quote = response.data.quotes[0];
+      if (quote.error) { alert(quote.error); return; }
+      finalPrice = quote.price;
+    } catch (err) {
+      alert('Could not price this cake. Please try again.');
+      return;
+    }
+    orderItem.price = finalPrice;
     
     setOrderSummary({ 
       orderItem, 
@@ -1,29 +1,37 @@
 import React, { useState, useEffect } from 'react';
 import { useAuth } from '../../context/AuthContext.jsx';
 import apiClient from '../../services/apiClient.js';
+import { useChat } from '../../context/ChatContext.jsx';
+import { ORDER_EVENT, applyOrderUpdate } from '../../services/orderEvents.js';
 import { Link } from 'react-router-dom';
 import './MyOrdersPage.css';
 import RatingModal from '../../components/reviews/RatingModal.jsx';
 
 const MyOrdersPage = () => {
   const [orders, setOrders] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null); // keyset cursor for the next page
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
   const { user } = useAuth();
+  const { socket } = useChat();
   
   const [isModalOpen, setIsModalOpen] = useState(false);
   const [selectedOrder, setSelectedOrder] = useState(null);
 
-  const fetchOrders = async () => {
+  const fetchOrders = async (cursor = null) => {
     if (!user) {
       setError("You must be logged in to view your orders.");
       setLoading(false);
       return;
     }
     try {
-      setLoading(true);
-      const response = await apiClient.get(`/customer/orders/${user.id}`);
-      setOrders(response.data);
+      if (!cursor) setLoading(true);
+      const response = await apiClient.get(`/customer/orders/${user.id}`, {
+        params: { cursor: cursor || undefined }
+      });
+      const { items, next_cursor } = response.data;
+      setOrders(prev => (cursor ? [...prev, ...items] : items));
+      setNextCursor(next_cursor);
     } catch (err) {
       setError("Failed to load orders. Please try again.");
     } finally {
@@ -34,6 +42,14 @@ const MyOrdersPage = () => {
   useEffect(() => {
     fetchOrders();
   }, [user]);
+
+  // Status changes and new orders arrive as socket events; no re-fetching
+  useEffect(() => {
+    if (!socket) return;
+    const handleOrderUpdate = (event) => setOrders(prev => applyOrderUpdate(prev, event));
+    socket.on(ORDER_EVENT, handleOrderUpdate);
+    return () => socket.off(ORDER_EVENT, handleOrderUpdate);
+  }, [socket]);
   
   const handleOpenModal = (order) => {
     setSelectedOrder(order);
@@ -112,6 +128,11 @@ const MyOrdersPage = () => {
             </tbody>
           </table>
         )}
+        {nextCursor && (
+          <button className="rate-order-btn load-more-btn" onClick={() => fetchOrders(nextCursor)}>
+            Load more
+          </button>
+        )}
         <Link to="/" className="home-link">Back to Browse</Link>
       </div>
     </>
@@ -46,7 +46,9 @@ const OrderDetailsModal = ({ order, onClose }) => {
           {/* --- Snapshot Image --- */}
           <div className="order-snapshot">
             <h4>Custom Design</h4>
-            <img src={orderItem.snapshot_image} alt="Cake Design" />
+            <a href={orderItem.snapshot_image} target="_blank" rel="noreferrer">
+              <img src={orderItem.snapshot_variants?.medium || orderItem.snapshot_image} alt="Cake Design" loading="lazy" />
+            </a>
           </div>
           
           {/* --- Customization List --- */}
@@ -2,12 +2,15 @@ import React, { useState, useEffect } from 'react';
 import { useParams, Link } from 'react-router-dom';
 import apiClient from '../../services/apiClient.js';
 import { useAuth } from '../../context/AuthContext.jsx';
+import { useChat } from '../../context/ChatContext.jsx';
+import { ORDER_EVENT } from '../../services/orderEvents.js';
 import './OrderReceiptPage.css';
 import ChatWidget from '../../components/chat/ChatWidget.jsx';
 
 const OrderReceiptPage = () => {
   const { orderId } = useParams();
   const { user } = useAuth();
+  const { socket } = useChat();
   const [order, setOrder] = useState(null);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
@@ -34,6 +37,18 @@ const OrderReceiptPage = () => {
     fetchOrder();
   }, [orderId, user]);
 
+  // Keep the status and rating live while the receipt is open
+  useEffect(() => {
+    if (!socket) return;
+    const handleOrderUpdate = (event) => {
+      const change = event.orders.find(changed => String(changed.id) === String(orderId));
+      if (!change || event.type === 'created') return;
+      setOrder(prev => (prev ? { ...prev, order: { ...prev.order, ...change } } : prev));
+    };
+    socket.on(ORDER_EVENT, handleOrderUpdate);
+    return () => socket.off(ORDER_EVENT, handleOrderUpdate);
+  }, [socket, orderId]);
+
   if (loading) return <div className="receipt-container">Loading receipt...</div>;
   if (error) return <div className="receipt-container error">{error}</div>;
   if (!order) return <div className="receipt-container">No order found.</div>;
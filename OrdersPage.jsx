@@ -1,28 +1,50 @@
 import React, { useState, useEffect } from 'react';
 import apiClient from '../../services/apiClient.js';
 import { useAuth } from '../../context/AuthContext.jsx';
+import { useChat } from '../../context/ChatContext.jsx';
+import { ORDER_EVENT, applyOrderUpdate } from '../../services/orderEvents.js';
 import './OrdersPage.css';
 import OrderDetailsModal from '../../components/admin/OrderDetailsModal.jsx'; // 1. Import modal
 
+// Mirrors backend order_status.py: the statuses an order can move to next
+const NEXT_STATUSES = {
+  'Pending': ['Baking', 'Cancelled'],
+  'Baking': ['Out for delivery', 'Cancelled'],
+  'Out for delivery': ['Delivered'],
+  'Delivered': [],
+  'Cancelled': [],
+};
+const BULK_ACTIONS = [
+  { status: 'Baking', label: 'Start baking' },
+  { status: 'Out for delivery', label: 'Out for delivery' },
+  { status: 'Delivered', label: 'Mark delivered' },
+];
+
 const OrdersPage = () => {
   const [orders, setOrders] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null); // keyset cursor for the next page
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
+  const [selectedIds, setSelectedIds] = useState([]); // orders ticked for a bulk status change
+  const [bulkMessage, setBulkMessage] = useState(null);
   const { user } = useAuth();
+  const { socket } = useChat();
   
   // --- 2. State for modal ---
   const [isModalOpen, setIsModalOpen] = useState(false);
   const [selectedOrder, setSelectedOrder] = useState(null);
 
-  const fetchOrders = async () => {
+  const fetchOrders = async (cursor = null) => {
     if (!user?.shop_id) return; 
     
     try {
-      setLoading(true);
+      if (!cursor) setLoading(true);
       const response = await apiClient.get('/shopkeeper/orders', {
-        params: { shop_id: user.shop_id }
+        params: { shop_id: user.shop_id, cursor: cursor || undefined }
       });
-      setOrders(response.data);
+      const { items, next_cursor } = response.data;
+      setOrders(prev => (cursor ? [...prev, ...items] : items));
+      setNextCursor(next_cursor);
       setError(null);
     } catch (err) {
       console.error("Error fetching orders:", err);
@@ -36,16 +58,51 @@ const OrdersPage = () => {
     fetchOrders();
   }, [user]); 
 
+  // New orders, status changes and ratings are pushed to the shop's room
+  useEffect(() => {
+    if (!socket) return;
+    const handleOrderUpdate = (event) => setOrders(prev => applyOrderUpdate(prev, event));
+    socket.on(ORDER_EVENT, handleOrderUpdate);
+    return () => socket.off(ORDER_EVENT, handleOrderUpdate);
+  }, [socket]);
+
   const handleStatusChange = async (orderId, newStatus) => {
     try {
       await apiClient.post(`/shopkeeper/orders/${orderId}/status`, { 
         status: newStatus,
         shop_id: user.shop_id 
       });
-      fetchOrders(); 
+      setOrders(prev => applyOrderUpdate(prev, { type: 'status', orders: [{ id: orderId, status: newStatus }] }));
     } catch (err) {
       console.error("Error updating status:", err);
-      alert("Failed to update status.");
+      alert(err.response?.data?.error || "Failed to update status.");
+    }
+  };
+
+  const toggleSelected = (orderId) => {
+    setSelectedIds(prev => (prev.includes(orderId) ? prev.filter(id => id !== orderId) : [...prev, orderId]));
+  };
+
+  // One request for every ticked order; the server checks each transition on its own
+  const handleBulkStatus = async (newStatus) => {
+    if (selectedIds.length === 0) return;
+    try {
+      const response = await apiClient.post('/shopkeeper/orders/status', {
+        updates: selectedIds.map(id => ({ order_id: id, status: newStatus }))
+      });
+      const { results, updated } = response.data;
+      const failed = results.filter(result => !result.ok);
+      setBulkMessage(failed.length
+        ? `${updated} updated, ${failed.length} skipped: ${failed.map(result => `#${result.order_id} (${result.error})`).join('; ')}`
+        : `${updated} orders moved to ${newStatus}.`);
+      setSelectedIds([]);
+      setOrders(prev => applyOrderUpdate(prev, {
+        type: 'status',
+        orders: results.filter(result => result.ok).map(result => ({ id: result.order_id, status: result.status }))
+      }));
+    } catch (err) {
+      console.error("Error updating statuses:", err);
+      setBulkMessage(err.response?.data?.error || "Failed to update statuses.");
     }
   };
   
@@ -74,6 +131,23 @@ const OrdersPage = () => {
 
       <div className="admin-orders-page">
         <h1 className="page-title">Manage All Orders</h1>
+
+        {orders.length > 0 && (
+          <div className="bulk-actions">
+            <span>{selectedIds.length} selected</span>
+            {BULK_ACTIONS.map(action => (
+              <button
+                key={action.status}
+                className="btn-view-order"
+                disabled={selectedIds.length === 0}
+                onClick={() => handleBulkStatus(action.status)}
+              >
+                {action.label}
+              </button>
+            ))}
+            {bulkMessage && <span className="bulk-message">{bulkMessage}</span>}
+          </div>
+        )}
         
         {orders.length === 0 ? (
           <p>You have no orders yet.</p>
@@ -82,6 +156,7 @@ const OrdersPage = () => {
             <table className="orders-table">
               <thead>
                 <tr>
+                  <th></th>
                   <th>Order ID</th>
                   <th>Customer Email</th>
                   <th>Date</th>
@@ -93,6 +168,13 @@ const OrdersPage = () => {
               <tbody>
                 {orders.map(order => (
                   <tr key={order.id}>
+                    <td>
+                      <input
+                        type="checkbox"
+                        checked={selectedIds.includes(order.id)}
+                        onChange={() => toggleSelected(order.id)}
+                      />
+                    </td>
                     <td>#{order.id}</td>
                     <td>{order.customer_email}</td>
                     <td>{new Date(order.created_at).toLocaleString()}</td>
@@ -103,12 +185,12 @@ const OrdersPage = () => {
                         value={order.status}
                         onChange={(e) => handleStatusChange(order.id, e.target.value)}
                         className="status-select"
+                        disabled={(NEXT_STATUSES[order.status] || []).length === 0}
                       >
-                        <option value="Pending">Pending</option>
-                        <option value="Accepted">Accepted</option>
-                        <option value="In Progress">In Progress</option>
-                        <option value="Delivered">Delivered</option>
-                        <option value="Rejected">Rejected</option>
+                        <option value={order.status}>{order.status}</option>
+                        {(NEXT_STATUSES[order.status] || []).map(status => (
+                          <option key={status} value={status}>{status}</option>
+                        ))}
                       </select>
                       {/* --- 5. New "View" Button --- */}
                       <button 
@@ -122,6 +204,11 @@ const OrdersPage = () => {
                 ))}
               </tbody>
             </table>
+            {nextCursor && (
+              <button className="btn-view-order load-more-btn" onClick={() => fetchOrders(nextCursor)}>
+                Load more
+              </button>
+            )}
           </div>
         )}
       </div>
@@ -43,7 +43,9 @@ const PaymentPage = () => {
       navigate(`/order/${response.data.orderId}`); 
     } catch (error) {
       console.error("Failed to submit order:", error);
-      alert("There was an error placing your order. Please try again.");
+      // 409 means our prices differ from the server's (e.g. the shop changed them)
+      const message = error.response?.data?.error;
+      alert(message || "There was an error placing your order. Please try again.");
     } finally {
       setIsSubmitting(false);
     }
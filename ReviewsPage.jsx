@@ -30,7 +30,7 @@ const ReviewsPage = () => {
           const response = await apiClient.get('/shopkeeper/reviews', {
             params: { shop_id: user.shop_id }
           });
-          setReviews(response.data);
+          setReviews(response.data.items);
         } catch (err) {
           setError('Failed to load reviews.');
         } finally {
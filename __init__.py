@@ -1,11 +1,13 @@
-from flask import Flask, jsonify
+from flask import Flask, jsonify, request
 from flask_cors import CORS
 from flask_bcrypt import Bcrypt
+from flask_socketio import SocketIO
 from ..config import Config
 
 # Initialize extensions
 bcrypt = Bcrypt()
 cors = CORS()
+socketio = SocketIO()
 
 def create_app(config_class=Config):
     # __name__ points to the current Python module
@@ -15,30 +17,89 @@ def create_app(config_class=Config):
     # Load configuration from the Config object
     app.config.from_object(config_class)
 
+    # jsonify() through the fast encoder (orjson when installed)
+    from .serialization import FastJSONProvider
+    app.json = FastJSONProvider(app)
+
     # Initialize extensions with the app
     bcrypt.init_app(app)
     # Configure CORS to allow requests from your React frontend (Vite's default port is 5173)
     cors.init_app(app, resources={r"/api/*": {"origins": "http://localhost:5173"}})
+    # The async mode (eventlet in run.py) is picked up automatically
+    socketio.init_app(app, cors_allowed_origins="http://localhost:5173")
 
     # --- Initialize Database ---
     # Import the db module and register it with the app
-    from . import db
+    from . import db, blobstore, derivatives, catalog_cache, chat_journal, bus, pricing, hashing, tokens, http_cache, metrics, sqltrace
     db.init_app(app)
+    sqltrace.init_app(app)
+    # Before http_cache, so response sizes are measured after compression.
+    # collect_stats is defined below, next to /api/stats.
+    metrics.init_app(app, stats_source=lambda: collect_stats())
+    hashing.init_app(app, bcrypt)
+    tokens.init_app(app)
+    http_cache.init_app(app)
+    blobstore.init_app(app)
+    derivatives.init_app(app)
+    bus.init_app(app, socketio)
+    catalog_cache.init_app(app)
+    pricing.init_app(app)
+    chat_journal.init_app(app, socketio)
     # ---------------------------
 
     # --- Register Blueprints (Routes) ---
     
     # Import your route blueprints
-    from . import auth, customer, shopkeeper
+    from . import auth, customer, shopkeeper, media
     
     # Register them with the app, adding a URL prefix
     app.register_blueprint(auth.bp, url_prefix='/api/auth')
     app.register_blueprint(customer.bp, url_prefix='/api/customer')
     app.register_blueprint(shopkeeper.bp, url_prefix='/api/shopkeeper')
+    app.register_blueprint(media.bp, url_prefix='/api/media')
+
+    # Importing the module registers the Socket.IO event handlers
+    from . import chat_events
     
     # A simple test route to make sure the app is working
     @app.route('/api/hello')
     def hello():
         return jsonify(message="Hello from CakeMosaic API!")
 
+    # Internal counters for the connection pools and caches (also exported
+    # as gauges on /metrics); like /metrics, only served to local clients
+    def collect_stats():
+        return dict(
+            db_pools=db.pool_stats(),
+            catalog_cache=app.extensions['catalog_cache'].stats(),
+            pricing=app.extensions['pricing'].stats(),
+            derivatives=app.extensions['derivatives'].stats(),
+            password_hasher=app.extensions['password_hasher'].stats(),
+            tokens=app.extensions['token_signer'].stats(),
+            http_cache=app.extensions['http_cache'].stats(),
+            chat_journal=app.extensions['chat_journal'].stats(),
+            bus=app.extensions['bus'].stats()
+        )
+
+    @app.route('/api/stats')
+    @metrics.internal_only
+    def stats():
+        stats = collect_stats()
+        if sqltrace.get_sql_tracer() is not None:
+            stats['sql_trace'] = sqltrace.get_sql_tracer().stats()
+        return jsonify(**stats)
+
+    # Heaviest SQL fingerprints (only with DB_TRACE=1): ?sort=total|mean|max|calls&limit=N
+    @app.route('/api/stats/sql')
+    @metrics.internal_only
+    def sql_stats():
+        tracer = sqltrace.get_sql_tracer()
+        if tracer is None:
+            return jsonify(error="SQL tracing is off; start the server with DB_TRACE=1"), 404
+        sort = request.args.get('sort', 'total')
+        if sort not in sqltrace.SORTS:
+            return jsonify(error=f"sort must be one of: {', '.join(sqltrace.SORTS)}"), 400
+        limit = request.args.get('limit', type=int)
+        return jsonify(stats=tracer.stats(), top=tracer.top(limit, sort))
+
     return app
\ No newline at end of file
@@ -8,4 +8,13 @@ const apiClient = axios.create({
   },
 });
 
+// Send the signed session token from login with every request
+apiClient.interceptors.request.use((config) => {
+  const token = localStorage.getItem('authToken');
+  if (token) {
+    config.headers.Authorization = `Bearer ${token}`;
+  }
+  return config;
+});
+
 export default apiClient;
\ No newline at end of file
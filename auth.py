@@ -1,6 +1,8 @@
 from flask import Blueprint, jsonify, request
-from app.models import create_user, get_user_by_email
-from app import bcrypt
+from app.models import create_user, get_user_by_email, update_password_hash
+from app.db import close_db
+from app.hashing import get_hasher, HasherBusyError
+from app.tokens import issue_token
 import sqlite3
 
 bp = Blueprint('auth', __name__)
@@ -20,9 +22,7 @@ def register():
     if role == 'shopkeeper' and not shop_name:
         return jsonify(error="Shop name is required for shopkeepers"), 400
 
-    if get_user_by_email(email):
-        return jsonify(error="Email already registered"), 409
-
+    # No lookup first: the UNIQUE constraint on email rejects duplicates
     try:
         user_id = create_user(email, password, role, shop_name)
         
@@ -33,6 +33,8 @@ def register():
             
     except sqlite3.IntegrityError:
         return jsonify(error="Email already registered"), 409
+    except HasherBusyError as e:
+        return jsonify(error=str(e)), 503, {'Retry-After': '1'}
     except Exception as e:
         return jsonify(error=str(e)), 500
 
@@ -46,12 +48,23 @@ def login():
     password = data['password']
     
     user = get_user_by_email(email) # This function now fetches shop_name too
-    
-    if user and bcrypt.check_password_hash(user['password_hash'], password):
+    # Don't hold a pooled connection while bcrypt runs
+    close_db()
+
+    hasher = get_hasher()
+    try:
+        verified = user is not None and hasher.verify(user['password_hash'], password)
+        if verified and hasher.needs_rehash(user['password_hash']):
+            # BCRYPT_LOG_ROUNDS changed since this hash was made
+            update_password_hash(user['id'], hasher.hash(password))
+    except HasherBusyError as e:
+        return jsonify(error=str(e)), 503, {'Retry-After': '1'}
+
+    if verified:
         # Return all user data, including the new shop_name
         return jsonify(
             message="Login successful",
-            token="YOUR_JWT_TOKEN_HERE",
+            token=issue_token(user),
             user={
                 'id': user['id'], 
                 'email': user['email'], 
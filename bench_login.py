@@ -0,0 +1,101 @@
+"""
+Login throughput benchmark.
+
+Hammers POST /api/auth/login from several threads against a running server
+(python run.py) while a probe thread requests /api/hello every few
+milliseconds. With bcrypt on the event loop the probe's latency climbs to
+the hash time; with the hashing pool it should stay in the low
+milliseconds while logins proceed.
+
+    python bench_login.py --url http://127.0.0.1:5000 --concurrency 16 --duration 10
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+
+def post_json(url, payload):
+    request = urllib.request.Request(
+        url, data=json.dumps(payload).encode('utf-8'),
+        headers={'Content-Type': 'application/json'}, method='POST'
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+def summarize(name, latencies_ms):
+    print(f"  {name:<8} n={len(latencies_ms):<6} "
+          f"p50={percentile(latencies_ms, 50):8.1f} ms  p95={percentile(latencies_ms, 95):8.1f} ms  "
+          f"p99={percentile(latencies_ms, 99):8.1f} ms  max={max(latencies_ms, default=0):8.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--probe-interval', type=float, default=0.01,
+                        help="seconds between event-loop probes")
+    args = parser.parse_args()
+
+    email = f"bench-{uuid.uuid4().hex[:12]}@example.com"
+    password = 'bench-password'
+    status = post_json(f"{args.url}/api/auth/register", {'email': email, 'password': password})
+    if status != 201:
+        raise SystemExit(f"Could not register the benchmark user (HTTP {status})")
+
+    stop = threading.Event()
+    lock = threading.Lock()
+    login_ms, probe_ms, statuses = [], [], {}
+
+    def login_worker():
+        while not stop.is_set():
+            started = time.perf_counter()
+            code = post_json(f"{args.url}/api/auth/login", {'email': email, 'password': password})
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                statuses[code] = statuses.get(code, 0) + 1
+                if code == 200:
+                    login_ms.append(elapsed)
+
+    def probe_worker():
+        while not stop.is_set():
+            started = time.perf_counter()
+            with urllib.request.urlopen(f"{args.url}/api/hello", timeout=30) as response:
+                response.read()
+            probe_ms.append((time.perf_counter() - started) * 1000)
+            time.sleep(args.probe_interval)
+
+    threads = [threading.Thread(target=login_worker) for _ in range(args.concurrency)]
+    threads.append(threading.Thread(target=probe_worker))
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    print(f"{args.concurrency} login clients for {elapsed:.1f} s against {args.url}")
+    print(f"  logins/s {len(login_ms) / elapsed:.1f}   responses {dict(sorted(statuses.items()))}")
+    summarize('login', login_ms)
+    summarize('probe', probe_ms)
+    if probe_ms:
+        print(f"  probe mean {statistics.mean(probe_ms):.1f} ms -- the event loop's responsiveness under load")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Serialization micro-benchmark.
+
+Builds an in-memory order table and times one page of a keyset listing
+through the old path (fetchall -> list of dicts -> Flask's JSON provider)
+and through serialization.encode_page (cursor -> bytes). The outputs are
+checked to decode to the same data.
+
+    python bench_serialization.py --rows 200 --repeat 300
+"""
+import argparse
+import json
+import random
+import sqlite3
+import time
+from flask import Flask
+from app import serialization
+from app.pagination import make_page
+
+QUERY = """
+SELECT o.id, o.status, o.total_price, o.created_at, o.rating, u.email AS customer_email
+FROM orders o JOIN users u ON o.customer_id = u.id
+WHERE o.shop_id = 1 ORDER BY o.created_at DESC, o.id DESC LIMIT ?
+"""
+
+def build_database(rows):
+    connection = sqlite3.connect(':memory:')
+    connection.row_factory = sqlite3.Row
+    connection.executescript("""
+        CREATE TABLE users (id INTEGER PRIMARY KEY, email TEXT);
+        CREATE TABLE orders (id INTEGER PRIMARY KEY, customer_id INTEGER, shop_id INTEGER,
+                             status TEXT, total_price REAL, created_at TEXT, rating INTEGER);
+        CREATE INDEX idx_orders_shop_created ON orders (shop_id, created_at);
+    """)
+    rng = random.Random(42)
+    connection.executemany("INSERT INTO users VALUES (?, ?)", [(i, f"customer{i}@example.com") for i in range(1, 501)])
+    connection.executemany(
+        "INSERT INTO orders VALUES (?, ?, 1, ?, ?, ?, ?)",
+        [(i, rng.randint(1, 500), rng.choice(['Pending', 'Baking', 'Delivered']),
+          round(rng.uniform(300, 3000), 2), f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} 12:00:00",
+          rng.choice([None, 3, 4, 5])) for i in range(1, rows * 2 + 1)]
+    )
+    return connection
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1e6)
+    samples.sort()
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.95)]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rows', type=int, default=200, help="page size")
+    parser.add_argument('--repeat', type=int, default=300)
+    args = parser.parse_args()
+
+    connection = build_database(args.rows)
+    flask_json = Flask('bench').json  # Flask's default provider
+
+    def old_path():
+        rows = connection.execute(QUERY, (args.rows + 1,)).fetchall()
+        return flask_json.dumps(make_page(rows, args.rows)).encode('utf-8')
+
+    def new_path():
+        return serialization.encode_page(connection.execute(QUERY, (args.rows + 1,)), args.rows)
+
+    if json.loads(old_path()) != json.loads(new_path()):
+        raise SystemExit("encode_page output differs from the dict path")
+
+    backend = 'orjson' if serialization.orjson is not None else 'stdlib json'
+    print(f"One page of {args.rows} order rows, {args.repeat} runs (encoder: {backend})")
+    old = timed(old_path, args.repeat)
+    new = timed(new_path, args.repeat)
+    print(f"  fetchall + dicts + jsonify   p50 {old[0]:9.1f} us   p95 {old[1]:9.1f} us")
+    print(f"  encode_page (cursor->bytes)  p50 {new[0]:9.1f} us   p95 {new[1]:9.1f} us")
+    print(f"  speedup at p50: {old[0] / new[0]:.2f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,385 @@
+"""
+Model and route benchmark suite.
+
+Times the read functions in models.py and the blueprint routes against a
+database built by seed.py. Routes go through the Flask test client, so
+routing, token checks, serialization and compression are included. Each
+case reports p50/p95/p99. A run can be saved as a baseline, and later runs
+compared against it: a case more than --threshold slower at --metric (p50
+by default; tail percentiles of short runs are noisy) makes the run exit
+non-zero.
+
+    python seed.py --scale medium
+    python bench_suite.py --save-baseline bench-baseline.json
+    python bench_suite.py --compare bench-baseline.json
+    python bench_suite.py --only shopkeeper --repeat 200 --writes
+
+With --writes the write paths are timed too. They run on a scratch copy
+of the database, so the seeded data never changes between runs.
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from app import create_app
+from app import models
+from app.config import Config
+from app.db import close_pools
+from app.order_status import PENDING, BAKING
+from app.pagination import decode_cursor
+from app.pricing import DELIVERY_FEE
+from app.search import match_query
+from seed import DEFAULT_DB, manifest_path, blob_store_path
+
+# Login (bcrypt) and full-history exports are orders of magnitude slower;
+# don't spend the whole run on them
+SLOW_CASE_REPEAT = 10
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+class Case:
+    def __init__(self, name, run, repeat=None, limit=None):
+        self.name = name
+        self.run = run  # called with the iteration number, returns the seconds taken
+        self.repeat = repeat
+        self.limit = limit  # iterations available, for cases that use up fixture rows
+
+
+def consume(result):
+    """Exhausts cursors and generators so lazily evaluated queries are timed in full."""
+    if isinstance(result, sqlite3.Cursor) or hasattr(result, '__next__'):
+        return sum(1 for _ in result)
+    return result
+
+
+class Fixtures:
+    """Ids picked from the seeded data: the busiest shop, customer and chat thread."""
+
+    def __init__(self, db_path, password):
+        connection = sqlite3.connect(db_path)
+        try:
+            self.shop_id, = connection.execute(
+                "SELECT shop_id FROM shop_status_counts GROUP BY shop_id ORDER BY SUM(orders_count) DESC, shop_id LIMIT 1"
+            ).fetchone()
+            self.owner_id, = connection.execute("SELECT owner_id FROM shops WHERE id = ?", (self.shop_id,)).fetchone()
+            self.customer_id, self.customer_email = connection.execute(
+                "SELECT o.customer_id, u.email FROM orders o JOIN users u ON u.id = o.customer_id"
+                " WHERE o.shop_id = ? GROUP BY o.customer_id ORDER BY COUNT(*) DESC, o.customer_id LIMIT 1",
+                (self.shop_id,)
+            ).fetchone()
+            self.order_id, = connection.execute(
+                "SELECT MAX(id) FROM orders WHERE customer_id = ? AND shop_id = ?", (self.customer_id, self.shop_id)
+            ).fetchone()
+            self.chat_customer_id, = connection.execute(
+                "SELECT customer_id FROM chat_messages WHERE shop_id = ?"
+                " GROUP BY customer_id ORDER BY COUNT(*) DESC, customer_id LIMIT 1",
+                (self.shop_id,)
+            ).fetchone()
+            self.cake_id, self.cake_name, self.base_price, self.shape = connection.execute(
+                "SELECT id, name, base_price, shape FROM cakes WHERE shop_id = ? ORDER BY id LIMIT 1", (self.shop_id,)
+            ).fetchone()
+            self.flavor, self.flavor_color, self.flavor_price = connection.execute(
+                "SELECT name, color_hex, price_modifier FROM flavors WHERE cake_id = ? ORDER BY id LIMIT 1", (self.cake_id,)
+            ).fetchone()
+            self.snapshot_ref, = connection.execute(
+                "SELECT snapshot_ref FROM order_items WHERE snapshot_ref IS NOT NULL ORDER BY id LIMIT 1"
+            ).fetchone() or (None,)
+            # Write cases move these to Baking one per iteration
+            self.pending_orders = [row[0] for row in connection.execute(
+                "SELECT id FROM orders WHERE shop_id = ? AND status = ? ORDER BY id", (self.shop_id, PENDING)
+            )]
+        finally:
+            connection.close()
+        self.password = password
+
+    def order_item(self):
+        return {
+            "cake_id": self.cake_id, "flavor": self.flavor, "size": "1kg", "shape": self.shape,
+            "coating": "Dark Choco", "top_decoration": "None", "side_decoration": "None", "topping": "None",
+            "custom_text": "Benchmark",
+        }
+
+    def order_total(self):
+        return round(self.base_price + self.flavor_price + 10.0 + DELIVERY_FEE, 2)
+
+
+def model_cases(app, fx):
+    """Read cases for every read path in models.py, and write cases for the main write paths."""
+    first_page = {}
+
+    def page_two(function, *args):
+        # Page 2 of a keyset listing, with the cursor from page 1
+        def run():
+            if function not in first_page:
+                first_page[function] = getattr(models, function)(*args)['next_cursor']
+            cursor = first_page[function]
+            return getattr(models, function)(*args, after=decode_cursor(cursor) if cursor else None)
+        return run
+
+    def call(function, *args, **kwargs):
+        return lambda: getattr(models, function)(*args, **kwargs)
+
+    reads = [
+        ('get_user_by_email', call('get_user_by_email', fx.customer_email)),
+        ('get_user_by_id', call('get_user_by_id', fx.customer_id)),
+        ('load_catalog(shop)', call('load_catalog', fx.shop_id)),
+        ('get_all_cakes', call('get_all_cakes')),
+        ('get_all_cakes(flavors)', call('get_all_cakes', True)),
+        ('search_cakes(text)', call('search_cakes', match_query('choc'))),
+        ('search_cakes(filters)', call('search_cakes', None, ['circle'], [], 500.0, 1500.0, 'price_asc')),
+        ('get_cake_details', call('get_cake_details', fx.cake_id)),
+        ('get_orders_by_customer', call('get_orders_by_customer', fx.customer_id)),
+        ('get_orders_by_customer(page 2)', page_two('get_orders_by_customer', fx.customer_id)),
+        ('get_all_shop_orders', call('get_all_shop_orders', fx.shop_id)),
+        ('get_all_shop_orders(page 2)', page_two('get_all_shop_orders', fx.shop_id)),
+        ('get_all_shop_orders(status)', call('get_all_shop_orders', fx.shop_id, status=BAKING)),
+        ('get_order_details', call('get_order_details', fx.order_id, fx.customer_id)),
+        ('get_order_version', call('get_order_version', fx.order_id, fx.customer_id)),
+        ('get_shop_order_details', call('get_shop_order_details', fx.order_id, fx.shop_id)),
+        ('get_all_cakes_with_flavors', call('get_all_cakes_with_flavors', fx.shop_id)),
+        ('get_analytics_data', call('get_analytics_data', fx.shop_id)),
+        ('get_chat_history', call('get_chat_history', fx.shop_id, fx.chat_customer_id)),
+        ('get_shop_inbox', call('get_shop_inbox', fx.shop_id)),
+        ('get_customer_unread_counts', call('get_customer_unread_counts', fx.chat_customer_id)),
+        ('get_shop_reviews', call('get_shop_reviews', fx.shop_id)),
+        ('get_shop_reviews(page 2)', page_two('get_shop_reviews', fx.shop_id)),
+        ('get_catalog_export_rows', call('get_catalog_export_rows', fx.shop_id)),
+        ('get_order_export_rows', call('get_order_export_rows', fx.shop_id)),
+        ('get_review_export_rows', call('get_review_export_rows', fx.shop_id)),
+    ]
+    writes = [
+        ('create_order', lambda i: models.create_order(
+            fx.customer_id, fx.order_total(), [dict(fx.order_item(), price=fx.order_total() - DELIVERY_FEE)], fx.shop_id)),
+        ('update_order_statuses', lambda i: models.update_order_statuses(
+            fx.shop_id, [(fx.pending_orders[i], BAKING)])),
+        ('save_chat_message', lambda i: models.save_chat_message(
+            fx.shop_id, fx.chat_customer_id, fx.chat_customer_id, f"Benchmark message {i}")),
+        ('mark_conversation_read', lambda i: models.mark_conversation_read(fx.shop_id, fx.chat_customer_id, 'shop')),
+        ('import_catalog_batch', lambda i: models.import_catalog_batch(fx.shop_id, [{
+            "name": fx.cake_name, "base_price": fx.base_price, "shape": fx.shape, "image_url": None, "image_ref": None,
+            "flavors": [{"name": fx.flavor, "color_hex": fx.flavor_color, "price_modifier": fx.flavor_price}],
+        }])),
+    ]
+
+    def in_request(method, run, takes_index):
+        # A request context per call, like a real request: pool checkout, teardown and all
+        def case(i):
+            with app.test_request_context(method=method):
+                started = time.perf_counter()
+                consume(run(i) if takes_index else run())
+                return time.perf_counter() - started
+        return case
+
+    cases = [
+        Case('models.' + name, in_request('GET', run, False), SLOW_CASE_REPEAT if name.endswith('_export_rows') else None)
+        for name, run in reads
+    ]
+    write_cases = [
+        Case('models.' + name, in_request('POST', run, True),
+             limit=len(fx.pending_orders) if name == 'update_order_statuses' else None)
+        for name, run in writes
+    ]
+    return cases, write_cases
+
+
+def route_cases(app, fx):
+    signer = app.extensions['token_signer']
+    with app.app_context():
+        customer = {"Authorization": "Bearer " + signer.issue(fx.customer_id, 'customer')}
+        shopkeeper = {"Authorization": "Bearer " + signer.issue(fx.owner_id, 'shopkeeper', fx.shop_id)}
+    client = app.test_client()
+    browser = {"Accept-Encoding": "gzip"}
+
+    def request(method, path, headers=None, json_body=None, expect=(200,)):
+        def case(i):
+            body = json_body(i) if callable(json_body) else json_body
+            started = time.perf_counter()
+            response = client.open(path, method=method, headers={**browser, **(headers or {})}, json=body)
+            # Streamed responses (exports) are only done once the body is read
+            response.get_data()
+            elapsed = time.perf_counter() - started
+            if response.status_code not in expect:
+                raise RuntimeError(f"{method} {path} returned {response.status_code}: {response.get_data(as_text=True)[:200]}")
+            return elapsed
+        return case
+
+    c, s, o = fx.customer_id, fx.shop_id, fx.order_id
+    quote_item = dict(fx.order_item(), addOns=[])
+    reads = [
+        ('auth.login', request('POST', '/api/auth/login', json_body={"email": fx.customer_email, "password": fx.password}),
+         SLOW_CASE_REPEAT),
+        ('customer.cakes', request('GET', '/api/customer/cakes')),
+        ('customer.cakes/search', request('GET', '/api/customer/cakes/search?q=choc&sort=price_asc')),
+        ('customer.cakes/<id>', request('GET', f'/api/customer/cakes/{fx.cake_id}')),
+        ('customer.quote', request('POST', '/api/customer/quote', json_body={"items": [quote_item] * 3})),
+        ('customer.orders/<customer>', request('GET', f'/api/customer/orders/{c}', customer)),
+        ('customer.order/<id>', request('GET', f'/api/customer/order/{o}/{c}', customer)),
+        ('customer.chat/<shop>/<customer>', request('GET', f'/api/customer/chat/{s}/{c}', customer)),
+        ('customer.chat/unread', request('GET', f'/api/customer/chat/unread/{c}', customer)),
+        ('shopkeeper.orders', request('GET', '/api/shopkeeper/orders', shopkeeper)),
+        ('shopkeeper.orders?status', request('GET', f'/api/shopkeeper/orders?status={BAKING}', shopkeeper)),
+        ('shopkeeper.order/<id>', request('GET', f'/api/shopkeeper/order/{o}', shopkeeper)),
+        ('shopkeeper.analytics', request('GET', '/api/shopkeeper/analytics', shopkeeper)),
+        ('shopkeeper.reviews', request('GET', '/api/shopkeeper/reviews', shopkeeper)),
+        ('shopkeeper.all-products', request('GET', '/api/shopkeeper/all-products', shopkeeper)),
+        ('shopkeeper.conversations', request('GET', '/api/shopkeeper/conversations', shopkeeper)),
+        ('shopkeeper.chat/<customer>', request('GET', f'/api/shopkeeper/chat/{fx.chat_customer_id}', shopkeeper)),
+        ('shopkeeper.orders/export', request('GET', '/api/shopkeeper/orders/export?format=csv', shopkeeper),
+         SLOW_CASE_REPEAT),
+        ('shopkeeper.reviews/export', request('GET', '/api/shopkeeper/reviews/export?format=ndjson', shopkeeper),
+         SLOW_CASE_REPEAT),
+        ('shopkeeper.catalog/export', request('GET', '/api/shopkeeper/catalog/export?format=csv', shopkeeper)),
+    ]
+    if fx.snapshot_ref:
+        reads.append(('media.blobs/<ref>', request('GET', f'/api/media/blobs/{fx.snapshot_ref}')))
+    writes = [
+        ('customer.orders POST', request('POST', '/api/customer/orders', customer, expect=(201,), json_body={
+            "shop_id": s, "total_price": fx.order_total(), "items": [fx.order_item()]})),
+        ('shopkeeper.chat/<customer>/read', request('POST', f'/api/shopkeeper/chat/{fx.chat_customer_id}/read', shopkeeper)),
+    ]
+    cases = [Case('route.' + name, run, *repeat) for name, run, *repeat in reads]
+    return cases, [Case('route.' + name, run) for name, run in writes]
+
+
+def run_case(case, repeat, warmup):
+    repeat = case.repeat or repeat
+    warmup = min(warmup, repeat)
+    if case.limit is not None:
+        repeat = min(repeat, case.limit - warmup)
+        if repeat <= 0:
+            return None
+    for i in range(warmup):
+        case.run(i)
+    samples = [case.run(warmup + i) * 1000 for i in range(repeat)]
+    return {
+        "n": len(samples),
+        "p50": percentile(samples, 50),
+        "p95": percentile(samples, 95),
+        "p99": percentile(samples, 99),
+        "mean": statistics.mean(samples),
+        "min": min(samples),
+    }
+
+def compare(results, baseline, metric, threshold, min_delta_ms):
+    """Prints the change against the baseline; returns the names of regressed cases."""
+    regressions = []
+    print(f"\n{'case':<44} {'p50 base':>9} {'p50 now':>9} {'p95 base':>9} {'p95 now':>9}  change ({metric})")
+    for name, now in results.items():
+        base = baseline['cases'].get(name)
+        if base is None:
+            print(f"{name:<44} {'':>9} {now['p50']:9.3f} {'':>9} {now['p95']:9.3f}  new")
+            continue
+        ratio = now[metric] / base[metric] if base[metric] else 1.0
+        regressed = ratio > 1 + threshold and now[metric] - base[metric] > min_delta_ms
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<44} {base['p50']:9.3f} {now['p50']:9.3f} {base['p95']:9.3f} {now['p95']:9.3f}  "
+              f"{(ratio - 1) * 100:+6.1f}%{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--db', default=DEFAULT_DB, help="database built by seed.py")
+    parser.add_argument('--repeat', type=int, default=100)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--only', action='append', default=[],
+                        help="run only cases whose name contains this (repeatable)")
+    parser.add_argument('--writes', action='store_true', help="also time write paths (on a scratch copy)")
+    parser.add_argument('--save-baseline', metavar='FILE', help="write the results as a baseline")
+    parser.add_argument('--compare', metavar='FILE', help="compare against a saved baseline")
+    parser.add_argument('--metric', choices=('p50', 'p95', 'p99', 'mean'), default='p50',
+                        help="statistic compared against the baseline")
+    parser.add_argument('--threshold', type=float, default=0.2, help="allowed slowdown (0.2 = 20%%)")
+    parser.add_argument('--min-delta-ms', type=float, default=0.1,
+                        help="ignore changes smaller than this, which are noise")
+    args = parser.parse_args()
+
+    db_path = os.path.abspath(args.db)
+    if not os.path.exists(manifest_path(db_path)):
+        raise SystemExit(f"No seeded database at {db_path}; run seed.py first")
+    with open(manifest_path(db_path)) as f:
+        manifest = json.load(f)
+    blob_path = manifest.get('blob_store') or blob_store_path(db_path)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.writes:
+            scratch = os.path.join(tmp_dir, 'bench.db')
+            source = sqlite3.connect(db_path)
+            target = sqlite3.connect(scratch)
+            source.backup(target)
+            source.close()
+            target.close()
+            db_path = scratch
+
+        class BenchConfig(Config):
+            DATABASE_PATH = db_path
+            BLOB_STORE_PATH = blob_path
+            MESSAGE_BUS = 'local'
+            METRICS_ENABLED = False
+            DB_TRACE = False
+
+        app = create_app(BenchConfig)
+        fixtures = Fixtures(db_path, manifest['password'])
+        models_read, models_write = model_cases(app, fixtures)
+        routes_read, routes_write = route_cases(app, fixtures)
+        cases = models_read + routes_read
+        if args.writes:
+            cases += models_write + routes_write
+        if args.only:
+            cases = [case for case in cases if any(part in case.name for part in args.only)]
+
+        print(f"{len(cases)} cases on {manifest['scale']} dataset (seed {manifest['seed']}, "
+              f"{manifest['counts']['orders']:,} orders), {args.repeat} runs each, times in ms")
+        print(f"{'case':<44} {'n':>5} {'p50':>9} {'p95':>9} {'p99':>9} {'mean':>9}")
+        results = {}
+        for case in cases:
+            stats = run_case(case, args.repeat, args.warmup)
+            if stats is None:
+                print(f"{case.name:<44} skipped: the dataset has too few rows for it")
+                continue
+            results[case.name] = stats
+            print(f"{case.name:<44} {stats['n']:>5} {stats['p50']:9.3f} {stats['p95']:9.3f} "
+                  f"{stats['p99']:9.3f} {stats['mean']:9.3f}")
+        close_pools(app)
+
+    run = {
+        "dataset": {key: manifest[key] for key in ('scale', 'seed', 'end', 'days', 'sizes')},
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "cases": results,
+    }
+    ok = True
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline['dataset'] != run['dataset']:
+            print(f"\nWarning: the baseline was taken on a different dataset ({baseline['dataset']['scale']}, "
+                  f"seed {baseline['dataset']['seed']}); the comparison is not like for like.")
+        regressions = compare(results, baseline, args.metric, args.threshold, args.min_delta_ms)
+        if regressions:
+            ok = False
+            print(f"\n{len(regressions)} case(s) regressed by more than {args.threshold * 100:.0f}% at {args.metric}: "
+                  + ', '.join(regressions))
+        else:
+            print("\nNo regressions against the baseline.")
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(run, f, indent=2)
+        print(f"Baseline written to {args.save_baseline}")
+    sys.exit(0 if ok else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+import base64
+import binascii
+import hashlib
+import mimetypes
+import os
+import re
+import tempfile
+from flask import current_app, url_for
+
+# Content types we accept in data URLs, and the extension stored in the ref
+EXTENSIONS = {
+    'image/png': '.png',
+    'image/jpeg': '.jpg',
+    'image/webp': '.webp',
+    'image/gif': '.gif',
+}
+
+# A ref is the sha256 of the content plus its extension, e.g. "3f7a...e1.png"
+REF_RE = re.compile(r'^[0-9a-f]{64}\.[a-z0-9]{1,5}$')
+# An image_url pointing back at our own blob route
+BLOB_URL_RE = re.compile(r'/api/media/blobs/([0-9a-f]{64}\.[a-z0-9]{1,5})$')
+
+
+class BlobStore:
+    """
+    Content-addressed file store for binary blobs (order snapshots).
+
+    Files live under <root>/<first two hex chars>/<ref>. Because the name is
+    derived from the content, storing the same design twice writes it once.
+    Resized variants of an image (see derivatives.py) live under
+    <root>/derived/ and are named after the source ref and the variant.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, ref):
+        if not REF_RE.match(ref or ''):
+            raise ValueError(f"Invalid blob reference: {ref!r}")
+        return os.path.join(self.root, ref[:2], ref)
+
+    def exists(self, ref):
+        return os.path.exists(self.path(ref))
+
+    def put(self, data, content_type):
+        extension = EXTENSIONS.get(content_type)
+        if not extension:
+            raise ValueError(f"Unsupported content type: {content_type}")
+        ref = hashlib.sha256(data).hexdigest() + extension
+        path = self.path(ref)
+        if not os.path.exists(path):
+            self._write(path, data)
+        return ref
+
+    def _write(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file and rename so readers never see a partial blob
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def variant_path(self, ref, variant, extension):
+        self.path(ref)  # validates the ref
+        return os.path.join(self.root, 'derived', ref[:2], f"{ref.split('.')[0]}.{variant}{extension}")
+
+    def put_variant(self, ref, variant, data, extension):
+        self._write(self.variant_path(ref, variant, extension), data)
+
+    def find_variant(self, ref, variant):
+        """Path of a generated variant, or None if it has not been built yet."""
+        for extension in ('.webp', '.jpg'):
+            path = self.variant_path(ref, variant, extension)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def put_data_url(self, data_url):
+        """
+        Decodes a base64 data URL (as produced by canvas.toDataURL) and stores
+        its content. Returns the blob ref.
+        """
+        header, sep, payload = (data_url or '').partition(',')
+        if not sep or not header.startswith('data:') or not header.endswith(';base64'):
+            raise ValueError("Expected a base64 data URL")
+        content_type = header[len('data:'):].split(';')[0].lower()
+        try:
+            data = base64.b64decode(payload, validate=True)
+        except (binascii.Error, ValueError):
+            raise ValueError("Malformed base64 payload in data URL")
+        return self.put(data, content_type)
+
+    def content_type(self, ref):
+        return mimetypes.guess_type(ref)[0] or 'application/octet-stream'
+
+
+def get_blob_store():
+    return current_app.extensions['blob_store']
+
+def blob_url(ref):
+    return url_for('media.get_blob', ref=ref, _external=True)
+
+def variant_urls(ref):
+    from .derivatives import VARIANTS
+    return {
+        variant: url_for('media.get_blob_variant', ref=ref, variant=variant, _external=True)
+        for variant in VARIANTS
+    }
+
+def attach_snapshot_urls(items):
+    """
+    Replaces each order item's snapshot_ref with a snapshot_image URL, so the
+    frontend can keep using item.snapshot_image as an <img> src, and adds
+    snapshot_variants with the resized versions. Rows that were never
+    migrated keep their inline data URL.
+    """
+    for item in items:
+        ref = item.pop('snapshot_ref', None)
+        if ref:
+            item['snapshot_image'] = blob_url(ref)
+            item['snapshot_variants'] = variant_urls(ref)
+    return items
+
+def attach_image_urls(cakes):
+    """
+    Same for catalog cakes: an uploaded image (image_ref) is exposed as
+    image_url plus image_variants. External image_urls are left alone.
+    """
+    for cake in cakes:
+        ref = cake.pop('image_ref', None)
+        if ref:
+            cake['image_url'] = blob_url(ref)
+            cake['image_variants'] = variant_urls(ref)
+    return cakes
+
+def store_image_url(store, image_url):
+    """
+    Splits an image_url sent by the dashboard into (image_url, image_ref):
+    a data URL is stored in the blob store, a URL of one of our own blobs
+    (echoed back by an edit form) keeps its ref, anything else is an
+    external URL and is stored as-is.
+    """
+    if not image_url:
+        return None, None
+    if image_url.startswith('data:'):
+        return None, store.put_data_url(image_url)
+    match = BLOB_URL_RE.search(image_url)
+    if match and store.exists(match.group(1)):
+        return None, match.group(1)
+    return image_url, None
+
+def migrate_snapshot_images(connection, store, batch_size=100):
+    """
+    One-shot migration: moves inline data URL snapshots out of order_items
+    into the blob store and leaves only the ref in the row. Safe to re-run;
+    rows that were already moved are skipped. Returns the number of rows moved.
+    """
+    moved = 0
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            "SELECT id, snapshot_image FROM order_items WHERE id > ? AND snapshot_image IS NOT NULL ORDER BY id LIMIT ?",
+            (last_id, batch_size)
+        ).fetchall()
+        if not rows:
+            break
+        updates = []
+        for item_id, data_url in rows:
+            last_id = item_id
+            try:
+                ref = store.put_data_url(data_url)
+            except ValueError as e:
+                print(f"Skipping order item {item_id}: {e}")
+                continue
+            updates.append((ref, item_id))
+        connection.executemany(
+            "UPDATE order_items SET snapshot_ref = ?, snapshot_image = NULL WHERE id = ?",
+            updates
+        )
+        connection.commit()
+        moved += len(updates)
+    return moved
+
+def init_app(app):
+    app.extensions['blob_store'] = BlobStore(app.config['BLOB_STORE_PATH'])
@@ -0,0 +1,311 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from flask import current_app
+from .presence import PresenceRegistry
+
+# Message bus for Socket.IO fan-out and presence.
+#
+# Socket.IO rooms only exist inside the process that owns the sockets, so a
+# message published on worker A never reaches a shopkeeper connected to
+# worker B. Handlers therefore publish through the bus instead of calling
+# emit() directly:
+#
+#   'local'  -- LocalBus: single process, emits straight to the room.
+#   'sqlite' -- SqliteBus: several `socketio.run` workers on one host share a
+#               sqlite file. Each worker emits to its own sockets immediately
+#               and appends the event to a shared log that the other workers
+#               tail and re-emit locally. Presence is kept in a shared table
+#               so "is the shop online" is answered across workers.
+#
+# broadcast()/subscribe() carry notices between the workers themselves
+# rather than to sockets, e.g. catalog_cache's "catalog_invalidated" so
+# that every worker drops listings and price tables a write on another
+# worker made stale. The local bus has no other workers to tell.
+
+# Room name of worker-to-worker notices in the shared event log
+SERVER_ROOM = '_workers'
+
+
+class LocalBus:
+    """In-process bus: rooms and presence are local to this worker."""
+
+    name = 'local'
+
+    def __init__(self, socketio):
+        self.socketio = socketio
+        self.presence = PresenceRegistry()
+        self._published = 0
+
+    def start(self):
+        pass
+
+    def publish(self, event, data, room):
+        self._published += 1
+        self.socketio.emit(event, data, to=room)
+
+    def broadcast(self, event, data):
+        pass
+
+    def subscribe(self, event, handler):
+        pass
+
+    def close(self):
+        pass
+
+    def stats(self):
+        return {"backend": self.name, "published": self._published, **self.presence.stats()}
+
+
+class SqlitePresence(PresenceRegistry):
+    """
+    Presence that is visible to every worker. The in-memory indexes still
+    answer sid lookups for this worker's own sockets; the shared
+    bus_presence table answers the cross-worker queries. Rows of workers
+    that stopped heartbeating are ignored and later purged.
+    """
+
+    def __init__(self, bus):
+        super().__init__()
+        self.bus = bus
+
+    def connect(self, sid, user_id, role, shop_id=None):
+        session = super().connect(sid, user_id, role, shop_id)
+        self.bus.execute(
+            "INSERT OR REPLACE INTO bus_presence (worker_id, sid, user_id, role, shop_id) VALUES (?, ?, ?, ?, ?)",
+            (self.bus.worker_id, sid, user_id, role, shop_id if role == 'shopkeeper' else None)
+        )
+        return session
+
+    def disconnect(self, sid):
+        session = super().disconnect(sid)
+        if session is not None:
+            self.bus.execute(
+                "DELETE FROM bus_presence WHERE worker_id = ? AND sid = ?",
+                (self.bus.worker_id, sid)
+            )
+        return session
+
+    def _count(self, column, value):
+        return self.bus.execute_fetchone(
+            f"""
+            SELECT COUNT(*) FROM bus_presence p JOIN bus_workers w ON p.worker_id = w.worker_id
+            WHERE p.{column} = ? AND w.heartbeat_at > ?
+            """,
+            (value, time.time() - self.bus.worker_ttl)
+        )[0]
+
+    def is_user_online(self, user_id):
+        return self.user_session_count(user_id) > 0
+
+    def is_shop_online(self, shop_id):
+        return self.shop_session_count(shop_id) > 0
+
+    def user_session_count(self, user_id):
+        return self._count('user_id', user_id)
+
+    def shop_session_count(self, shop_id):
+        return self._count('shop_id', shop_id)
+
+    def stats(self):
+        row = self.bus.execute_fetchone(
+            """
+            SELECT COUNT(*), COUNT(DISTINCT p.user_id), COUNT(DISTINCT p.shop_id)
+            FROM bus_presence p JOIN bus_workers w ON p.worker_id = w.worker_id
+            WHERE w.heartbeat_at > ?
+            """,
+            (time.time() - self.bus.worker_ttl,)
+        )
+        return {"sessions": row[0], "users": row[1], "shops": row[2], "local_sessions": super().stats()['sessions']}
+
+
+class SqliteBus:
+    """
+    Multi-process bus over a shared sqlite file (a local stand-in for a
+    broker such as Redis). Events get a monotonically increasing id; each
+    worker remembers the last id it has seen and polls for newer ones.
+    """
+
+    name = 'sqlite'
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS bus_events (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      origin TEXT NOT NULL,
+      room TEXT NOT NULL,
+      event TEXT NOT NULL,
+      payload TEXT NOT NULL,
+      created_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_bus_events_created ON bus_events (created_at);
+    CREATE TABLE IF NOT EXISTS bus_workers (
+      worker_id TEXT PRIMARY KEY,
+      heartbeat_at REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS bus_presence (
+      worker_id TEXT NOT NULL,
+      sid TEXT NOT NULL,
+      user_id INTEGER NOT NULL,
+      role TEXT,
+      shop_id INTEGER,
+      PRIMARY KEY (worker_id, sid)
+    );
+    CREATE INDEX IF NOT EXISTS idx_bus_presence_user ON bus_presence (user_id);
+    CREATE INDEX IF NOT EXISTS idx_bus_presence_shop ON bus_presence (shop_id);
+    """
+
+    def __init__(self, socketio, path, poll_interval=0.05, retention=60.0, worker_ttl=5.0):
+        self.socketio = socketio
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.worker_ttl = worker_ttl
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._lock = threading.Lock()
+        self._started = False
+        self._stopped = False
+        self._last_id = 0
+        self._handlers = {}  # event -> [handler(data)] for other workers' broadcasts
+        self._stats = {"published": 0, "relayed": 0, "broadcast": 0, "notices": 0, "polls": 0}
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Autocommit mode: every statement is its own short transaction
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        self._conn.execute("PRAGMA busy_timeout = 5000")
+        self._conn.executescript(self.SCHEMA)
+        self.presence = SqlitePresence(self)
+
+    # The connection is shared by the request threads and the poller, so a
+    # query's rows are fetched before the lock is released; no cursor escapes.
+    def execute(self, sql, params=()):
+        with self._lock:
+            self._conn.execute(sql, params)
+
+    def execute_fetchone(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchone()
+
+    def execute_fetchall(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def start(self):
+        """Registers this worker and starts tailing the event log (once)."""
+        if self._started:
+            return
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            # Only relay events published from now on, not the retained backlog
+            self._last_id = self._conn.execute("SELECT COALESCE(MAX(id), 0) FROM bus_events").fetchone()[0]
+        self._heartbeat()
+        self.socketio.start_background_task(self._run)
+
+    def publish(self, event, data, room):
+        # Our own sockets get it straight away; other workers via the log
+        self.socketio.emit(event, data, to=room)
+        self.execute(
+            "INSERT INTO bus_events (origin, room, event, payload, created_at) VALUES (?, ?, ?, ?, ?)",
+            (self.worker_id, room, event, json.dumps(data), time.time())
+        )
+        self._stats["published"] += 1
+
+    def broadcast(self, event, data):
+        """Sends a notice to the subscribe() handlers of every other worker."""
+        self.execute(
+            "INSERT INTO bus_events (origin, room, event, payload, created_at) VALUES (?, ?, ?, ?, ?)",
+            (self.worker_id, SERVER_ROOM, event, json.dumps(data), time.time())
+        )
+        self._stats["broadcast"] += 1
+
+    def subscribe(self, event, handler):
+        self._handlers.setdefault(event, []).append(handler)
+
+    def _notify(self, event, data):
+        self._stats["notices"] += 1
+        for handler in self._handlers.get(event, ()):
+            try:
+                handler(data)
+            except Exception as e:
+                print(f"Message bus handler for {event} failed: {e}")
+
+    def poll(self):
+        """Re-emits events published by other workers since the last poll."""
+        rows = self.execute_fetchall(
+            "SELECT id, origin, room, event, payload FROM bus_events WHERE id > ? ORDER BY id LIMIT 500",
+            (self._last_id,)
+        )
+        self._stats["polls"] += 1
+        for event_id, origin, room, event, payload in rows:
+            self._last_id = event_id
+            if origin == self.worker_id:
+                continue
+            if room == SERVER_ROOM:
+                self._notify(event, json.loads(payload))
+            else:
+                self.socketio.emit(event, json.loads(payload), to=room)
+                self._stats["relayed"] += 1
+        return len(rows)
+
+    def _heartbeat(self):
+        now = time.time()
+        self.execute(
+            "INSERT OR REPLACE INTO bus_workers (worker_id, heartbeat_at) VALUES (?, ?)",
+            (self.worker_id, now)
+        )
+        # Housekeeping: forget crashed workers' sessions and expired events
+        self.execute(
+            "DELETE FROM bus_presence WHERE worker_id IN (SELECT worker_id FROM bus_workers WHERE heartbeat_at < ?)",
+            (now - self.worker_ttl * 4,)
+        )
+        self.execute("DELETE FROM bus_workers WHERE heartbeat_at < ?", (now - self.worker_ttl * 4,))
+        self.execute("DELETE FROM bus_events WHERE created_at < ?", (now - self.retention,))
+
+    def _run(self):
+        next_heartbeat = 0
+        while not self._stopped:
+            try:
+                self.poll()
+                if time.monotonic() >= next_heartbeat:
+                    self._heartbeat()
+                    next_heartbeat = time.monotonic() + self.worker_ttl / 5
+            except sqlite3.Error as e:
+                print(f"Message bus poll failed: {e}")
+            self.socketio.sleep(self.poll_interval)
+
+    def close(self):
+        self._stopped = True
+        self.execute("DELETE FROM bus_presence WHERE worker_id = ?", (self.worker_id,))
+        self.execute("DELETE FROM bus_workers WHERE worker_id = ?", (self.worker_id,))
+
+    def stats(self):
+        return {"backend": self.name, "worker_id": self.worker_id, "last_event_id": self._last_id,
+                **self._stats, **self.presence.stats()}
+
+
+def get_bus():
+    return current_app.extensions['bus']
+
+def init_app(app, socketio):
+    backend = app.config['MESSAGE_BUS']
+    if backend == 'local':
+        bus = LocalBus(socketio)
+    elif backend == 'sqlite':
+        bus = SqliteBus(
+            socketio,
+            app.config['MESSAGE_BUS_PATH'],
+            poll_interval=app.config['MESSAGE_BUS_POLL_INTERVAL'],
+        )
+    else:
+        raise ValueError(f"Unknown MESSAGE_BUS backend: {backend}")
+    app.extensions['bus'] = bus
+    # A worker may serve REST requests before any socket connects to it; it
+    # still has to follow the other workers' notices from then on
+    app.before_request(bus.start)
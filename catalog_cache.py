@@ -0,0 +1,126 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from flask import current_app
+from .http_cache import not_modified, version_etag
+from .serialization import dumps_bytes
+
+# Bus notice sent after a catalog write, so other workers invalidate too
+CATALOG_INVALIDATED = 'catalog_invalidated'
+
+
+class CatalogCache:
+    """
+    In-process cache of serialized catalog listings.
+
+    Entries hold the JSON bytes of a listing, so a hit skips both sqlite and
+    jsonify. Every entry is tagged with the version it was built from: the
+    global catalog uses a global counter and each shop's product list uses
+    that shop's counter. The catalog mutation functions in models.py bump
+    both counters through invalidate(), which makes older entries stale
+    without having to find and delete them. The LRU bound keeps memory
+    flat no matter how many shops exist. Each worker process has its own
+    cache; writes on other workers arrive as bus notices (see init_app).
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (version, payload bytes)
+        self._lock = threading.Lock()
+        self._global_version = 0
+        self._shop_versions = {}
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+    def version(self, shop_id=None):
+        with self._lock:
+            if shop_id is None:
+                return self._global_version
+            return self._shop_versions.get(shop_id, 0)
+
+    def get_or_load(self, key, loader, shop_id=None):
+        """
+        Returns the cached payload for key, or calls loader() to build the
+        JSON bytes and caches them. Pass shop_id for per-shop entries.
+        """
+        version = self.version(shop_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                return entry[1]
+            self._stats['misses'] += 1
+
+        payload = loader()
+
+        with self._lock:
+            # If the catalog changed while we were loading, the payload may
+            # already be stale; serve it to this caller but don't keep it.
+            current = self._global_version if shop_id is None else self._shop_versions.get(shop_id, 0)
+            if current == version:
+                self._entries[key] = (version, payload)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self._stats['evictions'] += 1
+        return payload
+
+    def invalidate(self, shop_id):
+        with self._lock:
+            self._global_version += 1
+            self._shop_versions[shop_id] = self._shop_versions.get(shop_id, 0) + 1
+            self._stats['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['max_entries'] = self.max_entries
+            stats['global_version'] = self._global_version
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        return stats
+
+
+def get_catalog_cache():
+    return current_app.extensions['catalog_cache']
+
+def invalidate_catalog(shop_id):
+    """
+    Called by the catalog mutation functions after a successful commit.
+    Never raises: if the notice cannot be sent, other workers serve the
+    old listing until their next invalidation of that shop.
+    """
+    get_catalog_cache().invalidate(shop_id)
+    try:
+        current_app.extensions['bus'].broadcast(CATALOG_INVALIDATED, {"shop_id": shop_id})
+    except Exception as e:
+        print(f"Failed to broadcast catalog invalidation for shop {shop_id}: {e}")
+
+def cached_json(key, loader, shop_id=None):
+    """
+    Returns a JSON response for key, building it from loader() (which returns
+    the data to serialize) only on a cache miss. The ETag is derived from the
+    catalog version, so a client that is up to date gets a 304 without even
+    a cache lookup.
+    """
+    cache = get_catalog_cache()
+    key_tag = hashlib.blake2b(repr(key).encode('utf-8'), digest_size=6).hexdigest()
+    early = not_modified(version_etag('catalog', key_tag, cache.version(shop_id)))
+    if early is not None:
+        return early
+    payload = cache.get_or_load(
+        key, lambda: dumps_bytes(loader()), shop_id
+    )
+    return current_app.response_class(payload, mimetype='application/json')
+
+def init_app(app):
+    """Call after bus.init_app: the cache follows other workers' invalidations through the bus."""
+    cache = CatalogCache(app.config['CATALOG_CACHE_MAX_ENTRIES'])
+    app.extensions['catalog_cache'] = cache
+    # Price tables (pricing.py) are tagged with these versions, so they go stale along with the listings
+    app.extensions['bus'].subscribe(CATALOG_INVALIDATED, lambda data: cache.invalidate(data['shop_id']))
@@ -0,0 +1,222 @@
+import csv
+import io
+import json
+import re
+from .blobstore import blob_url, store_image_url
+from .models import import_catalog_batch
+from .serialization import dumps_bytes
+
+# Bulk catalog import/export for shopkeepers.
+#
+# Two formats, both read and written as streams so a large catalog never
+# sits in memory as a whole:
+#
+#   csv     one row per flavor, header required:
+#           name,base_price,shape,image_url,flavor_name,flavor_color_hex,flavor_price_modifier
+#           A row with an empty flavor_name only creates/updates the cake.
+#   ndjson  one cake per line:
+#           {"name", "base_price", "shape", "image_url", "flavors": [{"name", "color_hex", "price_modifier"}]}
+#
+# Cakes are matched by name within the shop and flavors by name within
+# their cake, so re-importing an export is a no-op. Lines are validated one
+# by one; a bad line is reported with its line number and skipped, the rest
+# of the file still goes in.
+
+CSV_COLUMNS = ['name', 'base_price', 'shape', 'image_url', 'flavor_name', 'flavor_color_hex', 'flavor_price_modifier']
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+CONTENT_TYPE_FORMATS = {
+    'text/csv': 'csv',
+    'application/csv': 'csv',
+    'application/x-ndjson': 'ndjson',
+    'application/ndjson': 'ndjson',
+    'application/jsonl': 'ndjson',
+}
+HEX_COLOR_RE = re.compile(r'^#[0-9a-fA-F]{6}$')
+MAX_NAME_LENGTH = 200
+MAX_REPORTED_ERRORS = 500
+
+
+def detect_format(requested, content_type):
+    """The import/export format from ?format= or the request's content type, or None."""
+    if requested:
+        return requested.lower() if requested.lower() in FORMATS else None
+    return CONTENT_TYPE_FORMATS.get((content_type or '').split(';')[0].strip().lower())
+
+def _text(stream):
+    # utf-8-sig: spreadsheets like to prepend a BOM to CSV exports
+    return io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+
+def _name(value, field):
+    name = str(value).strip() if value is not None else ''
+    if not name:
+        raise ValueError(f"{field} is required")
+    if len(name) > MAX_NAME_LENGTH:
+        raise ValueError(f"{field} is longer than {MAX_NAME_LENGTH} characters")
+    return name
+
+def _number(value, field, default=None):
+    if value is None or value == '':
+        if default is None:
+            raise ValueError(f"{field} is required")
+        return default
+    if isinstance(value, bool):
+        raise ValueError(f"{field} must be a number")
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{field} must be a number")
+    if number != number or number in (float('inf'), float('-inf')):
+        raise ValueError(f"{field} must be a number")
+    return number
+
+def parse_flavor(record):
+    color_hex = str(record.get('color_hex') or '').strip()
+    if not HEX_COLOR_RE.match(color_hex):
+        raise ValueError("flavor color_hex must look like #RRGGBB")
+    return {
+        "name": _name(record.get('name'), 'flavor name'),
+        "color_hex": color_hex,
+        "price_modifier": _number(record.get('price_modifier'), 'flavor price_modifier', default=0.0),
+    }
+
+def parse_cake(record):
+    """Validates one cake record (NDJSON shape); raises ValueError."""
+    if not isinstance(record, dict):
+        raise ValueError("expected a JSON object")
+    base_price = _number(record.get('base_price'), 'base_price')
+    if base_price <= 0:
+        raise ValueError("base_price must be positive")
+    image_url = record.get('image_url') or None
+    if image_url is not None and not isinstance(image_url, str):
+        raise ValueError("image_url must be a string")
+    flavors = record.get('flavors') or []
+    if not isinstance(flavors, list) or not all(isinstance(flavor, dict) for flavor in flavors):
+        raise ValueError("flavors must be a list of objects")
+    return {
+        "name": _name(record.get('name'), 'name'),
+        "base_price": base_price,
+        "shape": _name(record.get('shape'), 'shape'),
+        "image_url": image_url,
+        "flavors": [parse_flavor(flavor) for flavor in flavors],
+    }
+
+def read_csv(stream):
+    """Yields (line_number, cake_record) for each CSV row, or raises ValueError for a bad header."""
+    reader = csv.DictReader(_text(stream))
+    missing = [column for column in ('name', 'base_price', 'shape') if column not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError(f"CSV header is missing: {', '.join(missing)}")
+    for row in reader:
+        record = {key: row.get(key) for key in ('name', 'base_price', 'shape', 'image_url')}
+        if (row.get('flavor_name') or '').strip():
+            record['flavors'] = [{
+                "name": row.get('flavor_name'),
+                "color_hex": row.get('flavor_color_hex'),
+                "price_modifier": row.get('flavor_price_modifier'),
+            }]
+        yield reader.line_num, record
+
+def read_ndjson(stream):
+    """Yields (line_number, cake_record or the decode error) for each non-blank line."""
+    for line_number, line in enumerate(_text(stream), start=1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError as e:
+            yield line_number, ValueError(f"invalid JSON: {e}")
+
+def import_catalog(shop_id, records, store, batch_size=500, dry_run=False):
+    """
+    Validates (line_number, record) pairs and upserts them in batches of
+    batch_size distinct cakes, one transaction each. Rows naming the same
+    cake are merged (the last row's cake fields win). Returns a summary with
+    the counts and the per-line errors; with dry_run nothing is written.
+    Refs of newly stored images are returned so the caller can queue their
+    variants.
+    """
+    summary = {
+        "lines": 0, "cakes_created": 0, "cakes_updated": 0, "flavors_created": 0, "flavors_updated": 0,
+        "errors": [], "error_count": 0, "dry_run": dry_run,
+    }
+    image_refs = []
+    batch = {}
+
+    def flush():
+        if batch and not dry_run:
+            for key, value in import_catalog_batch(shop_id, list(batch.values())).items():
+                summary[key] += value
+        batch.clear()
+
+    for line_number, record in records:
+        summary["lines"] += 1
+        try:
+            if isinstance(record, Exception):
+                raise record
+            cake = parse_cake(record)
+            if dry_run:
+                cake['image_ref'] = None
+            else:
+                cake['image_url'], cake['image_ref'] = store_image_url(store, cake['image_url'])
+                if cake['image_ref']:
+                    image_refs.append(cake['image_ref'])
+        except ValueError as e:
+            summary["error_count"] += 1
+            if len(summary["errors"]) < MAX_REPORTED_ERRORS:
+                summary["errors"].append({"line": line_number, "error": str(e)})
+            continue
+
+        merged = batch.get(cake['name'])
+        if merged is not None:
+            cake['flavors'] = merged['flavors'] + cake['flavors']
+            if not (cake['image_url'] or cake['image_ref']):
+                cake['image_url'], cake['image_ref'] = merged['image_url'], merged['image_ref']
+        elif len(batch) >= batch_size:
+            flush()
+        batch[cake['name']] = cake
+    flush()
+    return summary, image_refs
+
+
+def _export_image_url(row):
+    return blob_url(row['image_ref']) if row['image_ref'] else row['image_url']
+
+def export_csv(cursor, chunk_rows=500):
+    """Yields the catalog cursor (see get_catalog_export_rows) as CSV, in chunks."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    for index, row in enumerate(cursor, start=1):
+        writer.writerow([
+            row['name'], row['base_price'], row['shape'], _export_image_url(row) or '',
+            row['flavor_name'] or '', row['flavor_color_hex'] or '',
+            row['flavor_price_modifier'] if row['flavor_name'] is not None else '',
+        ])
+        if index % chunk_rows == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+def export_ndjson(cursor):
+    """Yields one JSON line per cake, grouping the cursor's consecutive flavor rows."""
+    cake, cake_id = None, None
+    for row in cursor:
+        if row['cake_id'] != cake_id:
+            if cake is not None:
+                yield dumps_bytes(cake) + b'\n'
+            cake_id = row['cake_id']
+            cake = {
+                "name": row['name'], "base_price": row['base_price'], "shape": row['shape'],
+                "image_url": _export_image_url(row), "flavors": [],
+            }
+        if row['flavor_name'] is not None:
+            cake['flavors'].append({
+                "name": row['flavor_name'], "color_hex": row['flavor_color_hex'],
+                "price_modifier": row['flavor_price_modifier'],
+            })
+    if cake is not None:
+        yield dumps_bytes(cake) + b'\n'
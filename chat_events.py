@@ -1,56 +1,48 @@
 from app import socketio, db
-from app.models import save_chat_message
+from app.chat_journal import get_chat_journal
+from app.presence import get_presence
+from app.bus import get_bus
+from app.tokens import get_signer, InvalidTokenError
+from app.metrics import timed_event
 from flask_socketio import emit, join_room, leave_room
 from flask import request
 
-# In-memory store for active users
-# { sid: { user_id, role, shop_id } }
-active_users = {}
-
-# Reverse lookup for shopkeepers
-# { shop_id: sid }
-active_shops = {}
-
-# Helper to find a customer's SID
-def get_customer_sid(customer_id):
-    for sid, user in active_users.items():
-        if user['user_id'] == customer_id and user['role'] == 'customer':
-            return sid
-    return None
+# Connected sessions are tracked in the presence registry (presence.py):
+# sid -> user, user -> sids and shop -> shopkeeper sids, all O(1).
+# Messages go out through the message bus (bus.py) so they also reach
+# sockets connected to other worker processes.
 
 @socketio.on('connect')
 def handle_connect():
+    get_bus().start() # Begin relaying events from other workers (no-op after the first call)
     print(f"Client connected: {request.sid}")
     emit('connected', {'sid': request.sid})
 
 @socketio.on('register_user')
+@timed_event('register_user')
 def handle_register_user(data):
     """
-    User sends this after connecting to identify themselves.
-    data = { "user_id": 123, "role": "customer" }
-    OR
-    data = { "user_id": 10, "role": "shopkeeper", "shop_id": 5 }
+    User sends this after connecting to identify themselves with the token
+    they got at login: data = { "token": "..." }. User id, role and shop id
+    are taken from the verified token, not from the client.
     """
     sid = request.sid
-    user_id = data.get('user_id')
-    role = data.get('role')
-    shop_id = data.get('shop_id', None)
-    
-    if not user_id:
+    try:
+        identity = get_signer().verify((data or {}).get('token'))
+    except InvalidTokenError as e:
+        emit('auth_error', {'error': str(e)})
         return
+    user_id = identity['user_id']
+    role = identity['role']
+    shop_id = identity['shop_id']
 
-    user_data = {
-        "user_id": user_id,
-        "role": role,
-        "shop_id": shop_id
-    }
-    active_users[sid] = user_data
+    get_presence().connect(sid, user_id, role, shop_id)
     
     if role == 'shopkeeper':
-        # Shopkeeper joins a private room for their shop
+        # Shopkeeper joins a private room for their shop.
+        # Every open tab joins, so all of them receive messages.
         shop_room = f"shop_{shop_id}"
         join_room(shop_room)
-        active_shops[shop_id] = sid # Add to shop lookup
         print(f"Shopkeeper {user_id} (Shop {shop_id}) joined room {shop_room}")
     else:
         # Customer joins a private room for their own ID
@@ -59,18 +51,22 @@ def handle_register_user(data):
         print(f"Customer {user_id} joined room {customer_room}")
 
 @socketio.on('send_message')
+@timed_event('send_message')
 def handle_send_message(data):
     """
     Handles messages from both customers and admins.
     """
     sid = request.sid
-    sender = active_users.get(sid)
+    sender = get_presence().get(sid)
     
     if not sender:
         print("Sender not registered")
         return
 
-    message_text = data.get('message')
+    message_text = (data or {}).get('message')
+    if not isinstance(message_text, str) or not message_text.strip():
+        print(f"Ignoring empty or invalid message from {sid}")
+        return
     
     message_data = {
         "sender_id": sender['user_id'],
@@ -83,14 +79,14 @@ def handle_send_message(data):
             
         customer_id = sender['user_id']
         shop_room = f"shop_{shop_id}"
-        shop_sid = active_shops.get(shop_id)
         
-        save_chat_message(shop_id, customer_id, sender['user_id'], message_text)
+        # Persisted by the chat journal; delivery below does not wait for it
+        get_chat_journal().append(shop_id, customer_id, sender['user_id'], message_text)
         message_data['customer_id'] = customer_id 
         
-        if shop_sid:
-            # Emit to the specific shop's SID
-            emit('receive_message', message_data, to=shop_sid)
+        if get_presence().is_shop_online(shop_id):
+            # Emit to the shop's room so every shopkeeper session gets it
+            get_bus().publish('receive_message', message_data, shop_room)
             print(f"Message from Customer {customer_id} to Shop {shop_id}")
         else:
             print(f"Shop {shop_id} is not online.")
@@ -106,12 +102,12 @@ def handle_send_message(data):
         customer_room = f"user_{customer_id}"
         # ---------------------
         
-        save_chat_message(shop_id, customer_id, sender['user_id'], message_text)
+        get_chat_journal().append(shop_id, customer_id, sender['user_id'], message_text)
         message_data['shop_id'] = shop_id
         
         # --- THIS IS THE FIX ---
         # We now emit to the customer_room
-        emit('receive_message', message_data, room=customer_room)
+        get_bus().publish('receive_message', message_data, customer_room)
         print(f"Message from Shop {shop_id} to Customer {customer_id} in room {customer_room}")
         # ---------------------
 
@@ -121,17 +117,14 @@ def handle_disconnect():
     Called when a client disconnects.
     """
     sid = request.sid
+    user = get_presence().disconnect(sid)
     
-    if sid in active_users:
-        user = active_users[sid]
+    if user:
         user_id = user['user_id']
         
-        if user['role'] == 'shopkeeper' and user['shop_id'] in active_shops:
-            del active_shops[user['shop_id']]
+        if user['role'] == 'shopkeeper':
             print(f"Shopkeeper {user_id} disconnected")
         else:
             print(f"Customer {user_id} disconnected")
-        
-        del active_users[sid]
     
     print(f"Client disconnected: {sid}")
\ No newline at end of file
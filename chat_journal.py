@@ -0,0 +1,167 @@
+import atexit
+import sqlite3
+import threading
+import time
+from collections import deque
+from flask import current_app
+
+# Durability modes for chat persistence:
+#   'sync'    -- every message is inserted and committed before the handler
+#                returns (one fsync per chat line).
+#   'batched' -- messages are queued and written by one executemany + commit
+#                when BATCH_SIZE messages are waiting or every FLUSH_INTERVAL
+#                seconds. A crash can lose at most the last interval.
+SYNC = 'sync'
+BATCHED = 'batched'
+
+
+class ChatJournal:
+    """
+    Write-behind journal for chat messages.
+
+    The socket handler appends the message and emits it to the recipient
+    right away; persistence happens in batches from a background task
+    started with socketio.start_background_task, so it cooperates with
+    eventlet. Any remaining messages are flushed at interpreter shutdown.
+    """
+
+    def __init__(self, app, socketio, mode=BATCHED, batch_size=100, flush_interval=0.25):
+        if mode not in (SYNC, BATCHED):
+            raise ValueError(f"Unknown chat journal mode: {mode}")
+        self.app = app
+        self.socketio = socketio
+        self.mode = mode
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = deque()
+        self._flush_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._started = False
+        self._stopped = False
+        self._stats = {
+            'enqueued': 0,
+            'persisted': 0,
+            'flushes': 0,
+            'errors': 0,
+            'dropped': 0,   # rows the schema rejected (e.g. a NULL message)
+            'flush_ms_total': 0.0,
+            'flush_ms_last': 0.0,
+            'flush_ms_max': 0.0,
+        }
+
+    def append(self, shop_id, customer_id, sender_id, message):
+        row = (shop_id, customer_id, sender_id, message)
+        with self._stats_lock:
+            self._stats['enqueued'] += 1
+        if self.mode == SYNC:
+            self._write_each([row])
+            return
+        self._ensure_started()
+        self._queue.append(row)
+        if len(self._queue) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Writes everything queued so far. Returns the number of rows written."""
+        with self._flush_lock:
+            rows = []
+            while self._queue:
+                rows.append(self._queue.popleft())
+            if not rows:
+                return 0
+            try:
+                if self._write(rows):
+                    return len(rows)
+                pending = rows
+            except sqlite3.IntegrityError:
+                # A bad row fails the whole batch; write the rest one by one
+                written, pending = self._write_each(rows)
+                if not pending:
+                    return written
+            # Put them back in front, in order, for the next attempt
+            self._queue.extendleft(reversed(pending))
+            return 0
+
+    def _write(self, rows):
+        from .models import save_chat_messages
+
+        started = time.perf_counter()
+        # A fresh app context so the connection is checked out of (and
+        # returned to) the write pool independently of any request
+        with self.app.app_context():
+            ok = save_chat_messages(rows)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._stats_lock:
+            if not ok:
+                self._stats['errors'] += 1
+                return False
+            self._stats['persisted'] += len(rows)
+            self._stats['flushes'] += 1
+            self._stats['flush_ms_total'] += elapsed_ms
+            self._stats['flush_ms_last'] = elapsed_ms
+            self._stats['flush_ms_max'] = max(self._stats['flush_ms_max'], elapsed_ms)
+        return True
+
+    def _write_each(self, rows):
+        """
+        Writes rows one at a time, dropping (and logging) the ones the schema
+        rejects so they can't block the queue. Stops at the first other
+        error. Returns (rows written, rows still to write).
+        """
+        written = 0
+        for index, row in enumerate(rows):
+            try:
+                if not self._write([row]):
+                    return written, rows[index:]
+                written += 1
+            except sqlite3.IntegrityError as e:
+                with self._stats_lock:
+                    self._stats['errors'] += 1
+                    self._stats['dropped'] += 1
+                print(f"Dropped chat message {row!r}: {e}")
+        return written, []
+
+    def _ensure_started(self):
+        if self._started:
+            return
+        with self._flush_lock:
+            if self._started:
+                return
+            self._started = True
+            self.socketio.start_background_task(self._run)
+            atexit.register(self.close)
+
+    def _run(self):
+        while not self._stopped:
+            self.socketio.sleep(self.flush_interval)
+            self.flush()
+
+    def close(self):
+        self._stopped = True
+        self.flush()
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        flushes = stats.pop('flushes')
+        total = stats.pop('flush_ms_total')
+        stats['mode'] = self.mode
+        stats['queue_depth'] = len(self._queue)
+        stats['flushes'] = flushes
+        stats['flush_ms_avg'] = round(total / flushes, 3) if flushes else 0.0
+        stats['flush_ms_last'] = round(stats['flush_ms_last'], 3)
+        stats['flush_ms_max'] = round(stats['flush_ms_max'], 3)
+        return stats
+
+
+def get_chat_journal():
+    return current_app.extensions['chat_journal']
+
+def init_app(app, socketio):
+    app.extensions['chat_journal'] = ChatJournal(
+        app,
+        socketio,
+        mode=app.config['CHAT_JOURNAL_MODE'],
+        batch_size=app.config['CHAT_JOURNAL_BATCH_SIZE'],
+        flush_interval=app.config['CHAT_JOURNAL_FLUSH_INTERVAL'],
+    )
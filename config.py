@@ -10,5 +10,58 @@ load_dotenv(os.path.join(BASE_DIR, '..', '.env'))
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'a-very-secret-key-that-you-should-change'
     DATABASE_PATH = os.path.join(BASE_DIR, '..', 'instance', 'cakedb.db')
+    # Chat persistence: 'sync' commits every message, 'batched' writes them
+    # behind in groups (see chat_journal.py)
+    CHAT_JOURNAL_MODE = os.environ.get('CHAT_JOURNAL_MODE', 'batched')
+    CHAT_JOURNAL_BATCH_SIZE = int(os.environ.get('CHAT_JOURNAL_BATCH_SIZE', 100))
+    CHAT_JOURNAL_FLUSH_INTERVAL = float(os.environ.get('CHAT_JOURNAL_FLUSH_INTERVAL', 0.25))
+    # Socket.IO fan-out: 'local' for a single worker, 'sqlite' to run several
+    # socketio.run workers on one host sharing MESSAGE_BUS_PATH (see bus.py)
+    MESSAGE_BUS = os.environ.get('MESSAGE_BUS', 'local')
+    MESSAGE_BUS_PATH = os.environ.get('MESSAGE_BUS_PATH') or os.path.join(BASE_DIR, '..', 'instance', 'bus.db')
+    MESSAGE_BUS_POLL_INTERVAL = float(os.environ.get('MESSAGE_BUS_POLL_INTERVAL', 0.05))
+    # Max number of serialized catalog listings kept in memory (LRU)
+    CATALOG_CACHE_MAX_ENTRIES = int(os.environ.get('CATALOG_CACHE_MAX_ENTRIES', 256))
+    # Cakes per transaction for bulk catalog imports
+    CATALOG_IMPORT_BATCH_SIZE = int(os.environ.get('CATALOG_IMPORT_BATCH_SIZE', 500))
+    # Content-addressed storage for order snapshot images
+    BLOB_STORE_PATH = os.path.join(BASE_DIR, '..', 'instance', 'blobs')
+    # Threads generating thumbnail/medium image variants (needs Pillow)
+    IMAGE_VARIANT_WORKERS = int(os.environ.get('IMAGE_VARIANT_WORKERS', 2))
+
+    # Lifetime of signed session tokens, and how many verified ones to remember
+    TOKEN_TTL = int(os.environ.get('TOKEN_TTL', 7 * 24 * 3600))
+    TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', 1024))
+
+    # --- Response compression (see http_cache.py) ---
+    COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+    COMPRESS_GZIP_LEVEL = int(os.environ.get('COMPRESS_GZIP_LEVEL', 6))
+    # Used when the brotli package is installed (requirements.txt); otherwise only gzip is offered
+    COMPRESS_BROTLI_QUALITY = int(os.environ.get('COMPRESS_BROTLI_QUALITY', 5))
+
+    # --- Password hashing ---
+    # bcrypt cost; existing hashes are upgraded on the next successful login
+    BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 4))
+    # Hashes allowed to wait for a worker before requests get a 503
+    PASSWORD_HASH_MAX_QUEUE = int(os.environ.get('PASSWORD_HASH_MAX_QUEUE', 64))
+
+    # --- Database connection pool ---
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 4))
+    DB_READ_POOL_SIZE = int(os.environ.get('DB_READ_POOL_SIZE', 16))
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+    DB_SYNCHRONOUS = os.environ.get('DB_SYNCHRONOUS', 'NORMAL')  # safe with WAL
+    DB_CACHE_SIZE_KB = int(os.environ.get('DB_CACHE_SIZE_KB', 16384))
+    DB_MMAP_SIZE = int(os.environ.get('DB_MMAP_SIZE', 256 * 1024 * 1024))
+    # Statement tracing for the dev server (see sqltrace.py): timings per
+    # query fingerprint on /api/stats/sql, slow statements printed with their plan
+    DB_TRACE = os.environ.get('DB_TRACE', '0') == '1'
+    DB_SLOW_QUERY_MS = float(os.environ.get('DB_SLOW_QUERY_MS', 100))
+    DB_TRACE_TOP_N = int(os.environ.get('DB_TRACE_TOP_N', 20))
+
+    # --- Request metrics (see metrics.py) ---
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+    # /metrics, /api/stats and /api/stats/sql only answer loopback clients unless this is set
+    METRICS_ALLOW_REMOTE = os.environ.get('METRICS_ALLOW_REMOTE', '0') == '1'
     
     # GOOGLE_API_KEY and COHERE_API_KEY removed
\ No newline at end of file
@@ -1,22 +1,62 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, jsonify, request, g
 from app.models import (
     get_all_cakes, 
+    search_cakes,
     get_cake_details, 
     create_order, 
     get_orders_by_customer, 
     get_order_details,
+    get_order_version,
     get_chat_history,
+    get_customer_unread_counts,
+    mark_conversation_read,
     rate_order
 )
+from app.blobstore import get_blob_store, attach_snapshot_urls, attach_image_urls
+from app.derivatives import get_derivatives
+from app.catalog_cache import cached_json
+from app.pagination import page_args, filter_args
+from app.search import search_args
+from app.presence import get_presence
+from app.tokens import require_identity
+from app.serialization import json_response
+from app.http_cache import not_modified, fingerprint_etag
+from app.pricing import get_pricing, PriceMismatchError, MAX_QUOTE_ITEMS, DELIVERY_FEE
 from flask_socketio import emit
 
 bp = Blueprint('customer', __name__)
 
 @bp.route('/cakes')
 def get_cakes():
+    """
+    Lists the catalog across all shops. Pass ?include=flavors to get each
+    cake's flavors nested in the card (loaded in one batched query).
+    """
+    try:
+        include_flavors = request.args.get('include') == 'flavors'
+        return cached_json(('catalog', include_flavors), lambda: attach_image_urls(get_all_cakes(include_flavors)))
+    except Exception as e:
+        return jsonify(error=str(e)), 500
+
+@bp.route('/cakes/search')
+def search_catalog():
+    """
+    Ranked catalog search with facets (see search.py).
+    Query: q, shape, shop_id (both repeatable or comma-separated),
+    min_price, max_price, sort=relevance|price_asc|price_desc|name,
+    limit, cursor.
+    """
     try:
-        cakes = get_all_cakes()
-        return jsonify(cakes), 200
+        args = search_args()
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    try:
+        def load():
+            page = search_cakes(**args)
+            attach_image_urls(page['items'])
+            return page
+        key = ('search',) + tuple((name, tuple(value) if isinstance(value, list) else value) for name, value in args.items())
+        return cached_json(key, load)
     except Exception as e:
         return jsonify(error=str(e)), 500
 
@@ -25,33 +65,68 @@ def get_single_cake(cake_id):
     try:
         details = get_cake_details(cake_id)
         if details:
+            attach_image_urls([details['cake']])
             return jsonify(details), 200
         else:
             return jsonify(error="Cake not found"), 404
     except Exception as e:
         return jsonify(error=str(e)), 500
 
+@bp.route('/quote', methods=['POST'])
+def quote_items():
+    """
+    Prices up to MAX_QUOTE_ITEMS designer configurations in one call.
+    Body: {"items": [{cake_id, flavor, size, top_decoration, side_decoration,
+    topping, addOns}, ...]}. Each quote is {"price", "shop_id"} or {"error"}.
+    """
+    data = request.get_json(silent=True) or {}
+    items = data.get('items')
+    if not isinstance(items, list) or not items:
+        return jsonify(error="items must be a non-empty list"), 400
+    if len(items) > MAX_QUOTE_ITEMS:
+        return jsonify(error=f"At most {MAX_QUOTE_ITEMS} items can be quoted at once"), 400
+    try:
+        return jsonify(quotes=get_pricing().quote(items), delivery_fee=DELIVERY_FEE), 200
+    except Exception as e:
+        return jsonify(error=str(e)), 500
+
 @bp.route('/orders', methods=['POST'])
+@require_identity('customer')
 def submit_order():
     """
-    Endpoint to submit a new order.
+    Endpoint to submit a new order, placed for the customer in the token.
     """
     data = request.get_json()
     
-    customer_id = data.get('customer_id') 
+    customer_id = g.identity['user_id']
     total_price = data.get('total_price')
     items_list = data.get('items')
     shop_id = data.get('shop_id')
     
-    # --- NEW: Get snapshot from the payload ---
-    snapshot_image = data.get('snapshot_image')
-    if items_list and len(items_list) > 0:
-        items_list[0]['snapshot_image'] = snapshot_image
-    # ------------------------------------
-
     if not all([customer_id, total_price is not None, items_list, shop_id]):
         return jsonify(error="Missing required order data"), 400
 
+    # --- Prices come from the server, not from the browser ---
+    try:
+        prices = get_pricing().validate_order(shop_id, items_list, total_price)
+    except PriceMismatchError as e:
+        return jsonify(error=str(e), expected_total=e.expected_total, expected_prices=e.expected_prices), 409
+    except (ValueError, TypeError) as e:
+        return jsonify(error=str(e)), 400
+    for item, price in zip(items_list, prices):
+        item['price'] = price
+    # ------------------------------------
+
+    # --- Decode the snapshot once and keep only its blob ref on the item ---
+    snapshot_image = data.get('snapshot_image')
+    if snapshot_image:
+        try:
+            items_list[0]['snapshot_ref'] = get_blob_store().put_data_url(snapshot_image)
+        except ValueError as e:
+            return jsonify(error=f"Invalid snapshot image: {e}"), 400
+        get_derivatives().submit(items_list[0]['snapshot_ref'])
+    # ------------------------------------
+
     try:
         order_id = create_order(customer_id, total_price, items_list, shop_id)
         
@@ -64,18 +139,33 @@ def submit_order():
         return jsonify(error=str(e)), 500
 
 @bp.route('/orders/<int:customer_id>', methods=['GET'])
+@require_identity('customer')
 def get_my_orders(customer_id):
+    """
+    One page of the customer's orders, newest first.
+    Query: limit, cursor, status, from, to (YYYY-MM-DD).
+    """
     try:
-        orders = get_orders_by_customer(customer_id)
-        return jsonify(orders), 200
+        page = get_orders_by_customer(customer_id, **page_args(), **filter_args(), encoded=True)
+        return json_response(page)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
     except Exception as e:
         return jsonify(error=str(e)), 500
 
 @bp.route('/order/<int:order_id>/<int:customer_id>', methods=['GET'])
+@require_identity('customer')
 def get_single_order_details(order_id, customer_id):
     try:
+        version = get_order_version(order_id, customer_id=customer_id)
+        if version is None:
+            return jsonify(error="Order not found or access denied"), 404
+        early = not_modified(fingerprint_etag('order', order_id, version))
+        if early is not None:
+            return early
         details = get_order_details(order_id, customer_id)
         if details:
+            attach_snapshot_urls(details['items'])
             return jsonify(details), 200
         else:
             return jsonify(error="Order not found or access denied"), 404
@@ -83,17 +173,45 @@ def get_single_order_details(order_id, customer_id):
         return jsonify(error=str(e)), 500
 
 @bp.route('/chat/<int:shop_id>/<int:customer_id>', methods=['GET'])
+@require_identity('customer')
 def get_customer_chat_history(shop_id, customer_id):
     try:
-        history = get_chat_history(shop_id, customer_id)
-        return jsonify(history), 200
+        page = get_chat_history(shop_id, customer_id, **page_args(), encoded=True)
+        return json_response(page)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    except Exception as e:
+        return jsonify(error=str(e)), 500
+
+@bp.route('/chat/<int:shop_id>/<int:customer_id>/read', methods=['POST'])
+@require_identity('customer')
+def mark_customer_chat_read(shop_id, customer_id):
+    """Body (optional): {"last_message_id"} -- the newest message the customer has seen."""
+    try:
+        last_message_id = (request.get_json(silent=True) or {}).get('last_message_id')
+        if last_message_id is not None and not isinstance(last_message_id, int):
+            return jsonify(error="last_message_id must be an integer"), 400
+        unread = mark_conversation_read(shop_id, customer_id, 'customer', last_message_id)
+        if unread is None:
+            return jsonify(error="Conversation not found"), 404
+        return jsonify(unread=unread), 200
+    except Exception as e:
+        return jsonify(error=str(e)), 500
+
+@bp.route('/chat/unread/<int:customer_id>', methods=['GET'])
+@require_identity('customer')
+def get_customer_unread(customer_id):
+    """Unread message counts per shop, for badges."""
+    try:
+        return jsonify(unread=get_customer_unread_counts(customer_id)), 200
     except Exception as e:
         return jsonify(error=str(e)), 500
 
 @bp.route('/order/<int:order_id>/rate', methods=['POST'])
+@require_identity('customer')
 def submit_rating(order_id):
     data = request.get_json()
-    customer_id = data.get('customer_id')
+    customer_id = g.identity['user_id']
     rating = data.get('rating')
     review_text = data.get('review_text', '')
 
@@ -107,4 +225,13 @@ def submit_rating(order_id):
         else:
             return jsonify(error="Failed to submit rating. Order may not be delivered or does not belong to user."), 403
     except Exception as e:
-        return jsonify(error=str(e)), 500
\ No newline at end of file
+        return jsonify(error=str(e)), 500
+
+@bp.route('/shops/<int:shop_id>/presence', methods=['GET'])
+def get_shop_presence(shop_id):
+    """
+    Whether the shop has a shopkeeper connected to chat, and on how many tabs.
+    """
+    presence = get_presence()
+    sessions = presence.shop_session_count(shop_id)
+    return jsonify(shop_id=shop_id, online=sessions > 0, sessions=sessions), 200
\ No newline at end of file
@@ -1,41 +1,256 @@
+import os
 import sqlite3
-from flask import current_app, g
+import threading
+import time
+from collections import deque
+from urllib.request import pathname2url
+from flask import current_app, g, request, has_request_context
+from .metrics import count_statement
+from .sqltrace import TracingConnection
 
-def get_db():
+# Requests with these methods never write, so they are served from the read-only pool
+READ_ONLY_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class PoolTimeoutError(sqlite3.OperationalError):
+    """Raised when no pooled connection became free within DB_POOL_TIMEOUT."""
+
+
+class ConnectionPool:
+    """
+    A small bounded pool of sqlite3 connections.
+
+    Idle connections are kept open and handed to the next request instead of
+    being closed at teardown. Connections are created with
+    check_same_thread=False because under eventlet (and the threaded dev
+    server) the greenlet/thread that returns a connection is not necessarily
+    the one that picks it up next. A connection is only ever used by one
+    holder at a time, which is what makes that safe.
+    """
+
+    def __init__(self, db_path, size, timeout, read_only=False, pragmas=(), tracer=None):
+        self.db_path = db_path
+        self.size = size
+        self.timeout = timeout
+        self.read_only = read_only
+        self.pragmas = pragmas
+        # An SqlTracer (sqltrace.py) when DB_TRACE is on
+        self.tracer = tracer
+        self._idle = deque()
+        self._open = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._stats = {
+            'checkouts': 0,
+            'hits': 0,       # served from an idle connection
+            'misses': 0,     # had to open a new connection
+            'waits': 0,      # pool was exhausted and the caller had to wait
+            'wait_time': 0.0,
+            'timeouts': 0,
+        }
+
+    def _connect(self):
+        factory = TracingConnection if self.tracer is not None else sqlite3.Connection
+        if self.read_only:
+            uri = 'file:{}?mode=ro'.format(pathname2url(os.path.abspath(self.db_path)))
+            conn = sqlite3.connect(
+                uri, uri=True,
+                detect_types=sqlite3.PARSE_DECLTYPES,
+                check_same_thread=False,
+                factory=factory
+            )
+        else:
+            conn = sqlite3.connect(
+                self.db_path,
+                detect_types=sqlite3.PARSE_DECLTYPES,
+                check_same_thread=False,
+                factory=factory
+            )
+        if self.tracer is not None:
+            conn.tracer = self.tracer
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas:
+            conn.execute(f"PRAGMA {name} = {value}")
+        if self.read_only:
+            conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    def acquire(self):
+        with self._cond:
+            if self._closed:
+                raise sqlite3.ProgrammingError("Connection pool is closed")
+            self._stats['checkouts'] += 1
+            if not self._idle and self._open >= self.size:
+                self._stats['waits'] += 1
+                started = time.monotonic()
+                ready = self._cond.wait_for(
+                    lambda: self._idle or self._open < self.size,
+                    timeout=self.timeout
+                )
+                self._stats['wait_time'] += time.monotonic() - started
+                if not ready:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeoutError(
+                        f"No database connection available after {self.timeout}s"
+                    )
+            if self._idle:
+                self._stats['hits'] += 1
+                return self._idle.pop()
+            # Reserve the slot before connecting so other callers see it as taken
+            self._open += 1
+            self._stats['misses'] += 1
+
+        try:
+            return self._connect()
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, conn, discard=False):
+        # Never hand a connection with a half-finished transaction to the next request
+        if not discard:
+            try:
+                if conn.in_transaction:
+                    conn.rollback()
+            except sqlite3.Error:
+                discard = True
+
+        with self._cond:
+            if discard or self._closed:
+                self._open -= 1
+                conn.close()
+            else:
+                self._idle.append(conn)
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                self._idle.pop().close()
+                self._open -= 1
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats['size'] = self.size
+            stats['open'] = self._open
+            stats['idle'] = len(self._idle)
+            stats['in_use'] = self._open - len(self._idle)
+        checkouts = stats['checkouts']
+        stats['hit_ratio'] = round(stats['hits'] / checkouts, 4) if checkouts else 0.0
+        stats['wait_time'] = round(stats['wait_time'], 4)
+        return stats
+
+
+def _pragmas(config):
+    return (
+        ('busy_timeout', int(config['DB_POOL_TIMEOUT'] * 1000)),
+        ('synchronous', config['DB_SYNCHRONOUS']),
+        # A negative cache_size is interpreted by SQLite as KiB rather than pages
+        ('cache_size', -int(config['DB_CACHE_SIZE_KB'])),
+        ('mmap_size', int(config['DB_MMAP_SIZE'])),
+        ('temp_store', 'MEMORY'),
+    )
+
+
+def get_pool(read_only=False, app=None):
     """
-    Connects to the database and returns the connection object.
+    Returns the write or read-only pool for the app, creating it on first use.
+    Pools are created lazily so that init_db.py can build the app before the
+    database file exists.
+    """
+    app = app or current_app._get_current_object()
+    pools = app.extensions['db_pools']
+    name = 'read' if read_only else 'write'
+    pool = pools.get(name)
+    if pool is None:
+        with app.extensions['db_pools_lock']:
+            pool = pools.get(name)
+            if pool is None:
+                if read_only:
+                    # journal_mode is persisted in the file, but only a writable
+                    # connection can switch it, so make sure WAL is on first.
+                    get_pool(read_only=False, app=app)
+                pool = _create_pool(app, read_only)
+                pools[name] = pool
+    return pool
+
+
+def _create_pool(app, read_only):
+    config = app.config
+    db_path = config['DATABASE_PATH']
+    if read_only:
+        size = config['DB_READ_POOL_SIZE']
+    else:
+        size = config['DB_POOL_SIZE']
+    pool = ConnectionPool(
+        db_path, size, config['DB_POOL_TIMEOUT'], read_only, _pragmas(config),
+        tracer=app.extensions.get('sql_tracer')
+    )
+
+    if not read_only:
+        conn = pool.acquire()
+        try:
+            conn.execute("PRAGMA journal_mode = WAL")
+        finally:
+            pool.release(conn)
+    return pool
+
+
+def get_db(read_only=None):
+    """
+    Checks a connection out of the pool and returns it.
     Stores the connection in the application context 'g' to reuse it
     within the same request.
+
+    By default GET/HEAD/OPTIONS requests get a connection from the read-only
+    pool; pass read_only=False to force a writable connection.
     """
-    if 'db' not in g:
-        # Get the database path from the app config
-        db_path = current_app.config['DATABASE_PATH']
-        
-        # Connect to the SQLite database
-        # detect_types=sqlite3.PARSE_DECLTYPES allows parsing of declared types
-        g.db = sqlite3.connect(
-            db_path,
-            detect_types=sqlite3.PARSE_DECLTYPES
-        )
-        # Set row_factory to sqlite3.Row to get results as dictionaries
-        g.db.row_factory = sqlite3.Row
-
-    return g.db
+    if read_only is None:
+        read_only = has_request_context() and request.method in READ_ONLY_METHODS
+
+    key = 'db_ro' if read_only else 'db'
+    if key not in g:
+        pool = get_pool(read_only)
+        conn = pool.acquire()
+        if 'metrics' in current_app.extensions:
+            # Per-request SQL statement count for /metrics (see metrics.py)
+            conn.set_trace_callback(count_statement)
+        setattr(g, key, conn)
+        g.setdefault('db_checkouts', []).append((pool, conn))
+
+    return getattr(g, key)
 
 def close_db(e=None):
     """
-    Closes the database connection if it exists.
+    Returns the request's connections to their pools.
     This function is automatically called by Flask at the end of each request.
     """
-    db = g.pop('db', None)
+    g.pop('db', None)
+    g.pop('db_ro', None)
+    for pool, conn in g.pop('db_checkouts', []):
+        conn.set_trace_callback(None)
+        pool.release(conn)
+
+def pool_stats(app=None):
+    app = app or current_app._get_current_object()
+    return {name: pool.stats() for name, pool in app.extensions['db_pools'].items()}
 
-    if db is not None:
-        db.close()
+def close_pools(app):
+    for pool in app.extensions['db_pools'].values():
+        pool.close()
+    app.extensions['db_pools'].clear()
 
 def init_app(app):
     """
-    Registers the close_db function with the Flask app.
-    It will be called after each request.
+    Sets up the connection pools and registers the close_db function with
+    the Flask app. It will be called after each request.
     """
+    app.extensions['db_pools'] = {}
+    app.extensions['db_pools_lock'] = threading.RLock()
     # 'teardown_appcontext' calls this function when the app context ends
-    app.teardown_appcontext(close_db)
\ No newline at end of file
+    app.teardown_appcontext(close_db)
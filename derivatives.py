@@ -0,0 +1,133 @@
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from .offload import run_native
+
+try:
+    from PIL import Image, features
+except ImportError:  # listed in requirements.txt; without it only the originals are served
+    Image = None
+
+# Resized versions of stored images (order snapshots, uploaded cake photos).
+#
+# Canvas snapshots are full-resolution PNGs; list and detail views only need
+# a few hundred pixels. When an image is stored, its variants are queued on a
+# small worker pool and written next to the blob store. Variant URLs are
+# handed out straight away: until a variant exists, the media route serves
+# the original instead, so clients never see a broken image.
+
+VARIANTS = {'thumb': 160, 'medium': 640}  # name -> max width in pixels
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+
+
+def render_variants(data):
+    """
+    Returns [(variant, bytes, extension)] for an image's raw bytes. Images
+    are never upscaled; WebP is used when Pillow was built with it, else
+    JPEG on a white background.
+    """
+    use_webp = features.check('webp')
+    rendered = []
+    with Image.open(io.BytesIO(data)) as source:
+        source.load()
+        has_alpha = source.mode in ('RGBA', 'LA') or (source.mode == 'P' and 'transparency' in source.info)
+        image = source.convert('RGBA' if has_alpha else 'RGB')
+        for variant, width in VARIANTS.items():
+            resized = image
+            if image.width > width:
+                height = max(1, round(image.height * width / image.width))
+                resized = image.resize((width, height), Image.LANCZOS)
+            out = io.BytesIO()
+            if use_webp:
+                resized.save(out, 'WEBP', quality=WEBP_QUALITY, method=4)
+                extension = '.webp'
+            else:
+                if resized.mode == 'RGBA':
+                    background = Image.new('RGB', resized.size, (255, 255, 255))
+                    background.paste(resized, mask=resized.getchannel('A'))
+                    resized = background
+                resized.save(out, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+                extension = '.jpg'
+            rendered.append((variant, out.getvalue(), extension))
+    return rendered
+
+
+class DerivativePipeline:
+    """
+    Queues variant generation for blob refs on a fixed-size thread pool.
+    A ref that is already queued, or whose variants all exist, is skipped.
+    """
+
+    def __init__(self, store, workers=2):
+        self.store = store
+        self.enabled = Image is not None
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='derivatives') if self.enabled else None
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._stats = {'queued': 0, 'built': 0, 'skipped': 0, 'errors': 0}
+
+    def has_variants(self, ref):
+        return all(self.store.find_variant(ref, variant) for variant in VARIANTS)
+
+    def submit(self, ref):
+        """Queues ref for processing. Returns the future, or None if nothing was queued."""
+        if not self.enabled or not ref:
+            return None
+        with self._lock:
+            if ref in self._pending:
+                return None
+            if self.has_variants(ref):
+                self._stats['skipped'] += 1
+                return None
+            self._pending.add(ref)
+            self._stats['queued'] += 1
+        return self._executor.submit(self._build, ref)
+
+    def build(self, ref):
+        """Generates ref's variants in the calling thread (backfills)."""
+        if not self.enabled or self.has_variants(ref):
+            return False
+        return self._build(ref)
+
+    def _build(self, ref):
+        try:
+            with open(self.store.path(ref), 'rb') as f:
+                data = f.read()
+            # Under eventlet the pool's threads are green; resize on a real one
+            for variant, payload, extension in run_native(render_variants, data):
+                self.store.put_variant(ref, variant, payload, extension)
+            with self._lock:
+                self._stats['built'] += 1
+            return True
+        except Exception as e:
+            print(f"Could not build image variants for {ref}: {e}")
+            with self._lock:
+                self._stats['errors'] += 1
+            return False
+        finally:
+            with self._lock:
+                self._pending.discard(ref)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['pending'] = len(self._pending)
+        stats['enabled'] = self.enabled
+        return stats
+
+
+def get_derivatives():
+    return current_app.extensions['derivatives']
+
+def init_app(app):
+    if Image is None:
+        print("Warning: Pillow is not installed; image variants are disabled and the originals are served.")
+    app.extensions['derivatives'] = DerivativePipeline(
+        app.extensions['blob_store'], app.config['IMAGE_VARIANT_WORKERS']
+    )
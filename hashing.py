@@ -0,0 +1,85 @@
+import threading
+import time
+from flask import current_app
+from .offload import run_native
+
+
+class HasherBusyError(RuntimeError):
+    """Too many hashes are already running or waiting; the caller should retry later."""
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt off the event loop with bounded concurrency.
+
+    At most `workers` hashes run at once (each on a native thread, see
+    offload.py); up to `max_queue` more may wait for a slot. Anything beyond
+    that is refused with HasherBusyError instead of piling up, so a burst of
+    logins degrades into fast 503s rather than a stalled worker.
+
+    The cost is BCRYPT_LOG_ROUNDS. Hashes made with a different cost are
+    reported by needs_rehash(), and login replaces them transparently.
+    """
+
+    def __init__(self, bcrypt, rounds=12, workers=4, max_queue=64):
+        self.bcrypt = bcrypt
+        self.rounds = rounds
+        self.max_in_flight = workers + max_queue
+        self._slots = threading.BoundedSemaphore(workers)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._stats = {'hashed': 0, 'verified': 0, 'rejected': 0, 'hash_ms_total': 0.0}
+
+    def _run(self, kind, fn, *args):
+        with self._lock:
+            if self._in_flight >= self.max_in_flight:
+                self._stats['rejected'] += 1
+                raise HasherBusyError("Password service is busy, please retry")
+            self._in_flight += 1
+        try:
+            with self._slots:
+                started = time.perf_counter()
+                result = run_native(fn, *args)
+                elapsed_ms = (time.perf_counter() - started) * 1000
+            with self._lock:
+                self._stats[kind] += 1
+                self._stats['hash_ms_total'] += elapsed_ms
+            return result
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def hash(self, password):
+        return self._run('hashed', self.bcrypt.generate_password_hash, password, self.rounds).decode('utf-8')
+
+    def verify(self, password_hash, password):
+        return self._run('verified', self.bcrypt.check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        # $2b$<cost>$<salt+hash>
+        try:
+            return int(password_hash.split('$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = self._in_flight
+        done = stats['hashed'] + stats['verified']
+        stats['hash_ms_avg'] = round(stats.pop('hash_ms_total') / done, 3) if done else 0.0
+        stats['rounds'] = self.rounds
+        stats['max_in_flight'] = self.max_in_flight
+        return stats
+
+
+def get_hasher():
+    return current_app.extensions['password_hasher']
+
+def init_app(app, bcrypt):
+    app.extensions['password_hasher'] = PasswordHasher(
+        bcrypt,
+        rounds=app.config['BCRYPT_LOG_ROUNDS'],
+        workers=app.config['PASSWORD_HASH_WORKERS'],
+        max_queue=app.config['PASSWORD_HASH_MAX_QUEUE'],
+    )
@@ -0,0 +1,146 @@
+import gzip
+import hashlib
+import os
+import threading
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:  # listed in requirements.txt; gzip is always available
+    brotli = None
+
+# App-wide response layer for the JSON API.
+#
+# Every successful GET gets a strong ETag (a hash of the body unless the
+# route already set a cheaper one) and "Cache-Control: no-cache", so
+# browsers revalidate with If-None-Match and get an empty 304 when nothing
+# changed. Bodies above COMPRESS_MIN_SIZE are brotli- or gzip-encoded.
+#
+# Routes that can tell what version of the data they would return (catalog
+# versions, an order's mutable columns) call not_modified() first and skip
+# the model query entirely on a match.
+
+ENCODING_SUFFIXES = {'br': '-br', 'gzip': '-gz'}
+# Version tags are only comparable within one process lifetime
+PROCESS_EPOCH = os.urandom(4).hex()
+
+
+def version_etag(*parts):
+    """A strong ETag built from version numbers rather than the body."""
+    return '-'.join([PROCESS_EPOCH] + [str(part) for part in parts])
+
+def fingerprint_etag(*parts):
+    """A strong ETag from data that identifies a version (e.g. mutable columns)."""
+    return hashlib.blake2b(repr(parts).encode('utf-8'), digest_size=12).hexdigest()
+
+def _client_etags():
+    """The If-None-Match tags, with our content-encoding suffixes removed."""
+    tags = set()
+    for tag in request.if_none_match.as_set():
+        for suffix in ENCODING_SUFFIXES.values():
+            if tag.endswith(suffix):
+                tag = tag[:-len(suffix)]
+                break
+        tags.add(tag)
+    return tags
+
+def not_modified(etag):
+    """
+    Returns a 304 response if the client already has `etag`, else None.
+    On a miss the etag is remembered and applied to the eventual response.
+    """
+    if etag in _client_etags():
+        get_http_cache().count('early_304')
+        response = current_app.response_class(status=304)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.vary.add('Accept-Encoding')
+        return response
+    request.environ['cakemosaic.etag'] = etag
+    return None
+
+
+class HttpCache:
+    def __init__(self, min_size=1024, gzip_level=6, brotli_quality=5, mimetypes=('application/json',)):
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.mimetypes = set(mimetypes)
+        self._lock = threading.Lock()
+        self._stats = {'early_304': 0, 'late_304': 0, 'compressed': 0, 'bytes_in': 0, 'bytes_out': 0}
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def _encoding(self):
+        accepted = request.accept_encodings
+        if brotli is not None and accepted['br']:
+            return 'br'
+        if accepted['gzip']:
+            return 'gzip'
+        return None
+
+    def _compress(self, data, encoding):
+        if encoding == 'br':
+            return brotli.compress(data, quality=self.brotli_quality)
+        return gzip.compress(data, compresslevel=self.gzip_level)
+
+    def process(self, response):
+        """after_request hook."""
+        if (request.method not in ('GET', 'HEAD') or response.status_code != 200
+                or response.direct_passthrough or response.is_streamed
+                or response.mimetype not in self.mimetypes
+                or 'Content-Encoding' in response.headers):
+            return response
+
+        data = response.get_data()
+        etag = request.environ.get('cakemosaic.etag') or hashlib.blake2b(data, digest_size=16).hexdigest()
+        response.headers.setdefault('Cache-Control', 'private, no-cache')
+        response.vary.add('Accept-Encoding')
+        if 'Authorization' in request.headers:
+            response.vary.add('Authorization')
+
+        if etag in _client_etags():
+            self.count('late_304')
+            not_modified_response = current_app.response_class(status=304)
+            not_modified_response.set_etag(etag)
+            for header in ('Cache-Control', 'Vary'):
+                not_modified_response.headers[header] = response.headers[header]
+            return not_modified_response
+
+        encoding = self._encoding() if len(data) >= self.min_size else None
+        if encoding is None:
+            response.set_etag(etag)
+            return response
+
+        compressed = self._compress(data, encoding)
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        # A different representation needs a different strong ETag
+        response.set_etag(etag + ENCODING_SUFFIXES[encoding])
+        with self._lock:
+            self._stats['compressed'] += 1
+            self._stats['bytes_in'] += len(data)
+            self._stats['bytes_out'] += len(compressed)
+        return response
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['brotli'] = brotli is not None
+        stats['ratio'] = round(stats['bytes_out'] / stats['bytes_in'], 4) if stats['bytes_in'] else 0.0
+        return stats
+
+
+def get_http_cache():
+    return current_app.extensions['http_cache']
+
+def init_app(app):
+    cache = HttpCache(
+        min_size=app.config['COMPRESS_MIN_SIZE'],
+        gzip_level=app.config['COMPRESS_GZIP_LEVEL'],
+        brotli_quality=app.config['COMPRESS_BROTLI_QUALITY'],
+    )
+    app.extensions['http_cache'] = cache
+    app.after_request(cache.process)
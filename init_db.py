@@ -1,50 +1,272 @@
 import sqlite3
 import os
+import sys
+import argparse
+import tempfile
 from app import create_app
 from app.config import Config
+from app.migrations import migrate, current_version
+from app.blobstore import BlobStore, migrate_snapshot_images
+from app.derivatives import DerivativePipeline
+from app.rollups import rebuild_rollups
 
 # Create a minimal app instance to get the config
 app = create_app()
 
-def initialize_database():
+# Get the path to the schema.sql file
+# This assumes 'schema.sql' is in the same 'backend' directory
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), 'schema.sql')
+
+# A keyset cursor newer than any fixture row, so paged queries return data
+PLAN_CHECK_CURSOR = ('2100-01-01 00:00:00', 1000000)
+
+# Read paths in models.py and the sample arguments used to trace their SQL
+# for --check-plans. Add new model queries here.
+PLAN_CHECKS = [
+    ('get_user_by_email', ('someone@example.com',)),
+    ('get_user_by_id', (1,)),
+    ('get_all_cakes', ()),
+    ('get_all_cakes', (True,)),
+    ('search_cakes', ()),
+    ('search_cakes', ('"spon"*', ['round'], [1], 5.0, 50.0)),
+    ('search_cakes', ('"spon"*', (), (), None, None, 'price_asc')),
+    ('get_cake_details', (1,)),
+    ('load_catalog', (None, None, [1, 2])),
+    ('get_all_cakes_with_flavors', (1,)),
+    ('get_catalog_export_rows', (1,)),
+    ('get_orders_by_customer', (1,)),
+    ('get_orders_by_customer', (1, 50, PLAN_CHECK_CURSOR)),
+    ('get_all_shop_orders', (1,)),
+    ('get_all_shop_orders', (1, 50, PLAN_CHECK_CURSOR)),
+    ('get_all_shop_orders', (1, 50, PLAN_CHECK_CURSOR, 'Delivered', '2000-01-01', '2100-01-01')),
+    ('get_order_details', (1, 1)),
+    ('get_shop_order_details', (1, 1)),
+    ('get_order_version', (1, 1)),
+    ('get_order_version', (1, None, 1)),
+    ('get_analytics_data', (1,)),
+    ('get_chat_history', (1, 1)),
+    ('get_chat_history', (1, 1, 50, PLAN_CHECK_CURSOR)),
+    ('get_shop_inbox', (1,)),
+    ('get_shop_inbox', (1, 50, PLAN_CHECK_CURSOR)),
+    ('get_customer_unread_counts', (1,)),
+    ('get_shop_reviews', (1,)),
+    ('get_shop_reviews', (1, 50, PLAN_CHECK_CURSOR)),
+    ('get_order_export_rows', (1,)),
+    ('get_order_export_rows', (1, 'Delivered', '2000-01-01', '2100-01-01')),
+    ('get_review_export_rows', (1, '2000-01-01', '2100-01-01')),
+]
+
+# One row per table so every branch of the read paths actually runs
+PLAN_CHECK_FIXTURES = """
+INSERT INTO users (id, email, password_hash, role, shop_id) VALUES (1, 'someone@example.com', 'x', 'shopkeeper', 1);
+INSERT INTO shops (id, owner_id, shop_name) VALUES (1, 1, 'Plan Check Bakery');
+INSERT INTO cakes (id, shop_id, name, base_price, shape) VALUES (1, 1, 'Sponge', 10.0, 'round');
+INSERT INTO flavors (cake_id, name, color_hex) VALUES (1, 'Vanilla', '#ffffff');
+INSERT INTO orders (id, customer_id, shop_id, total_price, status, rating) VALUES (1, 1, 1, 10.0, 'Delivered', 5);
+INSERT INTO order_items (order_id, cake_id, size, price) VALUES (1, 1, 'small', 10.0);
+INSERT INTO chat_messages (shop_id, customer_id, sender_id, message) VALUES (1, 1, 1, 'hello');
+"""
+
+# Model functions that are expected to read a whole table (e.g. the
+# cross-shop catalog listing). FTS5 lookups also show up as "SCAN ...
+# VIRTUAL TABLE INDEX", which is the index.
+FULL_SCAN_ALLOWED = {'get_all_cakes', 'search_cakes'}
+
+def create_schema(connection):
+    # Open and read the schema.sql file
+    with open(SCHEMA_PATH, 'r') as f:
+        schema_sql = f.read()
+
+    # Execute the SQL commands in the schema file
+    connection.executescript(schema_sql)
+    connection.execute("PRAGMA user_version = 0")
+    connection.commit()
+
+def initialize_database(reset=False):
     """
-    Initializes the database by executing the schema.sql file.
+    Brings the database up to date without touching existing data: the base
+    schema is only created when the database is empty, then any pending
+    migrations are applied. With reset=True the tables are dropped and
+    recreated first (the old behaviour of this script).
     """
     # Get the database path from the config
     db_path = Config.DATABASE_PATH
-    
-    # Get the path to the schema.sql file
-    # This assumes 'schema.sql' is in the same 'backend' directory
-    schema_path = os.path.join(os.path.dirname(__file__), 'schema.sql')
 
     print(f"Database path: {db_path}")
-    print(f"Schema path: {schema_path}")
+    print(f"Schema path: {SCHEMA_PATH}")
 
     # Connect to the database (this will create the file if it doesn't exist)
     # It also creates the 'instance' folder if needed
     os.makedirs(os.path.dirname(db_path), exist_ok=True)
-    
+
+    connection = None
     try:
         connection = sqlite3.connect(db_path)
         print("Database connection established.")
 
-        # Open and read the schema.sql file
-        with open(schema_path, 'r') as f:
-            schema_sql = f.read()
-        
-        # Execute the SQL commands in the schema file
-        connection.executescript(schema_sql)
-        connection.commit()
-        print("Database schema successfully initialized.")
+        has_schema = connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'users'"
+        ).fetchone()
+        if reset or not has_schema:
+            create_schema(connection)
+            print("Database schema successfully initialized.")
+
+        applied = migrate(connection)
+        print(f"Schema version {current_version(connection)} ({len(applied)} migration(s) applied).")
 
     except sqlite3.Error as e:
         print(f"An error occurred: {e}")
+        return False
     finally:
         if connection:
             connection.close()
             print("Database connection closed.")
+    return True
+
+def move_snapshots_to_blob_store():
+    """
+    One-shot: moves inline snapshot data URLs from order_items into the blob
+    store. Run after the migrations have added order_items.snapshot_ref.
+    """
+    connection = sqlite3.connect(Config.DATABASE_PATH)
+    try:
+        moved = migrate_snapshot_images(connection, BlobStore(Config.BLOB_STORE_PATH))
+        print(f"Moved {moved} snapshot(s) to {Config.BLOB_STORE_PATH}.")
+        if moved:
+            print("Run VACUUM on the database to reclaim the space they used.")
+    except sqlite3.Error as e:
+        print(f"An error occurred: {e}")
+        return False
+    finally:
+        connection.close()
+    return True
+
+def build_image_variants():
+    """
+    Backfill: generates the thumbnail/medium variants for every stored order
+    snapshot and cake image that does not have them yet. Needs Pillow.
+    """
+    pipeline = DerivativePipeline(BlobStore(Config.BLOB_STORE_PATH), workers=1)
+    if not pipeline.enabled:
+        print("Pillow is not installed; install it to build image variants.")
+        return False
+    connection = sqlite3.connect(Config.DATABASE_PATH)
+    try:
+        refs = [row[0] for row in connection.execute(
+            "SELECT snapshot_ref FROM order_items WHERE snapshot_ref IS NOT NULL"
+            " UNION SELECT image_ref FROM cakes WHERE image_ref IS NOT NULL"
+        )]
+    except sqlite3.Error as e:
+        print(f"An error occurred: {e}")
+        return False
+    finally:
+        connection.close()
+    built = sum(1 for ref in refs if pipeline.build(ref))
+    print(f"Built variants for {built} of {len(refs)} image(s).")
+    return True
+
+def rebuild_analytics_rollups(shop_id=None):
+    """
+    Recomputes the analytics rollup tables from orders (all shops, or one).
+    """
+    connection = sqlite3.connect(Config.DATABASE_PATH)
+    try:
+        rebuild_rollups(connection, shop_id)
+        connection.commit()
+        print(f"Analytics rollups rebuilt for {'all shops' if shop_id is None else f'shop {shop_id}'}.")
+    except sqlite3.Error as e:
+        connection.rollback()
+        print(f"An error occurred: {e}")
+        return False
+    finally:
+        connection.close()
+    return True
+
+def check_query_plans():
+    """
+    Builds a scratch database from schema.sql plus all migrations, runs every
+    read path in PLAN_CHECKS while tracing the SQL it issues, and runs
+    EXPLAIN QUERY PLAN on each statement. Any full table scan that is not in
+    FULL_SCAN_ALLOWED is reported as a regression.
+    """
+    from app import models
+    from app.db import get_db, close_pools
+
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, 'plan_check.db')
+        connection = sqlite3.connect(db_path)
+        create_schema(connection)
+        migrate(connection)
+        connection.executescript(PLAN_CHECK_FIXTURES)
+        connection.close()
+
+        class PlanCheckConfig(Config):
+            DATABASE_PATH = db_path
+
+        plan_app = create_app(PlanCheckConfig)
+        with plan_app.app_context():
+            db = get_db()
+            for name, args in PLAN_CHECKS:
+                statements = []
+                db.set_trace_callback(statements.append)
+                try:
+                    getattr(models, name)(*args)
+                finally:
+                    db.set_trace_callback(None)
+
+                for sql in statements:
+                    if not sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+                        continue
+                    plan = db.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+                    scans = [
+                        row['detail'] for row in plan
+                        if row['detail'].startswith('SCAN ')
+                        and not row['detail'].startswith(('SCAN CONSTANT ROW', 'SCAN (subquery'))
+                    ]
+                    status = 'ok'
+                    if scans and name not in FULL_SCAN_ALLOWED:
+                        status = 'SCAN'
+                        failures.append((name, sql, scans))
+                    print(f"[{status}] {name}: {' | '.join(row['detail'] for row in plan)}")
+        close_pools(plan_app)
+
+    if failures:
+        print(f"\n{len(failures)} statement(s) regressed to a table scan:")
+        for name, sql, scans in failures:
+            print(f"  {name}: {' '.join(sql.split())}")
+            for detail in scans:
+                print(f"    -> {detail}")
+        return False
+    print("\nAll model queries use an index.")
+    return True
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Create or migrate the CakeMosaic database.")
+    parser.add_argument('--reset', action='store_true',
+                        help="drop all tables and recreate them (destroys data)")
+    parser.add_argument('--check-plans', action='store_true',
+                        help="fail if any model query plans a full table scan")
+    parser.add_argument('--migrate-snapshots', action='store_true',
+                        help="move inline order snapshots into the blob store")
+    parser.add_argument('--build-variants', action='store_true',
+                        help="generate resized variants for stored images")
+    parser.add_argument('--rebuild-rollups', action='store_true',
+                        help="recompute the analytics rollup tables from orders")
+    parser.add_argument('--shop', type=int, default=None,
+                        help="limit --rebuild-rollups to one shop")
+    args = parser.parse_args()
+
     # Run this function directly when the script is executed
     with app.app_context():
-        initialize_database()
\ No newline at end of file
+        if args.check_plans:
+            ok = check_query_plans()
+        elif args.migrate_snapshots:
+            ok = initialize_database() and move_snapshots_to_blob_store()
+        elif args.build_variants:
+            ok = initialize_database() and build_image_variants()
+        elif args.rebuild_rollups:
+            ok = initialize_database() and rebuild_analytics_rollups(args.shop)
+        else:
+            ok = initialize_database(reset=args.reset)
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,64 @@
+from flask import Blueprint, jsonify, send_file
+from app.blobstore import get_blob_store
+from app.derivatives import VARIANTS
+
+bp = Blueprint('media', __name__)
+
+# Blobs are content-addressed, so a given URL never changes its content
+BLOB_MAX_AGE = 365 * 24 * 60 * 60
+
+@bp.route('/blobs/<ref>', methods=['GET'])
+def get_blob(ref):
+    """
+    Streams a stored blob. send_file with conditional=True answers
+    If-None-Match with 304 and serves Range requests with 206.
+    """
+    store = get_blob_store()
+    try:
+        path = store.path(ref)
+    except ValueError:
+        return jsonify(error="Blob not found"), 404
+    if not store.exists(ref):
+        return jsonify(error="Blob not found"), 404
+
+    response = send_file(
+        path,
+        mimetype=store.content_type(ref),
+        conditional=True,
+        etag=ref.split('.')[0],
+        max_age=BLOB_MAX_AGE
+    )
+    response.cache_control.immutable = True
+    response.cache_control.public = True
+    return response
+
+@bp.route('/blobs/<ref>/<variant>', methods=['GET'])
+def get_blob_variant(ref, variant):
+    """
+    Serves a resized variant ('thumb' or 'medium') of a stored image. While
+    the variant is still being generated (or Pillow is not installed) the
+    original is served with a short max-age, so the URL always works and
+    the browser picks up the small version later.
+    """
+    store = get_blob_store()
+    if variant not in VARIANTS:
+        return jsonify(error="Unknown variant"), 404
+    try:
+        path = store.find_variant(ref, variant)
+    except ValueError:
+        return jsonify(error="Blob not found"), 404
+    if path is None:
+        if not store.exists(ref):
+            return jsonify(error="Blob not found"), 404
+        return send_file(store.path(ref), mimetype=store.content_type(ref), conditional=True, max_age=60)
+
+    response = send_file(
+        path,
+        mimetype=store.content_type(path),
+        conditional=True,
+        etag=f"{ref.split('.')[0]}-{variant}",
+        max_age=BLOB_MAX_AGE
+    )
+    response.cache_control.immutable = True
+    response.cache_control.public = True
+    return response
@@ -0,0 +1,254 @@
+import functools
+import threading
+import time
+from bisect import bisect_left
+from flask import current_app, g, request, abort
+
+# Request and Socket.IO metrics in the Prometheus text format.
+#
+# A before/after_request pair times every request and records, per Flask
+# endpoint ("customer.get_cakes", "shopkeeper.update_orders_status", ...):
+#
+#   cakemosaic_http_request_duration_seconds   histogram {endpoint, method}
+#   cakemosaic_http_responses_total            counter   {endpoint, method, status}
+#   cakemosaic_http_response_size_bytes        histogram {endpoint}  (sized bodies only)
+#   cakemosaic_http_request_sql_statements     histogram {endpoint}
+#
+# Socket.IO handlers wrapped in timed_event() feed
+# cakemosaic_socketio_event_duration_seconds {event, outcome}. The numeric
+# counters from /api/stats are exported as cakemosaic_component_stat gauges.
+#
+# Labels are endpoint names, never raw paths, so the number of series stays
+# bounded; unmatched URLs share endpoint="unmatched". SQL statements are
+# counted by a trace callback that db.get_db() installs on request
+# connections. Recording takes one lock per request and a few bisects.
+# Streamed responses (exports) are timed up to the point the body starts.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+SQL_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500)
+LOCAL_ADDRS = ('127.0.0.1', '::1', 'localhost')
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+PREFIX = 'cakemosaic_'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Fixed-bucket histogram keyed by label values. Not locked itself; Metrics holds the lock."""
+
+    def __init__(self, name, help_text, labelnames, buckets):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [per-bucket counts (last one is +Inf), sum]
+
+    def observe(self, labels, value):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        # Prometheus buckets are inclusive upper bounds (value <= le)
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def snapshot(self):
+        return {labels: (list(counts), total) for labels, (counts, total) in self._series.items()}
+
+    def render(self, snapshot):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for labels in sorted(snapshot):
+            counts, total = snapshot[labels]
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = 'le="{}"'.format(_number(bound))
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, labels)} {cumulative}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self._series = {}
+
+    def inc(self, labels, amount=1):
+        self._series[labels] = self._series.get(labels, 0) + amount
+
+    def snapshot(self):
+        return dict(self._series)
+
+    def render(self, snapshot):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for labels in sorted(snapshot):
+            lines.append(f'{self.name}{_labels(self.labelnames, labels)} {snapshot[labels]}')
+        return lines
+
+
+class Metrics:
+    def __init__(self, stats_source=None):
+        # stats_source: optional callable returning the nested /api/stats dict
+        self.stats_source = stats_source
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.request_duration = Histogram(
+            PREFIX + 'http_request_duration_seconds', 'Time spent handling HTTP requests.',
+            ('endpoint', 'method'), LATENCY_BUCKETS)
+        self.responses = Counter(
+            PREFIX + 'http_responses_total', 'HTTP responses by status code.',
+            ('endpoint', 'method', 'status'))
+        self.response_size = Histogram(
+            PREFIX + 'http_response_size_bytes', 'Size of HTTP response bodies as sent (after compression).',
+            ('endpoint',), SIZE_BUCKETS)
+        self.sql_statements = Histogram(
+            PREFIX + 'http_request_sql_statements', 'SQL statements executed per HTTP request.',
+            ('endpoint',), SQL_BUCKETS)
+        self.event_duration = Histogram(
+            PREFIX + 'socketio_event_duration_seconds', 'Time spent in Socket.IO event handlers.',
+            ('event', 'outcome'), LATENCY_BUCKETS)
+        self._collectors = (
+            self.request_duration, self.responses, self.response_size,
+            self.sql_statements, self.event_duration,
+        )
+
+    def start_request(self):
+        """before_request hook."""
+        g.metrics_started = time.perf_counter()
+        g.sql_statements = 0
+
+    def finish_request(self, response):
+        """after_request hook."""
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        endpoint = request.endpoint or 'unmatched'
+        method = request.method
+        size = None if response.is_streamed else response.calculate_content_length()
+        statements = g.get('sql_statements', 0)
+        with self._lock:
+            self.request_duration.observe((endpoint, method), elapsed)
+            self.responses.inc((endpoint, method, str(response.status_code)))
+            if size is not None:
+                self.response_size.observe((endpoint,), size)
+            self.sql_statements.observe((endpoint,), statements)
+        return response
+
+    def observe_event(self, event, outcome, seconds):
+        with self._lock:
+            self.event_duration.observe((event, outcome), seconds)
+
+    def _component_lines(self):
+        if self.stats_source is None:
+            return []
+        name = PREFIX + 'component_stat'
+        lines = [f'# HELP {name} Internal counters from /api/stats.', f'# TYPE {name} gauge']
+
+        def walk(component, stats):
+            for key in sorted(stats):
+                value = stats[key]
+                if isinstance(value, dict):
+                    walk(f'{component}.{key}', value)
+                elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines.append(f'{name}{_labels(("component", "stat"), (component, key))} {_number(value)}')
+
+        for component, stats in self.stats_source().items():
+            if isinstance(stats, dict):
+                walk(component, stats)
+        return lines
+
+    def render(self):
+        """The whole registry in the Prometheus text exposition format."""
+        with self._lock:
+            snapshots = [(collector, collector.snapshot()) for collector in self._collectors]
+        lines = []
+        for collector, snapshot in snapshots:
+            lines.extend(collector.render(snapshot))
+        lines.extend([
+            f'# HELP {PREFIX}process_start_time_seconds Start time of the process since the epoch.',
+            f'# TYPE {PREFIX}process_start_time_seconds gauge',
+            f'{PREFIX}process_start_time_seconds {_number(self.started)}',
+        ])
+        lines.extend(self._component_lines())
+        return '\n'.join(lines) + '\n'
+
+
+def get_metrics():
+    return current_app.extensions.get('metrics')
+
+def count_statement(statement):
+    """sqlite3 trace callback for request connections (see db.get_db)."""
+    # Statements run by triggers are reported as "-- TRIGGER name"; they are part of
+    # the write that fired them. EXPLAINs come from the DB_TRACE plan capture.
+    if not statement.startswith(('--', 'EXPLAIN')):
+        g.sql_statements = g.get('sql_statements', 0) + 1
+
+def timed_event(event):
+    """Decorator for Socket.IO handlers: records how long each call to `event` takes."""
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(*args, **kwargs):
+            metrics = get_metrics()
+            if metrics is None:
+                return handler(*args, **kwargs)
+            started = time.perf_counter()
+            outcome = 'error'
+            try:
+                result = handler(*args, **kwargs)
+                outcome = 'ok'
+                return result
+            finally:
+                metrics.observe_event(event, outcome, time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+def internal_only(view):
+    """
+    Decorator for endpoints that expose server internals (/metrics, /api/stats):
+    they answer 404 to anything but loopback clients unless METRICS_ALLOW_REMOTE is set.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.remote_addr not in LOCAL_ADDRS and not current_app.config['METRICS_ALLOW_REMOTE']:
+            abort(404)
+        return view(*args, **kwargs)
+    return wrapper
+
+@internal_only
+def metrics_view():
+    """GET /metrics."""
+    metrics = get_metrics()
+    if metrics is None:
+        abort(404)
+    return current_app.response_class(metrics.render(), mimetype=None, content_type=CONTENT_TYPE)
+
+def init_app(app, stats_source=None):
+    """
+    Registers the request hooks and the /metrics route. Call this before
+    http_cache.init_app so sizes are measured after compression (Flask runs
+    after_request hooks in reverse order of registration).
+    """
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
+    if not app.config['METRICS_ENABLED']:
+        return
+    metrics = Metrics(stats_source)
+    app.extensions['metrics'] = metrics
+    app.before_request(metrics.start_request)
+    app.after_request(metrics.finish_request)
@@ -0,0 +1,293 @@
+import sqlite3
+from .rollups import rebuild_rollups
+
+# Versioned, non-destructive schema changes applied on top of schema.sql.
+#
+# Each entry is (version, description, steps) where steps is a SQL script, a
+# callable taking the sqlite3 connection, or a tuple of those. SQL scripts
+# run first, then the callables, all in one transaction. The applied version
+# is kept in the database header (PRAGMA user_version), so running the
+# migrations again is a no-op. Never edit a migration that has shipped --
+# append a new one.
+
+INDEX_PACK = """
+-- Shop order list: WHERE shop_id = ? ORDER BY created_at DESC
+CREATE INDEX IF NOT EXISTS idx_orders_shop_created ON orders (shop_id, created_at);
+
+-- Customer order list: WHERE customer_id = ? ORDER BY created_at DESC
+CREATE INDEX IF NOT EXISTS idx_orders_customer_created ON orders (customer_id, created_at);
+
+-- Analytics: status counts, delivered revenue and revenue per day are all
+-- answered from this index without touching the table
+CREATE INDEX IF NOT EXISTS idx_orders_shop_status ON orders (shop_id, status, created_at, total_price);
+
+-- Reviews list and rating average only look at rated orders
+CREATE INDEX IF NOT EXISTS idx_orders_shop_reviews ON orders (shop_id, created_at, rating)
+  WHERE rating IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items (order_id);
+
+-- Chat thread: WHERE shop_id = ? AND customer_id = ? ORDER BY created_at
+CREATE INDEX IF NOT EXISTS idx_chat_thread ON chat_messages (shop_id, customer_id, created_at);
+
+CREATE INDEX IF NOT EXISTS idx_cakes_shop_name ON cakes (shop_id, name);
+CREATE INDEX IF NOT EXISTS idx_flavors_cake ON flavors (cake_id);
+"""
+
+# Order snapshots move to the blob store; rows keep only the ref.
+# Existing data URLs are moved by `init_db.py --migrate-snapshots`.
+SNAPSHOT_REFS = """
+ALTER TABLE order_items ADD COLUMN snapshot_ref TEXT;
+"""
+
+# Cake photos uploaded from the dashboard are stored in the blob store too
+CAKE_IMAGE_REFS = """
+ALTER TABLE cakes ADD COLUMN image_ref TEXT;
+"""
+
+# Per-shop analytics rollups, kept current by triggers on orders so every
+# writer (create_order, update_order_status, rate_order, bulk updates) keeps
+# them consistent in the same transaction. Backfilled by rebuild_rollups.
+ANALYTICS_ROLLUPS = """
+CREATE TABLE IF NOT EXISTS shop_status_counts (
+  shop_id INTEGER NOT NULL,
+  status TEXT NOT NULL,
+  orders_count INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (shop_id, status)
+) WITHOUT ROWID;
+
+-- Delivered orders only, bucketed by the day the order was placed
+CREATE TABLE IF NOT EXISTS shop_daily_revenue (
+  shop_id INTEGER NOT NULL,
+  day TEXT NOT NULL,
+  orders_count INTEGER NOT NULL DEFAULT 0,
+  revenue REAL NOT NULL DEFAULT 0,
+  PRIMARY KEY (shop_id, day)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS shop_rating_stats (
+  shop_id INTEGER PRIMARY KEY,
+  rating_sum INTEGER NOT NULL DEFAULT 0,
+  rating_count INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_orders_rollup_insert AFTER INSERT ON orders
+BEGIN
+  INSERT INTO shop_status_counts (shop_id, status, orders_count)
+    VALUES (NEW.shop_id, NEW.status, 1)
+    ON CONFLICT (shop_id, status) DO UPDATE SET orders_count = orders_count + 1;
+  INSERT INTO shop_daily_revenue (shop_id, day, orders_count, revenue)
+    SELECT NEW.shop_id, DATE(NEW.created_at), 1, NEW.total_price WHERE NEW.status = 'Delivered'
+    ON CONFLICT (shop_id, day) DO UPDATE SET
+      orders_count = orders_count + 1, revenue = revenue + excluded.revenue;
+  INSERT INTO shop_rating_stats (shop_id, rating_sum, rating_count)
+    SELECT NEW.shop_id, NEW.rating, 1 WHERE NEW.rating IS NOT NULL
+    ON CONFLICT (shop_id) DO UPDATE SET
+      rating_sum = rating_sum + excluded.rating_sum, rating_count = rating_count + 1;
+END;
+
+-- Take the old row's contribution out, then put the new row's in
+CREATE TRIGGER IF NOT EXISTS trg_orders_rollup_update
+AFTER UPDATE OF shop_id, status, total_price, created_at, rating ON orders
+WHEN OLD.shop_id IS NOT NEW.shop_id OR OLD.status IS NOT NEW.status
+  OR OLD.total_price IS NOT NEW.total_price OR OLD.created_at IS NOT NEW.created_at
+  OR OLD.rating IS NOT NEW.rating
+BEGIN
+  UPDATE shop_status_counts SET orders_count = orders_count - 1
+    WHERE shop_id = OLD.shop_id AND status = OLD.status;
+  INSERT INTO shop_status_counts (shop_id, status, orders_count)
+    VALUES (NEW.shop_id, NEW.status, 1)
+    ON CONFLICT (shop_id, status) DO UPDATE SET orders_count = orders_count + 1;
+
+  UPDATE shop_daily_revenue SET orders_count = orders_count - 1, revenue = revenue - OLD.total_price
+    WHERE OLD.status = 'Delivered' AND shop_id = OLD.shop_id AND day = DATE(OLD.created_at);
+  INSERT INTO shop_daily_revenue (shop_id, day, orders_count, revenue)
+    SELECT NEW.shop_id, DATE(NEW.created_at), 1, NEW.total_price WHERE NEW.status = 'Delivered'
+    ON CONFLICT (shop_id, day) DO UPDATE SET
+      orders_count = orders_count + 1, revenue = revenue + excluded.revenue;
+
+  UPDATE shop_rating_stats SET rating_sum = rating_sum - OLD.rating, rating_count = rating_count - 1
+    WHERE OLD.rating IS NOT NULL AND shop_id = OLD.shop_id;
+  INSERT INTO shop_rating_stats (shop_id, rating_sum, rating_count)
+    SELECT NEW.shop_id, NEW.rating, 1 WHERE NEW.rating IS NOT NULL
+    ON CONFLICT (shop_id) DO UPDATE SET
+      rating_sum = rating_sum + excluded.rating_sum, rating_count = rating_count + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_orders_rollup_delete AFTER DELETE ON orders
+BEGIN
+  UPDATE shop_status_counts SET orders_count = orders_count - 1
+    WHERE shop_id = OLD.shop_id AND status = OLD.status;
+  UPDATE shop_daily_revenue SET orders_count = orders_count - 1, revenue = revenue - OLD.total_price
+    WHERE OLD.status = 'Delivered' AND shop_id = OLD.shop_id AND day = DATE(OLD.created_at);
+  UPDATE shop_rating_stats SET rating_sum = rating_sum - OLD.rating, rating_count = rating_count - 1
+    WHERE OLD.rating IS NOT NULL AND shop_id = OLD.shop_id;
+END;
+"""
+
+# Orders move to the Pending -> Baking -> Out for delivery -> Delivered
+# lifecycle (order_status.py). The rollup triggers move the status counts along.
+ORDER_LIFECYCLE = """
+UPDATE orders SET status = 'Baking' WHERE status IN ('Accepted', 'In Progress');
+UPDATE orders SET status = 'Cancelled' WHERE status = 'Rejected';
+"""
+
+# Full-text catalog search (search.py). rowid is the cake id; the triggers
+# below are the only writers.
+CAKE_SEARCH = """
+CREATE VIRTUAL TABLE IF NOT EXISTS cake_search USING fts5(
+  name, shop_name, flavor_names,
+  tokenize = 'unicode61 remove_diacritics 2',
+  prefix = '2 3'
+);
+
+INSERT INTO cake_search (rowid, name, shop_name, flavor_names)
+SELECT c.id, c.name, s.shop_name,
+       (SELECT group_concat(f.name, ' ') FROM flavors f WHERE f.cake_id = c.id)
+FROM cakes c LEFT JOIN shops s ON s.id = c.shop_id;
+
+CREATE TRIGGER IF NOT EXISTS trg_cake_search_insert AFTER INSERT ON cakes
+BEGIN
+  INSERT INTO cake_search (rowid, name, shop_name, flavor_names)
+  VALUES (NEW.id, NEW.name, (SELECT shop_name FROM shops WHERE id = NEW.shop_id),
+          (SELECT group_concat(name, ' ') FROM flavors WHERE cake_id = NEW.id));
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_cake_search_update AFTER UPDATE OF name, shop_id ON cakes
+BEGIN
+  UPDATE cake_search SET name = NEW.name, shop_name = (SELECT shop_name FROM shops WHERE id = NEW.shop_id)
+    WHERE rowid = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_cake_search_delete AFTER DELETE ON cakes
+BEGIN
+  DELETE FROM cake_search WHERE rowid = OLD.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_cake_search_flavor_insert AFTER INSERT ON flavors
+BEGIN
+  UPDATE cake_search SET flavor_names = (SELECT group_concat(name, ' ') FROM flavors WHERE cake_id = NEW.cake_id)
+    WHERE rowid = NEW.cake_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_cake_search_flavor_update AFTER UPDATE OF name, cake_id ON flavors
+BEGIN
+  UPDATE cake_search SET flavor_names = (SELECT group_concat(name, ' ') FROM flavors WHERE cake_id = cake_search.rowid)
+    WHERE rowid IN (OLD.cake_id, NEW.cake_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_cake_search_flavor_delete AFTER DELETE ON flavors
+BEGIN
+  UPDATE cake_search SET flavor_names = (SELECT group_concat(name, ' ') FROM flavors WHERE cake_id = OLD.cake_id)
+    WHERE rowid = OLD.cake_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_cake_search_shop_update AFTER UPDATE OF shop_name ON shops
+BEGIN
+  UPDATE cake_search SET shop_name = NEW.shop_name
+    WHERE rowid IN (SELECT id FROM cakes WHERE shop_id = NEW.id);
+END;
+
+-- Browse filters without a text query
+CREATE INDEX IF NOT EXISTS idx_cakes_shape_price ON cakes (shape, base_price);
+"""
+
+# One row per (shop, customer) thread with its latest message and unread
+# counts for each side, so inboxes don't read chat history or orders. Rows
+# are created by the first order or message and kept current by triggers,
+# i.e. in the same transaction as the message insert.
+CONVERSATIONS = """
+CREATE TABLE IF NOT EXISTS conversations (
+  shop_id INTEGER NOT NULL,
+  customer_id INTEGER NOT NULL,
+  last_message_id INTEGER,
+  last_sender_id INTEGER,
+  last_message TEXT,
+  last_at TIMESTAMP NOT NULL,
+  shop_unread INTEGER NOT NULL DEFAULT 0,
+  customer_unread INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (shop_id, customer_id)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_conversations_shop_recent ON conversations (shop_id, last_at, customer_id);
+CREATE INDEX IF NOT EXISTS idx_conversations_customer_recent ON conversations (customer_id, last_at, shop_id);
+
+INSERT OR IGNORE INTO conversations (shop_id, customer_id, last_at)
+SELECT shop_id, customer_id, MIN(created_at) FROM orders GROUP BY shop_id, customer_id;
+
+INSERT INTO conversations (shop_id, customer_id, last_message_id, last_sender_id, last_message, last_at)
+SELECT m.shop_id, m.customer_id, m.id, m.sender_id, substr(m.message, 1, 200), m.created_at
+FROM chat_messages m
+WHERE m.id = (SELECT MAX(id) FROM chat_messages WHERE shop_id = m.shop_id AND customer_id = m.customer_id)
+ON CONFLICT (shop_id, customer_id) DO UPDATE SET
+  last_message_id = excluded.last_message_id, last_sender_id = excluded.last_sender_id,
+  last_message = excluded.last_message, last_at = excluded.last_at;
+
+CREATE TRIGGER IF NOT EXISTS trg_conversations_order AFTER INSERT ON orders
+BEGIN
+  INSERT OR IGNORE INTO conversations (shop_id, customer_id, last_at)
+  VALUES (NEW.shop_id, NEW.customer_id, NEW.created_at);
+END;
+
+-- A message from the customer is unread for the shop, and vice versa
+CREATE TRIGGER IF NOT EXISTS trg_conversations_message AFTER INSERT ON chat_messages
+BEGIN
+  INSERT INTO conversations (shop_id, customer_id, last_message_id, last_sender_id, last_message, last_at,
+                             shop_unread, customer_unread)
+  VALUES (NEW.shop_id, NEW.customer_id, NEW.id, NEW.sender_id, substr(NEW.message, 1, 200), NEW.created_at,
+          NEW.sender_id = NEW.customer_id, NEW.sender_id != NEW.customer_id)
+  ON CONFLICT (shop_id, customer_id) DO UPDATE SET
+    last_message_id = excluded.last_message_id, last_sender_id = excluded.last_sender_id,
+    last_message = excluded.last_message, last_at = excluded.last_at,
+    shop_unread = shop_unread + excluded.shop_unread,
+    customer_unread = customer_unread + excluded.customer_unread;
+END;
+"""
+
+MIGRATIONS = [
+    (1, "Index pack for the hot query paths", INDEX_PACK),
+    (2, "Blob store references for order snapshots", SNAPSHOT_REFS),
+    (3, "Incremental per-shop analytics rollups", (ANALYTICS_ROLLUPS, rebuild_rollups)),
+    (4, "Blob store references for cake images", CAKE_IMAGE_REFS),
+    (5, "Order lifecycle statuses", ORDER_LIFECYCLE),
+    (6, "Full-text catalog search", CAKE_SEARCH),
+    (7, "Conversation index with unread counts", CONVERSATIONS),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(connection):
+    return connection.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(connection, target=LATEST_VERSION):
+    """
+    Applies every migration newer than the database's user_version, each in
+    its own transaction. Returns the list of versions that were applied.
+    """
+    applied = []
+    version = current_version(connection)
+    for number, description, steps in MIGRATIONS:
+        if number <= version or number > target:
+            continue
+        print(f"Applying migration {number}: {description}")
+        if not isinstance(steps, tuple):
+            steps = (steps,)
+        scripts = [step for step in steps if not callable(step)]
+        calls = [step for step in steps if callable(step)]
+        try:
+            # executescript() commits anything pending before it runs, so
+            # the scripts go in one call that opens the transaction and
+            # leaves it open for the callables and the version bump
+            connection.executescript("BEGIN;\n" + "\n".join(scripts))
+            for call in calls:
+                call(connection)
+            connection.execute(f"PRAGMA user_version = {number}")
+            connection.commit()
+        except sqlite3.Error:
+            if connection.in_transaction:
+                connection.rollback()
+            raise
+        applied.append(number)
+    return applied
@@ -1,13 +1,30 @@
 import sqlite3
 from .db import get_db
-from . import bcrypt
+from .catalog_cache import invalidate_catalog
+from .pagination import DEFAULT_PAGE_SIZE, keyset_clause, make_page, encode_cursor, encode_offset_cursor
+from .serialization import encode_page
+from .hashing import get_hasher
+from .order_status import check_transition, InvalidTransitionError
+from .order_events import publish_order_changes
 from flask import current_app, g
 from collections import defaultdict
 
+# Listing functions take encoded=True to return the page as pre-encoded
+# JSON bytes (see serialization.py) for routes that only pass it through.
+
+# Writers ask for a writable connection explicitly: Socket.IO handlers run
+# inside the handshake's GET request context, which would otherwise get a
+# connection from the read-only pool.
+
 # --- USER & SHOP MODEL FUNCTIONS (Unchanged) ---
 def create_user(email, password, role, shop_name=None):
-    db = get_db()
-    hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
+    """
+    Creates the user (and their shop). A duplicate email raises
+    sqlite3.IntegrityError; the UNIQUE constraint is the check.
+    """
+    # Hash before checking out the write connection: bcrypt takes a while
+    hashed_password = get_hasher().hash(password)
+    db = get_db(read_only=False)
     try:
         if role == 'customer':
             cursor = db.execute(
@@ -37,11 +54,15 @@ def create_user(email, password, role, shop_name=None):
             return user_id
     except sqlite3.IntegrityError:
         db.rollback() 
-        return None 
+        raise
     except Exception as e:
         db.rollback() 
         print(f"Error creating user/shop: {e}")
         return None
+def update_password_hash(user_id, password_hash):
+    db = get_db(read_only=False)
+    db.execute("UPDATE users SET password_hash = ? WHERE id = ?", (password_hash, user_id))
+    db.commit()
 def get_user_by_email(email):
     db = get_db()
     cursor = db.execute(
@@ -57,23 +78,149 @@ def get_user_by_id(user_id):
     )
     return cursor.fetchone()
 
-# --- CAKE & FLAVOR MODEL FUNCTIONS (Unchanged) ---
-def get_all_cakes():
+# --- CAKE & FLAVOR MODEL FUNCTIONS ---
+def load_catalog(shop_id=None, cake_id=None, cake_ids=None):
+    """
+    Batched catalog loader: fetches the matching cakes and all of their
+    flavors in two set-based queries (instead of one flavor query per cake)
+    and nests the flavors under each cake's 'flavors' key in one pass.
+    Filters by cake_id, else by a list of cake_ids, else by shop_id, else
+    returns the whole catalog.
+    """
+    db = get_db()
+    if cake_id is not None:
+        where, params, order = "WHERE c.id = ?", (cake_id,), "c.id"
+    elif cake_ids is not None:
+        if not cake_ids:
+            return []
+        placeholders = ", ".join("?" * len(cake_ids))
+        where, params, order = f"WHERE c.id IN ({placeholders})", tuple(cake_ids), "c.id"
+    elif shop_id is not None:
+        where, params, order = "WHERE c.shop_id = ?", (shop_id,), "c.name"
+    else:
+        where, params, order = "", (), "c.id"
+
+    cakes = db.execute(
+        f"SELECT c.*, s.shop_name FROM cakes c JOIN shops s ON c.shop_id = s.id {where} ORDER BY {order}",
+        params
+    ).fetchall()
+    if not cakes:
+        return []
+    flavors = db.execute(
+        f"SELECT f.* FROM flavors f JOIN cakes c ON f.cake_id = c.id {where} ORDER BY f.cake_id, f.id",
+        params
+    ).fetchall()
+
+    flavors_by_cake = defaultdict(list)
+    for flavor in flavors:
+        flavors_by_cake[flavor['cake_id']].append(dict(flavor))
+    products = []
+    for cake in cakes:
+        cake_dict = dict(cake)
+        cake_dict['flavors'] = flavors_by_cake.get(cake_dict['id'], [])
+        products.append(cake_dict)
+    return products
+def get_all_cakes(include_flavors=False):
+    if include_flavors:
+        return load_catalog()
     db = get_db()
     cursor = db.execute(
         "SELECT c.*, s.shop_name FROM cakes c JOIN shops s ON c.shop_id = s.id"
     )
     return [dict(cake) for cake in cursor.fetchall()] 
-def get_cake_details(cake_id):
+SEARCH_ORDER = {
+    'price_asc': "c.base_price, c.id",
+    'price_desc': "c.base_price DESC, c.id",
+    'name': "c.name, c.id",
+}
+def search_cakes(match=None, shapes=(), shop_ids=(), min_price=None, max_price=None,
+                 sort='relevance', limit=DEFAULT_PAGE_SIZE, offset=0):
+    """
+    Catalog search (see search.py): `match` is an FTS5 query from
+    match_query(), or None to browse the whole catalog. Returns
+    {"items", "next_cursor", "total", "facets": {"shapes", "shops", "price"}}.
+    """
     db = get_db()
-    cake = db.execute("SELECT * FROM cakes WHERE id = ?", (cake_id,)).fetchone()
-    if not cake: return None
-    flavors = db.execute("SELECT * FROM flavors WHERE cake_id = ?", (cake_id,)).fetchall()
-    return {"cake": dict(cake), "flavors": [dict(f) for f in flavors]}
+    if match:
+        source = "cake_search JOIN cakes c ON c.id = cake_search.rowid JOIN shops s ON s.id = c.shop_id"
+        base = [("cake_search MATCH ?", [match])]
+    else:
+        source = "cakes c JOIN shops s ON s.id = c.shop_id"
+        base = []
+    filters = {}
+    if shapes:
+        filters['shape'] = (f"c.shape IN ({', '.join('?' * len(shapes))})", list(shapes))
+    if shop_ids:
+        filters['shop'] = (f"c.shop_id IN ({', '.join('?' * len(shop_ids))})", list(shop_ids))
+    price = []
+    if min_price is not None:
+        price.append(("c.base_price >= ?", [min_price]))
+    if max_price is not None:
+        price.append(("c.base_price <= ?", [max_price]))
+    if price:
+        filters['price'] = (" AND ".join(sql for sql, _ in price), [p for _, params in price for p in params])
+
+    def where(exclude=None):
+        clauses = base + [clause for name, clause in filters.items() if name != exclude]
+        if not clauses:
+            return "", []
+        return "WHERE " + " AND ".join(sql for sql, _ in clauses), [p for _, params in clauses for p in params]
+
+    if sort == 'relevance':
+        # bm25 weights: cake name, shop name, flavor names
+        order = "bm25(cake_search, 10.0, 2.0, 4.0), c.id" if match else "c.name, c.id"
+    else:
+        order = SEARCH_ORDER[sort]
+
+    clause, params = where()
+    rows = db.execute(
+        f"""
+        SELECT c.id, c.name, c.base_price, c.shape, c.image_url, c.image_ref, c.shop_id, s.shop_name
+        FROM {source} {clause} ORDER BY {order} LIMIT ? OFFSET ?
+        """,
+        (*params, limit + 1, offset)
+    ).fetchall()
+    total = db.execute(f"SELECT COUNT(*) FROM {source} {clause}", params).fetchone()[0]
+
+    clause, params = where('shape')
+    shape_facet = db.execute(
+        f"SELECT c.shape AS value, COUNT(*) AS count FROM {source} {clause} GROUP BY c.shape ORDER BY count DESC, value",
+        params
+    ).fetchall()
+    clause, params = where('shop')
+    shop_facet = db.execute(
+        f"""
+        SELECT s.id AS shop_id, s.shop_name, COUNT(*) AS count FROM {source} {clause}
+        GROUP BY s.id ORDER BY count DESC, s.shop_name LIMIT 50
+        """,
+        params
+    ).fetchall()
+    clause, params = where('price')
+    price_facet = db.execute(
+        f"SELECT MIN(c.base_price) AS min, MAX(c.base_price) AS max FROM {source} {clause}",
+        params
+    ).fetchone()
+
+    return {
+        "items": [dict(row) for row in rows[:limit]],
+        "next_cursor": encode_offset_cursor(offset + limit) if len(rows) > limit else None,
+        "total": total,
+        "facets": {
+            "shapes": [dict(row) for row in shape_facet],
+            "shops": [dict(row) for row in shop_facet],
+            "price": dict(price_facet),
+        },
+    }
+def get_cake_details(cake_id):
+    products = load_catalog(cake_id=cake_id)
+    if not products: return None
+    cake = products[0]
+    flavors = cake.pop('flavors')
+    return {"cake": cake, "flavors": flavors}
 
 # --- ORDER MODEL FUNCTIONS (UPDATED) ---
 def create_order(customer_id, total_price, items_list, shop_id):
-    db = get_db()
+    db = get_db(read_only=False)
     try:
         cursor = db.execute(
             "INSERT INTO orders (customer_id, total_price, shop_id) VALUES (?, ?, ?)",
@@ -87,7 +234,7 @@ def create_order(customer_id, total_price, items_list, shop_id):
                 item.get('size'), item.get('custom_text'), item.get('price'),
                 item.get('shape'), item.get('coating'), item.get('top_decoration'),
                 item.get('side_decoration'), item.get('topping'),
-                item.get('snapshot_image') # --- RE-ADDED ---
+                item.get('snapshot_ref') # Blob store ref, not the image itself
             ))
             
         db.executemany(
@@ -95,50 +242,139 @@ def create_order(customer_id, total_price, items_list, shop_id):
             INSERT INTO order_items (
                 order_id, cake_id, flavor, size, custom_text, 
                 price, shape, coating, 
-                top_decoration, side_decoration, topping, snapshot_image
+                top_decoration, side_decoration, topping, snapshot_ref
             )
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """, items_to_insert
         )
         
         db.commit()
-        return new_order_id
     except sqlite3.Error as e:
         db.rollback()
         print(f"Failed to create order: {e}")
         return None
-def get_orders_by_customer(customer_id):
+    order = db.execute(
+        """
+        SELECT o.*, s.shop_name, u.email AS customer_email
+        FROM orders o JOIN shops s ON o.shop_id = s.id JOIN users u ON o.customer_id = u.id
+        WHERE o.id = ?
+        """,
+        (new_order_id,)
+    ).fetchone()
+    if order is not None:
+        publish_order_changes('created', [dict(order)])
+    return new_order_id
+# The listing functions below return one keyset page, newest first:
+# {"items": [...], "next_cursor": ...}. Pass the decoded next_cursor back as
+# `after` to get the following page (see pagination.py).
+def get_orders_by_customer(customer_id, limit=DEFAULT_PAGE_SIZE, after=None, status=None, date_from=None, date_to=None, encoded=False):
     db = get_db()
+    where, params = keyset_clause('o', after, date_from, date_to)
+    if status:
+        where += " AND o.status = ?"
+        params.append(status)
     cursor = db.execute(
-        "SELECT o.*, s.shop_name FROM orders o JOIN shops s ON o.shop_id = s.id WHERE o.customer_id = ? ORDER BY o.created_at DESC",
-        (customer_id,)
+        f"SELECT o.*, s.shop_name FROM orders o JOIN shops s ON o.shop_id = s.id WHERE o.customer_id = ?{where} ORDER BY o.created_at DESC, o.id DESC LIMIT ?",
+        (customer_id, *params, limit + 1)
     )
-    return [dict(order) for order in cursor.fetchall()]
-def get_all_shop_orders(shop_id):
+    return encode_page(cursor, limit) if encoded else make_page(cursor.fetchall(), limit)
+def get_all_shop_orders(shop_id, limit=DEFAULT_PAGE_SIZE, after=None, status=None, date_from=None, date_to=None, encoded=False):
     db = get_db()
+    where, params = keyset_clause('o', after, date_from, date_to)
+    if status:
+        where += " AND o.status = ?"
+        params.append(status)
     cursor = db.execute(
-        "SELECT o.id, o.status, o.total_price, o.created_at, o.rating, u.email as customer_email FROM orders o JOIN users u ON o.customer_id = u.id WHERE o.shop_id = ? ORDER BY o.created_at DESC",
-        (shop_id,)
+        f"SELECT o.id, o.status, o.total_price, o.created_at, o.rating, u.email as customer_email FROM orders o JOIN users u ON o.customer_id = u.id WHERE o.shop_id = ?{where} ORDER BY o.created_at DESC, o.id DESC LIMIT ?",
+        (shop_id, *params, limit + 1)
     )
-    return [dict(order) for order in cursor.fetchall()]
-def update_order_status(order_id, new_status, shop_id):
-    db = get_db()
+    return encode_page(cursor, limit) if encoded else make_page(cursor.fetchall(), limit)
+def update_order_statuses(shop_id, changes):
+    """
+    Applies [(order_id, new_status), ...] for one shop in a single
+    transaction, checking each move against the order lifecycle (see
+    order_status.py). Invalid moves are skipped, not fatal. Returns one
+    result per change, in order:
+        {"order_id", "ok", "status", "previous_status"} or {"order_id", "ok": False, "error", "code"}
+    where code is "not_found", "invalid_status" or "invalid_transition".
+    The rollup triggers keep the analytics counts in step with the batch.
+    """
+    db = get_db(read_only=False)
     try:
-        cursor = db.execute(
-            "UPDATE orders SET status = ? WHERE id = ? AND shop_id = ?",
-            (new_status, order_id, shop_id)
+        ids = sorted({order_id for order_id, _ in changes})
+        placeholders = ", ".join("?" * len(ids))
+        rows = db.execute(
+            f"SELECT id, status, customer_id FROM orders WHERE shop_id = ? AND id IN ({placeholders})",
+            (shop_id, *ids)
+        ).fetchall()
+        current = {row['id']: row['status'] for row in rows}
+        customers = {row['id']: row['customer_id'] for row in rows}
+
+        results, updates = [], []
+        for order_id, new_status in changes:
+            if order_id not in current:
+                results.append({"order_id": order_id, "ok": False, "code": "not_found", "error": "Order not found or no permission"})
+                continue
+            try:
+                check_transition(current[order_id], new_status)
+            except InvalidTransitionError as e:
+                results.append({"order_id": order_id, "ok": False, "code": "invalid_transition", "error": str(e)})
+                continue
+            except ValueError as e:
+                results.append({"order_id": order_id, "ok": False, "code": "invalid_status", "error": str(e)})
+                continue
+            results.append({"order_id": order_id, "ok": True, "status": new_status, "previous_status": current[order_id]})
+            if new_status != current[order_id]:
+                updates.append((new_status, order_id, shop_id, current[order_id]))
+                current[order_id] = new_status
+
+        # The status guard makes a concurrent change lose cleanly instead of being overwritten
+        cursor = db.executemany(
+            "UPDATE orders SET status = ? WHERE id = ? AND shop_id = ? AND status = ?",
+            updates
         )
+        if cursor.rowcount != len(updates):
+            db.rollback()
+            raise sqlite3.OperationalError("Orders changed while updating; retry the batch")
         db.commit()
-        return cursor.rowcount
-    except sqlite3.Error as e:
+    except sqlite3.Error:
         db.rollback()
-        return 0
+        raise
+    # Only the final status of each order that actually changed
+    changed = {order_id: status for status, order_id, _, _ in updates}
+    if changed:
+        publish_order_changes('status', [
+            {"id": order_id, "shop_id": shop_id, "customer_id": customers[order_id], "status": status}
+            for order_id, status in changed.items()
+        ])
+    return results
+def update_order_status(order_id, new_status, shop_id):
+    """Single-order form of update_order_statuses(); returns its one result."""
+    return update_order_statuses(shop_id, [(order_id, new_status)])[0]
+# snapshot_image is only non-NULL for rows not yet moved to the blob store
+ORDER_ITEM_COLUMNS = """
+    id, order_id, cake_id, flavor, size, custom_text, price, shape, coating,
+    top_decoration, side_decoration, topping, snapshot_ref, snapshot_image
+"""
 def get_order_details(order_id, user_id):
     db = get_db()
     order = db.execute("SELECT * FROM orders WHERE id = ? AND customer_id = ?", (order_id, user_id)).fetchone()
     if not order: return None 
-    items = db.execute("SELECT * FROM order_items WHERE order_id = ?", (order_id,)).fetchall()
+    items = db.execute(f"SELECT {ORDER_ITEM_COLUMNS} FROM order_items WHERE order_id = ?", (order_id,)).fetchall()
     return {"order": dict(order), "items": [dict(item) for item in items]}
+def get_order_version(order_id, customer_id=None, shop_id=None):
+    """
+    A cheap fingerprint of an order's details: items never change after
+    checkout, so only the order row's mutable columns matter. None if the
+    order doesn't exist or isn't the caller's.
+    """
+    db = get_db()
+    owner_column, owner = ("customer_id", customer_id) if customer_id is not None else ("shop_id", shop_id)
+    row = db.execute(
+        f"SELECT status, rating, review_text FROM orders WHERE id = ? AND {owner_column} = ?",
+        (order_id, owner)
+    ).fetchone()
+    return None if row is None else tuple(row)
 def get_shop_order_details(order_id, shop_id):
     db = get_db()
     order = db.execute(
@@ -146,59 +382,68 @@ def get_shop_order_details(order_id, shop_id):
         (order_id, shop_id)
     ).fetchone()
     if not order: return None 
-    items = db.execute("SELECT * FROM order_items WHERE order_id = ?", (order_id,)).fetchall()
+    items = db.execute(f"SELECT {ORDER_ITEM_COLUMNS} FROM order_items WHERE order_id = ?", (order_id,)).fetchall()
     return {"order": dict(order), "items": [dict(item) for item in items]}
 def rate_order(order_id, customer_id, rating, review_text):
-    db = get_db()
+    db = get_db(read_only=False)
     try:
         cursor = db.execute(
             "UPDATE orders SET rating = ?, review_text = ? WHERE id = ? AND customer_id = ? AND status = 'Delivered'",
             (rating, review_text, order_id, customer_id)
         )
         db.commit()
+        if cursor.rowcount:
+            shop = db.execute("SELECT shop_id FROM orders WHERE id = ?", (order_id,)).fetchone()
+            publish_order_changes('rated', [{
+                "id": order_id, "shop_id": shop['shop_id'], "customer_id": customer_id,
+                "rating": rating, "review_text": review_text,
+            }])
         return cursor.rowcount
     except sqlite3.Error as e:
         db.rollback()
         print(f"Failed to rate order: {e}")
         return 0
 # --- CAKE MANAGEMENT FUNCTIONS (Unchanged) ---
-def create_cake(name, base_price, shape, image_url, shop_id):
-    db = get_db()
+def create_cake(name, base_price, shape, image_url, shop_id, image_ref=None):
+    db = get_db(read_only=False)
     try:
         cursor = db.execute(
-            "INSERT INTO cakes (name, base_price, shape, image_url, shop_id) VALUES (?, ?, ?, ?, ?)",
-            (name, base_price, shape, image_url, shop_id)
+            "INSERT INTO cakes (name, base_price, shape, image_url, image_ref, shop_id) VALUES (?, ?, ?, ?, ?, ?)",
+            (name, base_price, shape, image_url, image_ref, shop_id)
         )
         db.commit()
+        invalidate_catalog(shop_id)
         return cursor.lastrowid
     except sqlite3.Error as e:
         db.rollback()
         return None
-def update_cake(cake_id, name, base_price, shape, image_url, shop_id):
-    db = get_db()
+def update_cake(cake_id, name, base_price, shape, image_url, shop_id, image_ref=None):
+    db = get_db(read_only=False)
     try:
         cursor = db.execute(
-            "UPDATE cakes SET name = ?, base_price = ?, shape = ?, image_url = ? WHERE id = ? AND shop_id = ?",
-            (name, base_price, shape, image_url, cake_id, shop_id)
+            "UPDATE cakes SET name = ?, base_price = ?, shape = ?, image_url = ?, image_ref = ? WHERE id = ? AND shop_id = ?",
+            (name, base_price, shape, image_url, image_ref, cake_id, shop_id)
         )
         db.commit()
+        if cursor.rowcount: invalidate_catalog(shop_id)
         return cursor.rowcount
     except sqlite3.Error as e:
         db.rollback()
         return 0
 def delete_cake(cake_id, shop_id):
-    db = get_db()
+    db = get_db(read_only=False)
     try:
         cake = db.execute("SELECT id FROM cakes WHERE id = ? AND shop_id = ?", (cake_id, shop_id)).fetchone()
         if not cake: return 0 
         cursor = db.execute("DELETE FROM cakes WHERE id = ?", (cake_id,))
         db.commit()
+        invalidate_catalog(shop_id)
         return cursor.rowcount
     except sqlite3.Error as e:
         db.rollback()
         return 0
 def add_flavor(cake_id, name, color_hex, price_modifier, shop_id):
-    db = get_db()
+    db = get_db(read_only=False)
     try:
         cake = db.execute("SELECT id FROM cakes WHERE id = ? AND shop_id = ?", (cake_id, shop_id)).fetchone()
         if not cake: return None 
@@ -207,12 +452,13 @@ def add_flavor(cake_id, name, color_hex, price_modifier, shop_id):
             (cake_id, name, color_hex, price_modifier)
         )
         db.commit()
+        invalidate_catalog(shop_id)
         return cursor.lastrowid
     except sqlite3.Error as e:
         db.rollback()
         return None
 def delete_flavor(flavor_id, shop_id):
-    db = get_db()
+    db = get_db(read_only=False)
     try:
         flavor = db.execute(
             "SELECT f.id FROM flavors f JOIN cakes c ON f.cake_id = c.id WHERE f.id = ? AND c.shop_id = ?",
@@ -221,91 +467,299 @@ def delete_flavor(flavor_id, shop_id):
         if not flavor: return 0
         cursor = db.execute("DELETE FROM flavors WHERE id = ?", (flavor_id,))
         db.commit()
+        invalidate_catalog(shop_id)
         return cursor.rowcount
     except sqlite3.Error as e:
         db.rollback()
         return 0
-def get_all_cakes_with_flavors(shop_id):
+def import_catalog_batch(shop_id, cakes):
+    """
+    Upserts a batch of parsed catalog entries (see catalog_io.py) in one
+    transaction: cakes match by name within the shop, flavors by name within
+    their cake. Every step is one set-based lookup plus executemany, so the
+    cost per batch doesn't depend on catalog size. Raises sqlite3.Error
+    after rolling back. Returns the created/updated counts.
+    """
+    db = get_db(read_only=False)
+    counts = {"cakes_created": 0, "cakes_updated": 0, "flavors_created": 0, "flavors_updated": 0}
+    try:
+        names = [cake['name'] for cake in cakes]
+        placeholders = ", ".join("?" * len(names))
+        cake_ids = dict(db.execute(
+            f"SELECT name, MIN(id) FROM cakes WHERE shop_id = ? AND name IN ({placeholders}) GROUP BY name",
+            (shop_id, *names)
+        ).fetchall())
+
+        existing = [cake for cake in cakes if cake['name'] in cake_ids]
+        db.executemany(
+            "UPDATE cakes SET base_price = ?, shape = ? WHERE id = ?",
+            [(cake['base_price'], cake['shape'], cake_ids[cake['name']]) for cake in existing]
+        )
+        # Only touch the image when the import line carries one
+        db.executemany(
+            "UPDATE cakes SET image_url = ?, image_ref = ? WHERE id = ?",
+            [(cake['image_url'], cake['image_ref'], cake_ids[cake['name']])
+             for cake in existing if cake['image_url'] or cake['image_ref']]
+        )
+        new = [cake for cake in cakes if cake['name'] not in cake_ids]
+        if new:
+            db.executemany(
+                "INSERT INTO cakes (name, base_price, shape, image_url, image_ref, shop_id) VALUES (?, ?, ?, ?, ?, ?)",
+                [(cake['name'], cake['base_price'], cake['shape'], cake['image_url'], cake['image_ref'], shop_id) for cake in new]
+            )
+            placeholders = ", ".join("?" * len(new))
+            cake_ids.update(db.execute(
+                f"SELECT name, MIN(id) FROM cakes WHERE shop_id = ? AND name IN ({placeholders}) GROUP BY name",
+                (shop_id, *[cake['name'] for cake in new])
+            ).fetchall())
+        counts["cakes_updated"], counts["cakes_created"] = len(existing), len(new)
+
+        # One entry per (cake, flavor name); a flavor repeated in the batch takes its last values
+        flavors = {
+            (cake_ids[cake['name']], flavor['name']): flavor
+            for cake in cakes for flavor in cake['flavors']
+        }
+        if flavors:
+            ids = sorted({cake_id for cake_id, _ in flavors})
+            placeholders = ", ".join("?" * len(ids))
+            flavor_ids = {
+                (row[0], row[1]): row[2] for row in db.execute(
+                    f"SELECT cake_id, name, MIN(id) FROM flavors WHERE cake_id IN ({placeholders}) GROUP BY cake_id, name",
+                    ids
+                )
+            }
+            updates = [(flavor['color_hex'], flavor['price_modifier'], flavor_ids[key])
+                       for key, flavor in flavors.items() if key in flavor_ids]
+            inserts = [(cake_id, name, flavor['color_hex'], flavor['price_modifier'])
+                       for (cake_id, name), flavor in flavors.items() if (cake_id, name) not in flavor_ids]
+            db.executemany("UPDATE flavors SET color_hex = ?, price_modifier = ? WHERE id = ?", updates)
+            db.executemany("INSERT INTO flavors (cake_id, name, color_hex, price_modifier) VALUES (?, ?, ?, ?)", inserts)
+            counts["flavors_updated"], counts["flavors_created"] = len(updates), len(inserts)
+
+        db.commit()
+    except sqlite3.Error:
+        db.rollback()
+        raise
+    invalidate_catalog(shop_id)
+    return counts
+def get_catalog_export_rows(shop_id):
+    """
+    Cursor over the shop's cakes joined with their flavors (one row per
+    flavor, or one row for a cake without flavors), ordered by cake, for
+    streaming exports.
+    """
     db = get_db()
-    cakes_cursor = db.execute("SELECT * FROM cakes WHERE shop_id = ? ORDER BY name", (shop_id,))
-    cakes = cakes_cursor.fetchall()
-    products = []
-    for cake in cakes:
-        cake_dict = dict(cake)
-        flavors_cursor = db.execute("SELECT * FROM flavors WHERE cake_id = ?", (cake_dict['id'],))
-        cake_dict['flavors'] = [dict(f) for f in flavors_cursor.fetchall()]
-        products.append(cake_dict)
-    return products
-# --- ANALYTICS FUNCTION (Unchanged) ---
+    return db.execute(
+        """
+        SELECT c.id AS cake_id, c.name, c.base_price, c.shape, c.image_url, c.image_ref,
+               f.name AS flavor_name, f.color_hex AS flavor_color_hex, f.price_modifier AS flavor_price_modifier
+        FROM cakes c LEFT JOIN flavors f ON f.cake_id = c.id
+        WHERE c.shop_id = ?
+        ORDER BY c.name, c.id, f.id
+        """,
+        (shop_id,)
+    )
+def get_all_cakes_with_flavors(shop_id):
+    return load_catalog(shop_id=shop_id)
+# --- ANALYTICS FUNCTION ---
+# Reads the rollup tables maintained by the orders triggers (migration 3),
+# so the cost depends on the number of days and statuses, not orders.
 def get_analytics_data(shop_id):
     db = get_db()
-    revenue = db.execute("SELECT SUM(total_price) as total FROM orders WHERE status = 'Delivered' AND shop_id = ?", (shop_id,)).fetchone()['total'] or 0
-    orders = db.execute("SELECT COUNT(id) as total FROM orders WHERE shop_id = ?", (shop_id,)).fetchone()['total'] or 0
-    status_data = [dict(row) for row in db.execute("SELECT status, COUNT(id) as count FROM orders WHERE shop_id = ? GROUP BY status", (shop_id,)).fetchall()]
+    status_data = [dict(row) for row in db.execute(
+        "SELECT status, orders_count as count FROM shop_status_counts WHERE shop_id = ? AND orders_count > 0 ORDER BY status",
+        (shop_id,)
+    ).fetchall()]
     revenue_time = [dict(row) for row in db.execute(
-        "SELECT DATE(created_at) as date, SUM(total_price) as revenue FROM orders WHERE status = 'Delivered' AND shop_id = ? GROUP BY DATE(created_at) ORDER BY DATE(created_at) ASC",
+        "SELECT day as date, revenue FROM shop_daily_revenue WHERE shop_id = ? AND orders_count > 0 ORDER BY day ASC",
         (shop_id,)
     ).fetchall()]
     rating_data = db.execute(
-        "SELECT AVG(rating) as avg_rating, COUNT(rating) as total_reviews FROM orders WHERE shop_id = ? AND rating IS NOT NULL",
+        "SELECT rating_sum, rating_count FROM shop_rating_stats WHERE shop_id = ?",
         (shop_id,)
     ).fetchone()
-    return {"total_revenue": revenue, "total_orders": orders, "order_status_data": status_data, "revenue_over_time": revenue_time, "average_rating": rating_data['avg_rating'] or 0, "total_reviews": rating_data['total_reviews'] or 0}
-# --- CHAT MODEL FUNCTIONS (Unchanged) ---
-def save_chat_message(shop_id, customer_id, sender_id, message):
-    db = get_db()
+    revenue = sum(row['revenue'] for row in revenue_time)
+    orders = sum(row['count'] for row in status_data)
+    total_reviews = rating_data['rating_count'] if rating_data else 0
+    average_rating = rating_data['rating_sum'] / total_reviews if total_reviews else 0
+    return {"total_revenue": revenue, "total_orders": orders, "order_status_data": status_data, "revenue_over_time": revenue_time, "average_rating": average_rating, "total_reviews": total_reviews}
+# --- CHAT MODEL FUNCTIONS ---
+def save_chat_messages(rows):
+    """
+    Inserts a batch of (shop_id, customer_id, sender_id, message) rows in
+    one transaction. Used by the chat journal. Returns True on success and
+    False on a (possibly transient) database error; raises
+    sqlite3.IntegrityError if a row is rejected by the schema, so the
+    caller can tell rows that will never go in from a busy database.
+    """
+    db = get_db(read_only=False)
     try:
-        db.execute(
+        db.executemany(
             "INSERT INTO chat_messages (shop_id, customer_id, sender_id, message) VALUES (?, ?, ?, ?)",
-            (shop_id, customer_id, sender_id, message)
+            rows
         )
         db.commit()
+        return True
+    except sqlite3.IntegrityError:
+        db.rollback()
+        raise
     except sqlite3.Error as e:
         db.rollback()
-        print(f"Failed to save chat message: {e}")
-def get_chat_history(shop_id, customer_id):
+        print(f"Failed to save {len(rows)} chat message(s): {e}")
+        return False
+def save_chat_message(shop_id, customer_id, sender_id, message):
+    return save_chat_messages([(shop_id, customer_id, sender_id, message)])
+def get_chat_history(shop_id, customer_id, limit=DEFAULT_PAGE_SIZE, after=None, encoded=False):
+    """
+    Returns the latest `limit` messages of a thread (or the ones older than
+    `after`), in chronological order for display. next_cursor pages back
+    into older history.
+    """
     db = get_db()
+    where, params = keyset_clause(None, after)
     cursor = db.execute(
-        "SELECT * FROM chat_messages WHERE shop_id = ? AND customer_id = ? ORDER BY created_at ASC",
-        (shop_id, customer_id)
+        f"SELECT * FROM chat_messages WHERE shop_id = ? AND customer_id = ?{where} ORDER BY created_at DESC, id DESC LIMIT ?",
+        (shop_id, customer_id, *params, limit + 1)
     )
-    return [dict(msg) for msg in cursor.fetchall()]
-def get_shop_customers_from_orders(shop_id):
+    if encoded:
+        return encode_page(cursor, limit, reverse=True)
+    page = make_page(cursor.fetchall(), limit)
+    page['items'].reverse()
+    return page
+# Inboxes read the conversations table (migration 7), which the chat and
+# order triggers keep current, most recent thread first.
+def get_shop_inbox(shop_id, limit=DEFAULT_PAGE_SIZE, after=None):
+    """
+    One page of the shop's threads: customer_id, customer_email,
+    last_message, last_sender_id, last_at and unread (the shop's count).
+    `after` is a decoded (last_at, customer_id) cursor.
+    """
+    db = get_db()
+    where, params = "", []
+    if after:
+        where, params = " AND (c.last_at, c.customer_id) < (?, ?)", list(after)
+    rows = db.execute(
+        f"""
+        SELECT c.customer_id, u.email AS customer_email, c.last_message_id, c.last_message,
+               c.last_sender_id, c.last_at, c.shop_unread AS unread
+        FROM conversations c JOIN users u ON u.id = c.customer_id
+        WHERE c.shop_id = ?{where}
+        ORDER BY c.last_at DESC, c.customer_id DESC
+        LIMIT ?
+        """,
+        (shop_id, *params, limit + 1)
+    ).fetchall()
+    items = [dict(row) for row in rows[:limit]]
+    next_cursor = encode_cursor(items[-1]['last_at'], items[-1]['customer_id']) if len(rows) > limit else None
+    return {"items": items, "next_cursor": next_cursor}
+def get_customer_unread_counts(customer_id):
+    """{shop_id: unread} for the customer's threads with unread shop messages."""
+    db = get_db()
+    rows = db.execute(
+        "SELECT shop_id, customer_unread FROM conversations WHERE customer_id = ? AND customer_unread > 0",
+        (customer_id,)
+    ).fetchall()
+    return {row['shop_id']: row['customer_unread'] for row in rows}
+def mark_conversation_read(shop_id, customer_id, reader, last_message_id=None):
+    """
+    Clears the unread count of `reader` ('shop' or 'customer') for a thread.
+    If the reader has only seen up to last_message_id and newer messages
+    came in since, those stay unread. Returns the remaining unread count,
+    or None if the thread doesn't exist.
+    """
+    column = {'shop': 'shop_unread', 'customer': 'customer_unread'}[reader]
+    db = get_db(read_only=False)
+    try:
+        row = db.execute(
+            "SELECT last_message_id FROM conversations WHERE shop_id = ? AND customer_id = ?",
+            (shop_id, customer_id)
+        ).fetchone()
+        if row is None:
+            return None
+        unread = 0
+        if last_message_id is not None and row['last_message_id'] is not None and last_message_id < row['last_message_id']:
+            # Messages from the other side that arrived after what the reader saw
+            sender_clause = "sender_id != customer_id" if reader == 'customer' else "sender_id = customer_id"
+            unread = db.execute(
+                f"SELECT COUNT(*) FROM chat_messages WHERE shop_id = ? AND customer_id = ? AND id > ? AND {sender_clause}",
+                (shop_id, customer_id, last_message_id)
+            ).fetchone()[0]
+        db.execute(
+            f"UPDATE conversations SET {column} = ? WHERE shop_id = ? AND customer_id = ?",
+            (unread, shop_id, customer_id)
+        )
+        db.commit()
+        return unread
+    except sqlite3.Error:
+        db.rollback()
+        raise
+def get_shop_reviews(shop_id, limit=DEFAULT_PAGE_SIZE, after=None, date_from=None, date_to=None, encoded=False):
     db = get_db()
+    where, params = keyset_clause('o', after, date_from, date_to)
     cursor = db.execute(
-        """
-        SELECT DISTINCT
-            u.id as customer_id,
-            u.email as customer_email
+        f"""
+        SELECT o.id, o.rating, o.review_text, o.created_at, u.email as customer_email
         FROM orders o
         JOIN users u ON o.customer_id = u.id
-        WHERE o.shop_id = ?
-        ORDER BY u.email
+        WHERE o.shop_id = ? AND o.rating IS NOT NULL{where}
+        ORDER BY o.created_at DESC, o.id DESC
+        LIMIT ?
         """,
-        (shop_id,)
+        (shop_id, *params, limit + 1)
     )
-    return [dict(conv) for conv in cursor.fetchall()]
-def get_shop_reviews(shop_id):
+    return encode_page(cursor, limit) if encoded else make_page(cursor.fetchall(), limit)
+# Export cursors: every matching row oldest first, for streamed responses
+ORDER_EXPORT_ITEM_COLUMNS = (
+    'item_id', 'cake_id', 'cake_name', 'flavor', 'size', 'shape', 'coating',
+    'top_decoration', 'side_decoration', 'topping', 'custom_text', 'price'
+)
+def get_order_export_rows(shop_id, status=None, date_from=None, date_to=None):
+    """
+    One row per order item (or one row for an order without items), joined
+    with the order and the customer's email. Snapshot images are left out.
+    """
     db = get_db()
-    cursor = db.execute(
-        """
-        SELECT o.id, o.rating, o.review_text, o.created_at, u.email as customer_email
+    where, params = keyset_clause('o', None, date_from, date_to)
+    if status:
+        where += " AND o.status = ?"
+        params.append(status)
+    return db.execute(
+        f"""
+        SELECT o.id AS order_id, o.created_at, o.status, o.total_price, u.email AS customer_email,
+               o.rating, i.id AS item_id, i.cake_id, c.name AS cake_name, i.flavor, i.size, i.shape,
+               i.coating, i.top_decoration, i.side_decoration, i.topping, i.custom_text, i.price
         FROM orders o
         JOIN users u ON o.customer_id = u.id
-        WHERE o.shop_id = ? AND o.rating IS NOT NULL
-        ORDER BY o.created_at DESC
+        LEFT JOIN order_items i ON i.order_id = o.id
+        LEFT JOIN cakes c ON c.id = i.cake_id
+        WHERE o.shop_id = ?{where}
+        ORDER BY o.created_at, o.id, i.id
         """,
-        (shop_id,)
+        (shop_id, *params)
     )
-    return [dict(review) for review in cursor.fetchall()]
-def update_shop_name(shop_id, new_shop_name):
+def get_review_export_rows(shop_id, date_from=None, date_to=None):
     db = get_db()
+    where, params = keyset_clause('o', None, date_from, date_to)
+    return db.execute(
+        f"""
+        SELECT o.id AS order_id, o.created_at, u.email AS customer_email, o.rating, o.review_text
+        FROM orders o
+        JOIN users u ON o.customer_id = u.id
+        WHERE o.shop_id = ? AND o.rating IS NOT NULL{where}
+        ORDER BY o.created_at, o.id
+        """,
+        (shop_id, *params)
+    )
+def update_shop_name(shop_id, new_shop_name):
+    db = get_db(read_only=False)
     try:
         cursor = db.execute(
             "UPDATE shops SET shop_name = ? WHERE id = ?",
             (new_shop_name, shop_id)
         )
         db.commit()
+        # shop_name is embedded in every catalog card
+        if cursor.rowcount: invalidate_catalog(shop_id)
         return cursor.rowcount
     except sqlite3.Error as e:
         db.rollback()
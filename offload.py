@@ -0,0 +1,22 @@
+# Running blocking, CPU-bound C code (bcrypt, image resizing) without
+# stalling the server.
+#
+# run.py monkey-patches threading, so under eventlet every "thread" is a
+# greenlet on the hub: a 200 ms bcrypt call would freeze every socket and
+# request on the worker. eventlet.tpool runs the call on a real OS thread
+# and lets the hub keep scheduling meanwhile. Without eventlet (threaded
+# dev server, scripts) the call simply runs in the caller's thread.
+
+
+def is_green():
+    try:
+        from eventlet import patcher
+    except ImportError:
+        return False
+    return patcher.is_monkey_patched('thread')
+
+def run_native(fn, *args, **kwargs):
+    if is_green():
+        from eventlet import tpool
+        return tpool.execute(fn, *args, **kwargs)
+    return fn(*args, **kwargs)
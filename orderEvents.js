@@ -0,0 +1,17 @@
+// Order change events pushed over Socket.IO (see backend order_events.py):
+// socket.on('order_update', event) with event = { type, orders: [...] }.
+// 'created' events carry full list rows; the others only the changed fields.
+
+export const ORDER_EVENT = 'order_update';
+
+// Returns the orders list with the event applied
+export const applyOrderUpdate = (orders, event) => {
+  if (event.type === 'created') {
+    const known = new Set(orders.map(order => order.id));
+    const fresh = event.orders.filter(order => !known.has(order.id));
+    return fresh.length ? [...fresh, ...orders] : orders;
+  }
+  const changes = new Map(event.orders.map(order => [order.id, order]));
+  if (!orders.some(order => changes.has(order.id))) return orders;
+  return orders.map(order => (changes.has(order.id) ? { ...order, ...changes.get(order.id) } : order));
+};
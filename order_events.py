@@ -0,0 +1,41 @@
+import json
+from collections import defaultdict
+from .bus import get_bus
+from .serialization import dumps_bytes
+
+# Order change events over Socket.IO.
+#
+# The order write paths in models.py publish a compact event after each
+# successful commit, to the rooms chat_events.py already puts sessions in:
+#
+#   'order_update' -> shop_{shop_id} and user_{customer_id}
+#   {"type": "created" | "status" | "rated", "orders": [{"id", ...changed fields}]}
+#
+# "created" carries the full list row (as get_all_shop_orders and
+# get_orders_by_customer return it), the others only what changed. Open
+# dashboards patch their lists from these instead of re-fetching. Events go
+# through the bus, so sockets on other workers get them too.
+
+ORDER_EVENT = 'order_update'
+
+
+def publish_order_changes(kind, orders):
+    """
+    Sends one event per room for `orders` (dicts with id, shop_id and
+    customer_id plus the changed fields). Never raises: the write has
+    already been committed, and a lost event only leaves a screen stale
+    until its next fetch.
+    """
+    rooms = defaultdict(list)
+    for order in orders:
+        rooms[f"shop_{order['shop_id']}"].append(order)
+        rooms[f"user_{order['customer_id']}"].append(order)
+    try:
+        bus = get_bus()
+        for room, room_orders in rooms.items():
+            # Same JSON types as the REST listings (dates included), and safe
+            # for buses that serialize with the stdlib encoder
+            payload = json.loads(dumps_bytes({"type": kind, "orders": room_orders}))
+            bus.publish(ORDER_EVENT, payload, room)
+    except Exception as e:
+        print(f"Failed to publish order {kind} event: {e}")
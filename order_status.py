@@ -0,0 +1,37 @@
+# Order lifecycle.
+#
+#   Pending -> Baking -> Out for delivery -> Delivered
+#   Pending / Baking -> Cancelled
+#
+# Delivered and Cancelled are final. Setting an order to the status it
+# already has is accepted as a no-op, so retried requests don't fail.
+# Orders from before this state machine (Accepted, In Progress, Rejected)
+# are renamed by migration 5.
+
+PENDING = 'Pending'
+BAKING = 'Baking'
+OUT_FOR_DELIVERY = 'Out for delivery'
+DELIVERED = 'Delivered'
+CANCELLED = 'Cancelled'
+
+STATUSES = (PENDING, BAKING, OUT_FOR_DELIVERY, DELIVERED, CANCELLED)
+TRANSITIONS = {
+    PENDING: (BAKING, CANCELLED),
+    BAKING: (OUT_FOR_DELIVERY, CANCELLED),
+    OUT_FOR_DELIVERY: (DELIVERED,),
+    DELIVERED: (),
+    CANCELLED: (),
+}
+MAX_BATCH_SIZE = 500
+
+
+class InvalidTransitionError(ValueError):
+    pass
+
+
+def check_transition(current, new):
+    """Raises ValueError for an unknown status, InvalidTransitionError for a move the lifecycle doesn't allow."""
+    if new not in TRANSITIONS:
+        raise ValueError(f"Unknown status {new!r}; expected one of: {', '.join(STATUSES)}")
+    if current != new and new not in TRANSITIONS.get(current, ()):
+        raise InvalidTransitionError(f"Cannot move an order from {current} to {new}")
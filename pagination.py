@@ -0,0 +1,108 @@
+import base64
+import json
+from datetime import datetime
+from flask import request
+
+# Keyset (cursor) pagination for listings ordered by (created_at, id).
+#
+# A cursor is the (created_at, id) of the last row on the previous page,
+# base64url-encoded so clients treat it as opaque. The next page is
+# "rows strictly older than the cursor", which the (…, created_at) indexes
+# answer directly; unlike OFFSET the cost does not grow with page number.
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+def encode_cursor(created_at, row_id):
+    raw = json.dumps([str(created_at), row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """Returns (created_at, id) or raises ValueError for a malformed cursor."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(created_at, str) or not isinstance(row_id, int):
+        raise ValueError("Invalid cursor")
+    return created_at, row_id
+
+def make_page(rows, limit):
+    """
+    Takes up to limit + 1 rows fetched newest-first and returns the page
+    dict sent to clients. The extra row only tells us another page exists.
+    """
+    items = [dict(row) for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = items[-1]
+        next_cursor = encode_cursor(last['created_at'], last['id'])
+    return {"items": items, "next_cursor": next_cursor}
+
+# Ranked results (search) have no stable (created_at, id) order, so they
+# page by offset instead, behind the same kind of opaque cursor.
+def encode_offset_cursor(offset):
+    return base64.urlsafe_b64encode(json.dumps({"offset": offset}).encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_offset_cursor(cursor):
+    """Returns the offset or raises ValueError for a malformed cursor."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        offset = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))['offset']
+    except (ValueError, TypeError, KeyError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(offset, int) or offset < 0:
+        raise ValueError("Invalid cursor")
+    return offset
+
+def _parse_date(value, name):
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').strftime('%Y-%m-%d')
+    except ValueError:
+        raise ValueError(f"{name} must be a date in YYYY-MM-DD format")
+
+def page_args():
+    """
+    Reads limit/cursor from the query string, clamping limit to
+    MAX_PAGE_SIZE. Raises ValueError on bad input.
+    """
+    try:
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    cursor = request.args.get('cursor')
+    return {"limit": limit, "after": decode_cursor(cursor) if cursor else None}
+
+def filter_args(with_status=True):
+    """
+    Reads the optional status and from/to (YYYY-MM-DD, inclusive) filters.
+    """
+    args = {
+        "date_from": _parse_date(request.args.get('from'), 'from'),
+        "date_to": _parse_date(request.args.get('to'), 'to'),
+    }
+    if with_status:
+        args["status"] = request.args.get('status') or None
+    return args
+
+def keyset_clause(alias, after, date_from=None, date_to=None):
+    """
+    Builds the extra WHERE conditions (each starting with AND) and params
+    for an "after" cursor plus an optional created_at date range.
+    """
+    prefix = f"{alias}." if alias else ""
+    sql, params = "", []
+    if after:
+        sql += f" AND ({prefix}created_at, {prefix}id) < (?, ?)"
+        params.extend(after)
+    if date_from:
+        sql += f" AND {prefix}created_at >= ?"
+        params.append(date_from)
+    if date_to:
+        sql += f" AND {prefix}created_at < DATE(?, '+1 day')"
+        params.append(date_to)
+    return sql, params
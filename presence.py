@@ -0,0 +1,96 @@
+import threading
+from flask import current_app
+
+
+class PresenceRegistry:
+    """
+    Tracks connected Socket.IO sessions with indexed maps so that connect,
+    disconnect and lookups are O(1) regardless of how many sockets are open:
+
+      sid     -> {user_id, role, shop_id}
+      user_id -> set of sids (a user may have several tabs open)
+      shop_id -> set of shopkeeper sids
+
+    The chat handlers maintain it; the REST blueprints query it through
+    get_presence(). The message bus (bus.py) owns the instance, so with a
+    multi-process bus the queries see every worker's sessions.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._users = {}
+        self._shops = {}
+
+    def connect(self, sid, user_id, role, shop_id=None):
+        session = {"user_id": user_id, "role": role, "shop_id": shop_id}
+        with self._lock:
+            # Re-registering a socket (e.g. after a login change) replaces it
+            self._remove(sid)
+            self._sessions[sid] = session
+            self._users.setdefault(user_id, set()).add(sid)
+            if role == 'shopkeeper' and shop_id is not None:
+                self._shops.setdefault(shop_id, set()).add(sid)
+        return session
+
+    def disconnect(self, sid):
+        """Removes the session and returns what was registered for it, if anything."""
+        with self._lock:
+            return self._remove(sid)
+
+    def _remove(self, sid):
+        session = self._sessions.pop(sid, None)
+        if session is None:
+            return None
+        self._discard(self._users, session['user_id'], sid)
+        if session['role'] == 'shopkeeper' and session['shop_id'] is not None:
+            self._discard(self._shops, session['shop_id'], sid)
+        return session
+
+    @staticmethod
+    def _discard(index, key, sid):
+        sids = index.get(key)
+        if sids is not None:
+            sids.discard(sid)
+            if not sids:
+                del index[key]
+
+    def get(self, sid):
+        with self._lock:
+            return self._sessions.get(sid)
+
+    def user_sids(self, user_id):
+        with self._lock:
+            return frozenset(self._users.get(user_id, ()))
+
+    def shop_sids(self, shop_id):
+        with self._lock:
+            return frozenset(self._shops.get(shop_id, ()))
+
+    def is_user_online(self, user_id):
+        with self._lock:
+            return user_id in self._users
+
+    def is_shop_online(self, shop_id):
+        with self._lock:
+            return shop_id in self._shops
+
+    def user_session_count(self, user_id):
+        with self._lock:
+            return len(self._users.get(user_id, ()))
+
+    def shop_session_count(self, shop_id):
+        with self._lock:
+            return len(self._shops.get(shop_id, ()))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "users": len(self._users),
+                "shops": len(self._shops),
+            }
+
+
+def get_presence():
+    return current_app.extensions['bus'].presence
@@ -0,0 +1,190 @@
+import threading
+from flask import current_app
+from .catalog_cache import get_catalog_cache
+
+# Server-side prices for designer orders.
+#
+# The option surcharges and the add-on list are the ones the designer and
+# add-ons pages show. Prices are additive, so instead of materializing every
+# cake x flavor x size x decoration x add-on combination we keep, per cake,
+# a table of (flavor, size) -> price and add the flat option and add-on
+# prices on top. Pricing an item is then a handful of dict lookups no
+# matter how large the catalog is.
+
+SIZE_MODIFIERS = {'½kg': 0.0, '1kg': 10.0, '2kg': 20.0, '3kg': 30.0}
+SIZE_ALIASES = {'0.5kg': '½kg', '1/2kg': '½kg'}
+# Charged when the option is anything other than "None"; coatings are free
+DECORATION_PRICES = {'top_decoration': 3.0, 'side_decoration': 4.0, 'topping': 2.0}
+ADD_ON_PRICES = {
+    'Colorful birthday candles': 99.0,
+    'Set of 10 festive balloons': 199.0,
+    'Party Caps & Hats': 149.0,
+    'Heart Cake Topper': 249.0,
+    'Ribbon & Bow Set': 129.0,
+    'Gold Star Topper': 199.0,
+}
+DELIVERY_FEE = 50.0
+# Client totals are floats added up in the browser
+PRICE_TOLERANCE = 0.01
+MAX_QUOTE_ITEMS = 200
+
+
+class PricingError(ValueError):
+    """An item that cannot be priced (unknown cake, flavor, size or add-on)."""
+
+
+class PriceMismatchError(ValueError):
+    """The client's prices differ from the server's."""
+
+    def __init__(self, message, expected_total, expected_prices):
+        super().__init__(message)
+        self.expected_total = expected_total
+        self.expected_prices = expected_prices
+
+
+def normalize_size(size):
+    key = str(size or '').replace(' ', '').lower()
+    return SIZE_ALIASES.get(key, key)
+
+def _has_option(value):
+    return value not in (None, '') and str(value).lower() != 'none'
+
+def build_price_table(cake):
+    """(flavor name, size) -> price for one cake from load_catalog()."""
+    flavors = cake['flavors'] or [{'name': None, 'price_modifier': 0.0}]
+    table = {}
+    for flavor in flavors:
+        for size, size_price in SIZE_MODIFIERS.items():
+            table[(flavor['name'], size)] = cake['base_price'] + flavor['price_modifier'] + size_price
+    return table
+
+
+class PricingEngine:
+    """
+    Caches one price table per cake. Entries are tagged with the shop's
+    catalog version from the catalog cache, so update_cake, add_flavor,
+    delete_flavor (and every other catalog mutation) make them stale
+    through the same invalidate_catalog() call that drops cached listings.
+    Tables for cakes that are missing or stale are built in one batched
+    catalog query per call.
+    """
+
+    def __init__(self):
+        self._tables = {}  # cake_id -> (shop_id, catalog version, table)
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'items_priced': 0}
+
+    def _tables_for(self, cake_ids):
+        from .models import load_catalog
+
+        versions = get_catalog_cache()
+        tables, missing = {}, []
+        with self._lock:
+            for cake_id in cake_ids:
+                entry = self._tables.get(cake_id)
+                if entry is not None and entry[1] == versions.version(entry[0]):
+                    tables[cake_id] = entry
+                    self._stats['hits'] += 1
+                else:
+                    missing.append(cake_id)
+                    self._stats['misses'] += 1
+        if not missing:
+            return tables
+
+        # Any catalog change bumps the global version, so if it is unchanged
+        # after the load, the per-shop versions we tag the tables with are
+        # the ones they were built from.
+        global_version = versions.version()
+        cakes = load_catalog(cake_ids=missing)
+        with self._lock:
+            keep = versions.version() == global_version
+            for cake in cakes:
+                entry = (cake['shop_id'], versions.version(cake['shop_id']), build_price_table(cake))
+                tables[cake['id']] = entry
+                if keep:
+                    self._tables[cake['id']] = entry
+        return tables
+
+    def _price_item(self, item, tables):
+        if not isinstance(item, dict):
+            raise PricingError("Each item must be an object")
+        cake_id = item.get('cake_id')
+        entry = tables.get(cake_id)
+        if entry is None:
+            raise PricingError(f"Unknown cake: {cake_id}")
+        shop_id, _, table = entry
+
+        size = normalize_size(item.get('size'))
+        if size not in SIZE_MODIFIERS:
+            raise PricingError(f"Unknown size: {item.get('size')}")
+        price = table.get((item.get('flavor'), size))
+        if price is None:
+            raise PricingError(f"Unknown flavor for cake {cake_id}: {item.get('flavor')}")
+
+        for field, surcharge in DECORATION_PRICES.items():
+            if _has_option(item.get(field)):
+                price += surcharge
+        for name in item.get('addOns') or ():
+            add_on_price = ADD_ON_PRICES.get(name)
+            if add_on_price is None:
+                raise PricingError(f"Unknown add-on: {name}")
+            price += add_on_price
+        return round(price, 2), shop_id
+
+    def quote(self, items):
+        """
+        Prices a batch of item configurations. Returns one dict per item,
+        {"price": ..., "shop_id": ...} or {"error": ...}, in input order.
+        """
+        tables = self._tables_for({
+            item.get('cake_id') for item in items
+            if isinstance(item, dict) and isinstance(item.get('cake_id'), int)
+        })
+        quotes = []
+        for item in items:
+            try:
+                price, shop_id = self._price_item(item, tables)
+                quotes.append({"price": price, "shop_id": shop_id})
+            except PricingError as e:
+                quotes.append({"error": str(e)})
+        with self._lock:
+            self._stats['items_priced'] += len(items)
+        return quotes
+
+    def validate_order(self, shop_id, items, total_price):
+        """
+        Checks an order's per-item prices and total (items plus delivery)
+        against the server's prices. Returns the expected prices in item
+        order; raises PricingError for an item that cannot be priced and
+        PriceMismatchError when the client's numbers are off.
+        """
+        quotes = self.quote(items)
+        prices = []
+        for quote in quotes:
+            if 'error' in quote:
+                raise PricingError(quote['error'])
+            if quote['shop_id'] != int(shop_id):
+                raise PricingError("All items must come from the shop the order is placed with")
+            prices.append(quote['price'])
+
+        expected_total = round(sum(prices) + DELIVERY_FEE, 2)
+        mismatch = any(
+            item.get('price') is not None and abs(float(item['price']) - price) > PRICE_TOLERANCE
+            for item, price in zip(items, prices)
+        )
+        if mismatch or abs(float(total_price) - expected_total) > PRICE_TOLERANCE:
+            raise PriceMismatchError("Prices have changed, please review your order", expected_total, prices)
+        return prices
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['tables'] = len(self._tables)
+        return stats
+
+
+def get_pricing():
+    return current_app.extensions['pricing']
+
+def init_app(app):
+    app.extensions['pricing'] = PricingEngine()
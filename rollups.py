@@ -0,0 +1,41 @@
+# Rebuilds the per-shop analytics rollup tables from the orders table.
+#
+# The rollups are normally maintained incrementally by the trg_orders_rollup_*
+# triggers (see migrations.py), so this is only needed to backfill existing
+# data or to repair drift, e.g. `python init_db.py --rebuild-rollups`.
+
+ROLLUP_TABLES = ('shop_status_counts', 'shop_daily_revenue', 'shop_rating_stats')
+
+REBUILD_STATEMENTS = (
+    """
+    INSERT INTO shop_status_counts (shop_id, status, orders_count)
+    SELECT shop_id, status, COUNT(*) FROM orders {where} GROUP BY shop_id, status
+    """,
+    """
+    INSERT INTO shop_daily_revenue (shop_id, day, orders_count, revenue)
+    SELECT shop_id, DATE(created_at), COUNT(*), SUM(total_price) FROM orders
+    WHERE status = 'Delivered' {and_where} GROUP BY shop_id, DATE(created_at)
+    """,
+    """
+    INSERT INTO shop_rating_stats (shop_id, rating_sum, rating_count)
+    SELECT shop_id, SUM(rating), COUNT(rating) FROM orders
+    WHERE rating IS NOT NULL {and_where} GROUP BY shop_id
+    """,
+)
+
+def rebuild_rollups(connection, shop_id=None):
+    """
+    Recomputes the rollups for one shop, or for every shop when shop_id is
+    None. Runs inside the caller's transaction; the caller commits.
+    """
+    if shop_id is None:
+        params = ()
+        delete_where, where, and_where = "", "", ""
+    else:
+        params = (shop_id,)
+        delete_where, where, and_where = "WHERE shop_id = ?", "WHERE shop_id = ?", "AND shop_id = ?"
+
+    for table in ROLLUP_TABLES:
+        connection.execute(f"DELETE FROM {table} {delete_where}", params)
+    for statement in REBUILD_STATEMENTS:
+        connection.execute(statement.format(where=where, and_where=and_where), params)
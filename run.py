@@ -1,3 +1,8 @@
+# Patch blocking primitives (sockets, locks, sleep) before anything else is imported,
+# so the db connection pool and socket handlers yield to other greenlets
+import eventlet
+eventlet.monkey_patch()
+
 from app import create_app, socketio # 1. Import socketio
 
 # Create the app instance using your factory
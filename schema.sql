@@ -1,3 +1,6 @@
+-- Base schema. Indexes and later changes are versioned in migrations.py;
+-- run init_db.py to apply them (init_db.py --reset to start fresh).
+
 -- Drop tables if they already exist to start fresh
 DROP TABLE IF EXISTS users;
 DROP TABLE IF EXISTS shops;
@@ -6,6 +9,9 @@ DROP TABLE IF EXISTS flavors;
 DROP TABLE IF EXISTS orders;
 DROP TABLE IF EXISTS order_items;
 DROP TABLE IF EXISTS chat_messages;
+-- Derived from the tables above by migrations; rebuilt when they run again
+DROP TABLE IF EXISTS cake_search;
+DROP TABLE IF EXISTS conversations;
 
 -- Shops Table
 CREATE TABLE shops (
@@ -0,0 +1,77 @@
+import re
+from flask import request
+from .pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_offset_cursor
+
+# Catalog search for the browse page.
+#
+# The cake_search FTS5 table (migration 6) indexes each cake's name, its
+# shop's name and its flavor names; triggers on cakes, flavors and shops
+# keep it in step, so there is nothing to rebuild by hand. Text matches are
+# ranked with bm25, weighting the cake name above flavors above the shop.
+# Facets (shape, shop, price range) are counted with every filter applied
+# except their own, so picking one shape still shows the others as options.
+
+TOKEN_RE = re.compile(r'\w+')
+MAX_QUERY_TERMS = 8
+SORTS = ('relevance', 'price_asc', 'price_desc', 'name')
+
+
+def match_query(text):
+    """
+    Turns free text into an FTS5 query where every word must match as a
+    prefix ("choc cak" finds "Chocolate Cake"). Each term is quoted, so FTS5
+    syntax typed by users (AND, NEAR, column filters) is just text. None if
+    the text has no words.
+    """
+    terms = TOKEN_RE.findall(text or '')[:MAX_QUERY_TERMS]
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"*' for term in terms)
+
+def _list_arg(name):
+    # ?shape=circle&shape=square and ?shape=circle,square both work
+    values = []
+    for raw in request.args.getlist(name):
+        values.extend(value.strip() for value in raw.split(',') if value.strip())
+    return values
+
+def _price_arg(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        price = float(value)
+    except ValueError:
+        raise ValueError(f"{name} must be a number")
+    if price < 0 or price != price:
+        raise ValueError(f"{name} must be a non-negative number")
+    return price
+
+def search_args():
+    """
+    Reads q, shape, shop_id, min_price, max_price, sort, limit and cursor
+    from the query string into search_cakes() keyword arguments. Raises
+    ValueError on bad input.
+    """
+    try:
+        shop_ids = sorted({int(value) for value in _list_arg('shop_id')})
+    except ValueError:
+        raise ValueError("shop_id must be an integer")
+    try:
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    sort = request.args.get('sort') or 'relevance'
+    if sort not in SORTS:
+        raise ValueError(f"sort must be one of: {', '.join(SORTS)}")
+    cursor = request.args.get('cursor')
+    return {
+        "match": match_query(request.args.get('q')),
+        "shapes": sorted(set(_list_arg('shape'))),
+        "shop_ids": shop_ids,
+        "min_price": _price_arg('min_price'),
+        "max_price": _price_arg('max_price'),
+        "sort": sort,
+        "limit": max(1, min(limit, MAX_PAGE_SIZE)),
+        "offset": decode_offset_cursor(cursor) if cursor else 0,
+    }
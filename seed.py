@@ -0,0 +1,434 @@
+"""
+Deterministic scale-test dataset generator.
+
+Builds a fresh database (schema.sql plus every migration) and fills it
+with shops, cakes with flavors, customers, orders with their items and
+snapshot images, reviews and chat threads. The same --seed and sizes always
+produce the same rows, ids and timestamps, so bench_suite.py numbers from
+different branches or machines are taken on the same data.
+
+    python seed.py --scale medium
+    python seed.py --scale large --db instance/bench-large.db
+    python seed.py --scale small --orders 2000000 --reset
+
+Snapshot images go to a blob store next to the database (bench.db.blobs
+for bench.db) unless --blob-store names another directory, so seeding
+never writes into the dev server's instance/blobs.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import struct
+import sys
+import time
+import zlib
+from datetime import datetime, timedelta
+from app import create_app, bcrypt
+from app.config import Config
+from app.blobstore import BlobStore
+from app.migrations import migrate
+from app.order_status import PENDING, BAKING, OUT_FOR_DELIVERY, DELIVERED, CANCELLED
+from app.pricing import SIZE_MODIFIERS, DECORATION_PRICES, DELIVERY_FEE
+from app.rollups import rebuild_rollups
+
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), 'schema.sql')
+DEFAULT_DB = os.path.join(os.path.dirname(Config.DATABASE_PATH), 'bench.db')
+# Every seeded account logs in with this password
+SEED_PASSWORD = 'seed-password'
+# Rows per executemany/commit
+CHUNK = 20000
+
+SCALES = {
+    'small':  dict(shops=5, cakes_per_shop=20, customers=500, orders=5000, threads=300, messages_per_thread=6),
+    'medium': dict(shops=50, cakes_per_shop=40, customers=20000, orders=200000, threads=10000, messages_per_thread=8),
+    'large':  dict(shops=200, cakes_per_shop=60, customers=100000, orders=2000000, threads=50000, messages_per_thread=10),
+}
+
+CAKE_STYLES = ['Classic', 'Royal', 'Velvet', 'Truffle', 'Signature', 'Rustic', 'Party', 'Heritage', 'Dream', 'Cloud']
+CAKE_BASES = ['Chocolate', 'Vanilla', 'Red Velvet', 'Black Forest', 'Butterscotch', 'Pineapple', 'Mango',
+              'Strawberry', 'Blueberry', 'Coffee', 'Caramel', 'Lemon', 'Pistachio', 'Rasmalai', 'Oreo']
+CAKE_KINDS = ['Cake', 'Gateau', 'Sponge', 'Layer Cake', 'Cheesecake', 'Mousse Cake']
+FLAVORS = [
+    ('Chocolate', '#5C3317', 0.0), ('Vanilla', '#F3E5AB', 0.0), ('Strawberry', '#FC5A8D', 2.0),
+    ('Butterscotch', '#E3963E', 2.0), ('Mango', '#FFC324', 3.0), ('Blueberry', '#4F86F7', 4.0),
+    ('Coffee', '#6F4E37', 2.5), ('Pistachio', '#93C572', 5.0), ('Red Velvet', '#C0392B', 4.0),
+    ('Lemon', '#FFF44F', 1.5), ('Caramel', '#AF6E4D', 3.0), ('Coconut', '#FFFAF0', 1.0),
+]
+SHAPES = ['circle', 'square']
+SIZES = list(SIZE_MODIFIERS)
+COATINGS = ['None (Flavor)', 'Dark Choco', 'White Choco', 'Strawberry Glaze', 'Lemon Cream', 'Mint Green', 'Blueberry']
+TOP_DECORATIONS = ['None', 'Shell Border', 'Rosettes', 'Dotted Border', 'Drop Flowers', 'Leaf Border']
+SIDE_DECORATIONS = ['None', 'Bottom Shells', 'Bead Border']
+TOPPINGS = ['None', 'Choco Sprinkles', 'Pineapple Sprinkles']
+CUSTOM_TEXTS = [None, None, 'Happy Birthday', 'Congratulations', 'Happy Anniversary', 'Love You Mom',
+                'Welcome Home', 'Get Well Soon', 'Best Wishes', 'Happy 30th']
+REVIEW_TEXTS = [None, 'Loved it!', 'Tasted amazing, will order again.', 'Delivered on time and looked great.',
+                'A bit too sweet for us.', 'The decoration was exactly what I designed.', 'Good, but arrived late.',
+                'Best cake in town.', 'Moist and fresh, everyone enjoyed it.']
+CUSTOMER_LINES = ['Hi, is the {flavor} cake available today?', 'Can you write a longer message on top?',
+                  'What time will my order arrive?', 'Can I change the size to 2 kg?', 'Thank you so much!',
+                  'Do you have eggless options?', 'Is it possible to add candles?']
+SHOP_LINES = ['Yes, it is available.', 'Sure, we can do that.', 'It will be delivered by 6 pm.',
+              'We have updated your order.', 'You are welcome!', 'All our cakes can be made eggless.',
+              'Candles are available as an add-on.']
+
+
+def skewed(rng, count):
+    """An index in [0, count) where low indexes are much more likely, like real traffic to popular shops."""
+    return min(count - 1, int(count * rng.random() ** 2.5))
+
+def timestamp(moment):
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+def noise_png(rng, size_bytes):
+    """A valid RGB PNG of roughly size_bytes (noise doesn't compress), built with the stdlib only."""
+    width = max(8, int((size_bytes / 3) ** 0.5))
+    raw = b''.join(b'\x00' + rng.randbytes(width * 3) for _ in range(width))
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+    header = struct.pack('>IIBBBBB', width, width, 8, 2, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', zlib.compress(raw, 1)) + chunk(b'IEND', b'')
+
+def insert_chunks(connection, sql, rows):
+    """executemany over a row generator, committing every CHUNK rows. Returns the row count."""
+    total = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= CHUNK:
+            connection.executemany(sql, batch)
+            connection.commit()
+            total += len(batch)
+            batch = []
+    if batch:
+        connection.executemany(sql, batch)
+        connection.commit()
+        total += len(batch)
+    return total
+
+
+class Seeder:
+    def __init__(self, connection, store, sizes, seed, end, days, password_hash, progress=print):
+        self.connection = connection
+        self.store = store
+        self.sizes = sizes
+        self.rng = random.Random(seed)
+        self.end = end
+        self.start = end - timedelta(days=days)
+        self.password_hash = password_hash
+        self.progress = progress
+        self.counts = {}
+        self.cakes = []  # per shop: [(cake_id, base_price, shape, [(flavor, modifier), ...]), ...]
+
+    def _done(self, name, count, started):
+        self.counts[name] = count
+        self.progress(f"  {name:<15} {count:>10,} rows  {time.perf_counter() - started:6.1f} s")
+
+    def users_and_shops(self):
+        started = time.perf_counter()
+        shops = self.sizes['shops']
+        customers = self.sizes['customers']
+        # Shopkeepers are users 1..shops and own shops 1..shops; customers follow
+        self.connection.executemany(
+            "INSERT INTO users (id, email, password_hash, role, shop_id) VALUES (?, ?, ?, 'shopkeeper', ?)",
+            [(n, f"owner{n}@shop.example.com", self.password_hash, n) for n in range(1, shops + 1)]
+        )
+        self.connection.executemany(
+            "INSERT INTO shops (id, owner_id, shop_name, created_at) VALUES (?, ?, ?, ?)",
+            [(n, n, f"{self.rng.choice(CAKE_STYLES)} Bakes {n}", timestamp(self.start)) for n in range(1, shops + 1)]
+        )
+        self.connection.commit()
+        count = insert_chunks(
+            self.connection,
+            "INSERT INTO users (id, email, password_hash, role) VALUES (?, ?, ?, 'customer')",
+            ((shops + n, f"customer{n}@example.com", self.password_hash) for n in range(1, customers + 1))
+        )
+        self._done('users', shops + count, started)
+        self.counts['shops'] = shops
+
+    def customer_id(self, index):
+        return self.sizes['shops'] + 1 + index
+
+    def catalog(self):
+        started = time.perf_counter()
+        rng = self.rng
+        cake_rows, flavor_rows = [], []
+        cake_id = flavor_id = 0
+        for shop_id in range(1, self.sizes['shops'] + 1):
+            shop_cakes = []
+            names = set()
+            for _ in range(max(1, int(self.sizes['cakes_per_shop'] * rng.uniform(0.5, 1.5)))):
+                name = f"{rng.choice(CAKE_STYLES)} {rng.choice(CAKE_BASES)} {rng.choice(CAKE_KINDS)}"
+                if name in names:
+                    continue
+                names.add(name)
+                cake_id += 1
+                base_price = float(rng.randrange(300, 2500, 50))
+                shape = rng.choice(SHAPES)
+                cake_rows.append((cake_id, shop_id, name, base_price, shape))
+                flavors = []
+                for flavor, color_hex, modifier in rng.sample(FLAVORS, rng.randint(1, 5)):
+                    flavor_id += 1
+                    flavor_rows.append((flavor_id, cake_id, flavor, color_hex, modifier))
+                    flavors.append((flavor, modifier))
+                shop_cakes.append((cake_id, base_price, shape, flavors))
+            self.cakes.append(shop_cakes)
+        # Flavors first, so the cake_search insert trigger indexes the flavor names
+        self.connection.executemany(
+            "INSERT INTO flavors (id, cake_id, name, color_hex, price_modifier) VALUES (?, ?, ?, ?, ?)", flavor_rows)
+        self.connection.executemany(
+            "INSERT INTO cakes (id, shop_id, name, base_price, shape) VALUES (?, ?, ?, ?, ?)", cake_rows)
+        self.connection.commit()
+        self._done('cakes', len(cake_rows), started)
+        self.counts['flavors'] = len(flavor_rows)
+
+    def snapshots(self):
+        started = time.perf_counter()
+        refs = [
+            self.store.put(noise_png(self.rng, self.sizes['snapshot_kb'] * 1024), 'image/png')
+            for _ in range(self.sizes['snapshot_images'])
+        ]
+        self._done('snapshot blobs', len(refs), started)
+        return refs
+
+    def _status(self, created):
+        age = (self.end - created).total_seconds() / 86400
+        roll = self.rng.random()
+        if age > 3:
+            return CANCELLED if roll < 0.06 else DELIVERED
+        if roll < 0.3:
+            return PENDING
+        if roll < 0.6:
+            return BAKING
+        if roll < 0.8:
+            return OUT_FOR_DELIVERY
+        return DELIVERED if roll < 0.95 else CANCELLED
+
+    def _order_rows(self, refs):
+        rng = self.rng
+        orders = self.sizes['orders']
+        span = (self.end - self.start).total_seconds()
+        item_id = 0
+        for order_id in range(1, orders + 1):
+            # Evenly spread and increasing, jittered within each slot
+            created = self.start + timedelta(seconds=int(span * (order_id - 1 + rng.random()) / orders))
+            shop_index = skewed(rng, self.sizes['shops'])
+            customer_id = self.customer_id(skewed(rng, self.sizes['customers']))
+            status = self._status(created)
+            items = []
+            for _ in range(rng.choice((1, 1, 1, 2, 2, 3))):
+                cake_id, base_price, shape, flavors = rng.choice(self.cakes[shop_index])
+                flavor, modifier = rng.choice(flavors)
+                size = rng.choice(SIZES)
+                top, side, topping = rng.choice(TOP_DECORATIONS), rng.choice(SIDE_DECORATIONS), rng.choice(TOPPINGS)
+                price = base_price + modifier + SIZE_MODIFIERS[size]
+                for option, value in (('top_decoration', top), ('side_decoration', side), ('topping', topping)):
+                    if value != 'None':
+                        price += DECORATION_PRICES[option]
+                item_id += 1
+                items.append((
+                    item_id, order_id, cake_id, flavor, size, rng.choice(CUSTOM_TEXTS), round(price, 2), shape,
+                    rng.choice(COATINGS), top, side, topping,
+                    # Designer orders carry the snapshot on their first item
+                    rng.choice(refs) if refs and not items and rng.random() < 0.8 else None,
+                ))
+            rating = review = None
+            if status == DELIVERED and rng.random() < self.sizes['review_rate']:
+                rating = rng.choices((1, 2, 3, 4, 5), weights=(3, 4, 10, 30, 53))[0]
+                review = rng.choice(REVIEW_TEXTS)
+            total = round(sum(item[6] for item in items) + DELIVERY_FEE, 2)
+            yield (order_id, customer_id, shop_index + 1, total, status, timestamp(created), rating, review), items
+
+    def orders(self, refs):
+        started = time.perf_counter()
+        order_sql = ("INSERT INTO orders (id, customer_id, shop_id, total_price, status, created_at, rating, review_text)"
+                     " VALUES (?, ?, ?, ?, ?, ?, ?, ?)")
+        item_sql = ("INSERT INTO order_items (id, order_id, cake_id, flavor, size, custom_text, price, shape, coating,"
+                    " top_decoration, side_decoration, topping, snapshot_ref) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)")
+        orders = items = reviews = 0
+        order_batch, item_batch = [], []
+
+        def flush():
+            self.connection.executemany(order_sql, order_batch)
+            self.connection.executemany(item_sql, item_batch)
+            self.connection.commit()
+            order_batch.clear()
+            item_batch.clear()
+
+        with rollup_triggers_paused(self.connection):
+            for order, order_items in self._order_rows(refs):
+                order_batch.append(order)
+                item_batch.extend(order_items)
+                orders += 1
+                items += len(order_items)
+                reviews += order[6] is not None
+                if len(order_batch) >= CHUNK:
+                    flush()
+                    if orders % (CHUNK * 10) == 0:
+                        self.progress(f"    ... {orders:,} orders")
+            flush()
+        self._done('orders', orders, started)
+        self.counts['order_items'] = items
+        self.counts['reviews'] = reviews
+
+    def chats(self):
+        started = time.perf_counter()
+        rng = self.rng
+        threads = self.sizes['threads']
+        span = (self.end - self.start).total_seconds()
+
+        def rows():
+            message_id = 0
+            for thread in range(threads):
+                shop_id = skewed(rng, self.sizes['shops']) + 1
+                customer_id = self.customer_id(skewed(rng, self.sizes['customers']))
+                moment = self.start + timedelta(seconds=int(span * (thread + rng.random()) / threads))
+                sender_is_customer = True
+                for _ in range(rng.randint(1, self.sizes['messages_per_thread'] * 2 - 1)):
+                    message_id += 1
+                    if sender_is_customer:
+                        text = rng.choice(CUSTOMER_LINES).format(flavor=rng.choice(FLAVORS)[0].lower())
+                        sender_id = customer_id
+                    else:
+                        text = rng.choice(SHOP_LINES)
+                        sender_id = shop_id  # shop N is owned by user N
+                    yield (message_id, shop_id, customer_id, sender_id, text, timestamp(moment))
+                    moment += timedelta(seconds=rng.randint(20, 3600))
+                    sender_is_customer = not sender_is_customer if rng.random() < 0.8 else sender_is_customer
+
+        count = insert_chunks(
+            self.connection,
+            "INSERT INTO chat_messages (id, shop_id, customer_id, sender_id, message, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            rows()
+        )
+        # Threads quiet for more than a couple of days have been read by both sides
+        self.connection.execute(
+            "UPDATE conversations SET shop_unread = 0, customer_unread = 0 WHERE last_at < ?",
+            (timestamp(self.end - timedelta(days=2)),)
+        )
+        self.connection.commit()
+        self._done('chat_messages', count, started)
+
+    def run(self):
+        self.users_and_shops()
+        self.catalog()
+        refs = self.snapshots()
+        self.orders(refs)
+        self.chats()
+        self.counts['conversations'] = self.connection.execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+        return self.counts
+
+
+class rollup_triggers_paused:
+    """
+    Drops the analytics rollup triggers for a bulk order load and recreates
+    them afterwards, rebuilding the rollups from the orders in one pass
+    (the same repair path as init_db.py --rebuild-rollups).
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.triggers = []
+
+    def __enter__(self):
+        self.triggers = self.connection.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'trg_orders_rollup_%'"
+        ).fetchall()
+        for name, _ in self.triggers:
+            self.connection.execute(f"DROP TRIGGER {name}")
+        self.connection.commit()
+        return self
+
+    def __exit__(self, *exc):
+        for _, sql in self.triggers:
+            self.connection.execute(sql)
+        rebuild_rollups(self.connection)
+        self.connection.commit()
+        return False
+
+
+def manifest_path(db_path):
+    return db_path + '.seed.json'
+
+def blob_store_path(db_path):
+    return db_path + '.blobs'
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--db', default=DEFAULT_DB, help="database file to create (default: instance/bench.db)")
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--reset', action='store_true', help="replace the database if it exists")
+    parser.add_argument('--blob-store', help="directory for snapshot images (default: <db>.blobs)")
+    for name in SCALES['small']:
+        parser.add_argument('--' + name.replace('_', '-'), type=int, default=None,
+                            help=f"override the scale's {name.replace('_', ' ')}")
+    parser.add_argument('--review-rate', type=float, default=0.35, help="share of delivered orders with a review")
+    parser.add_argument('--snapshot-kb', type=int, default=24, help="size of each order snapshot image")
+    parser.add_argument('--snapshot-images', type=int, default=64,
+                        help="distinct snapshot images (the blob store dedupes identical ones)")
+    parser.add_argument('--end', default='2025-06-30', help="date of the newest order (YYYY-MM-DD)")
+    parser.add_argument('--days', type=int, default=365, help="days of order history")
+    args = parser.parse_args()
+
+    sizes = dict(SCALES[args.scale])
+    for name in SCALES['small']:
+        if getattr(args, name) is not None:
+            sizes[name] = getattr(args, name)
+    sizes.update(review_rate=args.review_rate, snapshot_kb=args.snapshot_kb, snapshot_images=args.snapshot_images)
+
+    db_path = os.path.abspath(args.db)
+    blob_path = os.path.abspath(args.blob_store) if args.blob_store else blob_store_path(db_path)
+    if os.path.exists(db_path):
+        if not args.reset:
+            raise SystemExit(f"{db_path} already exists; pass --reset to replace it")
+        for suffix in ('', '-wal', '-shm', '.seed.json'):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+        # Only the default store belongs to this database; a --blob-store directory may be shared
+        if not args.blob_store and os.path.isdir(blob_path):
+            shutil.rmtree(blob_path)
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+
+    app = create_app()
+    with app.app_context():
+        # One hash for every account; hashing each one would take hours at a realistic cost
+        password_hash = bcrypt.generate_password_hash(SEED_PASSWORD, app.config['BCRYPT_LOG_ROUNDS']).decode('utf-8')
+
+    print(f"Seeding {db_path} ({args.scale}, seed {args.seed}), snapshots in {blob_path}")
+    started = time.perf_counter()
+    connection = sqlite3.connect(db_path)
+    try:
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute("PRAGMA synchronous = OFF")  # a crash just means seeding again
+        with open(SCHEMA_PATH, 'r') as f:
+            connection.executescript(f.read())
+        migrate(connection)
+        seeder = Seeder(
+            connection, BlobStore(blob_path), sizes, args.seed,
+            datetime.strptime(args.end, '%Y-%m-%d'), args.days, password_hash
+        )
+        counts = seeder.run()
+    except sqlite3.Error as e:
+        print(f"An error occurred: {e}")
+        sys.exit(1)
+    finally:
+        connection.close()
+
+    # Written next to the database so bench_suite.py can tell which dataset it ran on
+    manifest = {
+        "scale": args.scale, "seed": args.seed, "end": args.end, "days": args.days,
+        "sizes": sizes, "counts": counts, "password": SEED_PASSWORD, "blob_store": blob_path,
+    }
+    with open(manifest_path(db_path), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Done in {time.perf_counter() - started:.1f} s: "
+          + ', '.join(f"{name} {count:,}" for name, count in counts.items()))
+
+if __name__ == '__main__':
+    main()
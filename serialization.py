@@ -0,0 +1,171 @@
+import csv
+import io
+import json
+import sqlite3
+from operator import itemgetter
+from flask import current_app
+from flask.json.provider import DefaultJSONProvider
+from .pagination import encode_cursor
+
+try:
+    import orjson
+except ImportError:  # listed in requirements.txt; the stdlib encoder produces the same JSON
+    orjson = None
+
+# Fast path from sqlite rows to JSON bytes.
+#
+# FastJSONProvider replaces Flask's provider: jsonify() goes through orjson
+# when it is installed and straight to bytes either way. Listing functions
+# can skip the list-of-dicts step altogether: encode_page() reads the cursor
+# row by row and returns an Encoded payload that json_response() sends
+# without touching it again. Output matches Flask's (sorted keys, compact).
+
+
+class Encoded(bytes):
+    """JSON that is already serialized; json_response() sends it as-is."""
+
+
+def _default(obj):
+    if isinstance(obj, sqlite3.Row):
+        return dict(obj)
+    return DefaultJSONProvider.default(obj)
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def dumps_bytes(obj):
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS | orjson.OPT_SORT_KEYS)
+
+    def _dumps_sorted(obj):
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS)
+else:
+    def dumps_bytes(obj):
+        return json.dumps(obj, default=_default, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+    def _dumps_sorted(obj):
+        return json.dumps(obj, default=_default, separators=(',', ':')).encode('utf-8')
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        if kwargs:  # indent and friends: let the stdlib handle it
+            kwargs.setdefault('default', _default)
+            return super().dumps(obj, **kwargs)
+        return dumps_bytes(obj).decode('utf-8')
+
+    def response(self, *args, **kwargs):
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj) + b'\n', mimetype=self.mimetype)
+
+
+def json_response(data, status=200):
+    body = data if isinstance(data, Encoded) else dumps_bytes(data)
+    return current_app.response_class(body, status=status, mimetype='application/json')
+
+def row_converter(cursor):
+    """
+    Returns a function turning the cursor's rows into dicts whose keys are
+    already in sorted order, so they can be encoded without re-sorting
+    every row. Column positions are worked out once per cursor.
+    """
+    names = [column[0] for column in cursor.description]
+    order = sorted(range(len(names)), key=names.__getitem__)
+    keys = [names[i] for i in order]
+    if len(order) == 1:
+        return lambda row: {keys[0]: row[order[0]]}
+    pick = itemgetter(*order)
+    return lambda row: dict(zip(keys, pick(row)))
+
+def stream_rows(cursor):
+    """Yields a JSON array of the cursor's rows in chunks, for streamed responses."""
+    convert = row_converter(cursor)
+    yield b'['
+    for index, row in enumerate(cursor):
+        yield (b',' if index else b'') + _dumps_sorted(convert(row))
+    yield b']'
+
+def stream_ndjson(cursor):
+    """Yields the cursor's rows as newline-delimited JSON, one object per row."""
+    convert = row_converter(cursor)
+    for row in cursor:
+        yield _dumps_sorted(convert(row)) + b'\n'
+
+def stream_nested_ndjson(cursor, key, child_name, child_columns):
+    """
+    NDJSON for a parent/child join ordered by `key`: consecutive rows with
+    the same key become one object whose `child_name` list holds the
+    child_columns of each row (rows where they are all NULL add nothing,
+    as with a LEFT JOIN miss).
+    """
+    names = [column[0] for column in cursor.description]
+    parent_columns = [name for name in names if name not in child_columns]
+    parent, current = None, object()
+    for row in cursor:
+        if row[key] != current:
+            if parent is not None:
+                yield dumps_bytes(parent) + b'\n'
+            current = row[key]
+            parent = {name: row[name] for name in parent_columns}
+            parent[child_name] = []
+        child = {name: row[name] for name in child_columns}
+        if any(value is not None for value in child.values()):
+            parent[child_name].append(child)
+    if parent is not None:
+        yield dumps_bytes(parent) + b'\n'
+
+# Spreadsheets run cells starting with these as formulas
+CSV_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+def stream_csv(cursor, text_columns=None, chunk_rows=500):
+    """
+    Yields the cursor as CSV (header from the column names), chunk_rows rows
+    at a time. Values of text_columns (user-entered text; every column if
+    None) that would start a spreadsheet formula get a leading quote.
+    """
+    names = [column[0] for column in cursor.description]
+    guarded = [i for i, name in enumerate(names) if text_columns is None or name in text_columns]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(names)
+    while True:
+        rows = cursor.fetchmany(chunk_rows)
+        if not rows:
+            break
+        for row_index, row in enumerate(rows):
+            risky = [i for i in guarded if isinstance(row[i], str) and row[i].startswith(CSV_FORMULA_PREFIXES)]
+            if risky:
+                row = list(row)
+                for i in risky:
+                    row[i] = "'" + row[i]
+                rows[row_index] = row
+        writer.writerows(rows)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+def encode_rows(cursor):
+    convert = row_converter(cursor)
+    return Encoded(_dumps_sorted([convert(row) for row in cursor]))
+
+def encode_page(cursor, limit, reverse=False):
+    """
+    Encoded equivalent of make_page(cursor.fetchall(), limit): reads at most
+    limit + 1 rows from a newest-first keyset query without fetchall and
+    encodes the page in one call. reverse=True emits the items oldest-first
+    (chat threads).
+    """
+    convert = row_converter(cursor)
+    items, has_more = [], False
+    for row in cursor:
+        if len(items) == limit:
+            has_more = True
+            break
+        items.append(convert(row))
+    next_cursor = encode_cursor(items[-1]['created_at'], items[-1]['id']) if has_more else None
+    if reverse:
+        items.reverse()
+    return Encoded(_dumps_sorted({"items": items, "next_cursor": next_cursor}))
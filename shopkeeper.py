@@ -2,6 +2,7 @@ from flask import Blueprint, jsonify, request
 from app.models import (
     get_all_shop_orders, 
     update_order_status,
+    update_order_statuses,
     create_cake,
     update_cake,
     delete_cake,
@@ -9,22 +10,45 @@ from app.models import (
     delete_flavor,
     get_all_cakes_with_flavors,
     get_analytics_data,
-    get_shop_customers_from_orders,
+    get_shop_inbox,
+    mark_conversation_read,
     get_chat_history,
     get_shop_reviews,
     update_shop_name,
-    get_shop_order_details # --- 1. Import new function ---
+    get_shop_order_details, # --- 1. Import new function ---
+    get_order_version,
+    get_catalog_export_rows,
+    get_order_export_rows,
+    get_review_export_rows,
+    ORDER_EXPORT_ITEM_COLUMNS
 )
 
+from app.blobstore import attach_snapshot_urls, attach_image_urls, store_image_url, get_blob_store
+from app.derivatives import get_derivatives
+from app.catalog_cache import cached_json
+from app.pagination import page_args, filter_args
+from app.presence import get_presence
+from app.tokens import identity_error
+from app.serialization import json_response, stream_csv, stream_ndjson, stream_nested_ndjson
+from app.http_cache import not_modified, fingerprint_etag
+from app.order_status import MAX_BATCH_SIZE
+from app.catalog_io import detect_format, read_csv, read_ndjson, import_catalog, export_csv, export_ndjson, FORMATS
+from flask import g, current_app, stream_with_context
+
 bp = Blueprint('shopkeeper', __name__)
 
+# Every shopkeeper route needs a shopkeeper's token
+@bp.before_request
+def require_shopkeeper():
+    return identity_error('shopkeeper')
+
 # --- Helper function to get shop_id ---
 def get_shop_id():
-    shop_id = request.args.get('shop_id', type=int)
-    if not shop_id:
-        data = request.get_json()
-        if data:
-            shop_id = data.get('shop_id')
+    """
+    The caller's shop, from their verified token. A shop_id sent in the
+    query string or body is ignored.
+    """
+    shop_id = g.identity['shop_id']
     if not shop_id:
         raise ValueError("Shop ID is required for this operation")
     return shop_id
@@ -32,10 +56,16 @@ def get_shop_id():
 # --- ORDER MANAGEMENT ---
 @bp.route('/orders')
 def get_orders():
+    """
+    One page of the shop's orders, newest first.
+    Query: limit, cursor, status, from, to (YYYY-MM-DD).
+    """
     try:
         shop_id = get_shop_id()
-        orders = get_all_shop_orders(shop_id)
-        return jsonify(orders), 200
+        page = get_all_shop_orders(shop_id, **page_args(), **filter_args(), encoded=True)
+        return json_response(page)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
     except Exception as e:
         return jsonify(error=str(e)), 500
         
@@ -47,8 +77,15 @@ def get_order_details_for_shop(order_id):
     """
     try:
         shop_id = get_shop_id()
+        version = get_order_version(order_id, shop_id=shop_id)
+        if version is None:
+            return jsonify(error="Order not found or access denied"), 404
+        early = not_modified(fingerprint_etag('order', order_id, version))
+        if early is not None:
+            return early
         details = get_shop_order_details(order_id, shop_id)
         if details:
+            attach_snapshot_urls(details['items'])
             return jsonify(details), 200
         else:
             return jsonify(error="Order not found or access denied"), 404
@@ -64,11 +101,38 @@ def set_order_status(order_id):
         new_status = data.get('status')
         if not new_status:
             return jsonify(error="New status is required"), 400
-        rows_affected = update_order_status(order_id, new_status, shop_id)
-        if rows_affected > 0:
+        result = update_order_status(order_id, new_status, shop_id)
+        if result['ok']:
             return jsonify(message=f"Order {order_id} status updated to {new_status}"), 200
-        else:
-            return jsonify(error="Order not found or no permission"), 404
+        return jsonify(error=result['error']), STATUS_ERROR_CODES[result['code']]
+    except Exception as e:
+        return jsonify(error=str(e)), 500
+
+STATUS_ERROR_CODES = {'not_found': 404, 'invalid_status': 400, 'invalid_transition': 409}
+
+@bp.route('/orders/status', methods=['POST'])
+def set_order_statuses():
+    """
+    Batch status change, applied in one transaction:
+        {"updates": [{"order_id": 12, "status": "Baking"}, ...]}
+    Each order is checked against the lifecycle on its own; the response
+    lists a result per update plus how many succeeded.
+    """
+    try:
+        shop_id = get_shop_id()
+        updates = (request.get_json(silent=True) or {}).get('updates')
+        if not isinstance(updates, list) or not updates:
+            return jsonify(error="updates must be a non-empty list"), 400
+        if len(updates) > MAX_BATCH_SIZE:
+            return jsonify(error=f"At most {MAX_BATCH_SIZE} updates per request"), 400
+        changes = []
+        for update in updates:
+            order_id, status = (update.get('order_id'), update.get('status')) if isinstance(update, dict) else (None, None)
+            if not isinstance(order_id, int) or isinstance(order_id, bool) or not isinstance(status, str) or not status:
+                return jsonify(error="Each update needs an integer order_id and a status string"), 400
+            changes.append((order_id, status))
+        results = update_order_statuses(shop_id, changes)
+        return jsonify(results=results, updated=sum(1 for result in results if result['ok'])), 200
     except Exception as e:
         return jsonify(error=str(e)), 500
 
@@ -87,8 +151,10 @@ def get_analytics():
 def get_reviews():
     try:
         shop_id = get_shop_id()
-        reviews = get_shop_reviews(shop_id)
-        return jsonify(reviews), 200
+        page = get_shop_reviews(shop_id, **page_args(), **filter_args(with_status=False), encoded=True)
+        return json_response(page)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
     except Exception as e:
         return jsonify(error=str(e)), 500
         
@@ -114,8 +180,7 @@ def put_shop_settings():
 def get_all_products():
     try:
         shop_id = get_shop_id()
-        products = get_all_cakes_with_flavors(shop_id)
-        return jsonify(products), 200
+        return cached_json(('shop', shop_id), lambda: attach_image_urls(get_all_cakes_with_flavors(shop_id)), shop_id)
     except Exception as e:
         return jsonify(error=str(e)), 500
 @bp.route('/cakes', methods=['POST'])
@@ -124,10 +189,14 @@ def add_new_cake():
         shop_id = get_shop_id()
         data = request.get_json()
         name, base_price, shape = data.get('name'), data.get('base_price'), data.get('shape')
-        image_url = data.get('image_url')
         if not all([name, base_price, shape]):
             return jsonify(error="Name, base_price, and shape are required"), 400
-        cake_id = create_cake(name, base_price, shape, image_url, shop_id)
+        try:
+            image_url, image_ref = store_image_url(get_blob_store(), data.get('image_url'))
+        except ValueError as e:
+            return jsonify(error=f"Invalid image: {e}"), 400
+        get_derivatives().submit(image_ref)
+        cake_id = create_cake(name, base_price, shape, image_url, shop_id, image_ref)
         if cake_id:
             return jsonify(message="Cake created successfully", cakeId=cake_id), 201
         else:
@@ -140,10 +209,14 @@ def update_existing_cake(cake_id):
         shop_id = get_shop_id()
         data = request.get_json()
         name, base_price, shape = data.get('name'), data.get('base_price'), data.get('shape')
-        image_url = data.get('image_url')
         if not all([name, base_price, shape]):
             return jsonify(error="Name, base_price, and shape are required"), 400
-        rows_affected = update_cake(cake_id, name, base_price, shape, image_url, shop_id)
+        try:
+            image_url, image_ref = store_image_url(get_blob_store(), data.get('image_url'))
+        except ValueError as e:
+            return jsonify(error=f"Invalid image: {e}"), 400
+        get_derivatives().submit(image_ref)
+        rows_affected = update_cake(cake_id, name, base_price, shape, image_url, shop_id, image_ref)
         if rows_affected > 0:
             return jsonify(message="Cake updated successfully"), 200
         else:
@@ -191,20 +264,136 @@ def delete_existing_flavor(flavor_id):
     except Exception as e:
         return jsonify(error=str(e)), 500
 
+# --- ACCOUNTING EXPORTS ---
+# Full history as a streamed download: the cursor is read row by row while
+# the response is written, so memory stays flat however many orders a shop
+# has. Query: format=csv|ndjson (default csv), from/to (YYYY-MM-DD).
+ORDER_EXPORT_TEXT_COLUMNS = ('customer_email', 'cake_name', 'flavor', 'coating', 'top_decoration', 'side_decoration', 'topping', 'custom_text')
+
+def export_response(fmt, body, filename):
+    response = current_app.response_class(stream_with_context(body), mimetype=FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}.{fmt}"'
+    return response
+
+@bp.route('/orders/export', methods=['GET'])
+def export_shop_orders():
+    """CSV has one row per order item; NDJSON has one order per line with an items list. Also takes status."""
+    try:
+        shop_id = get_shop_id()
+        fmt = detect_format(request.args.get('format', 'csv'), None)
+        if fmt is None:
+            return jsonify(error="format must be csv or ndjson"), 400
+        cursor = get_order_export_rows(shop_id, **filter_args())
+        if fmt == 'csv':
+            body = stream_csv(cursor, text_columns=ORDER_EXPORT_TEXT_COLUMNS)
+        else:
+            body = stream_nested_ndjson(cursor, 'order_id', 'items', ORDER_EXPORT_ITEM_COLUMNS)
+        return export_response(fmt, body, f"orders-shop{shop_id}")
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    except Exception as e:
+        return jsonify(error=str(e)), 500
+
+@bp.route('/reviews/export', methods=['GET'])
+def export_shop_reviews():
+    try:
+        shop_id = get_shop_id()
+        fmt = detect_format(request.args.get('format', 'csv'), None)
+        if fmt is None:
+            return jsonify(error="format must be csv or ndjson"), 400
+        cursor = get_review_export_rows(shop_id, **filter_args(with_status=False))
+        body = stream_csv(cursor, text_columns=('customer_email', 'review_text')) if fmt == 'csv' else stream_ndjson(cursor)
+        return export_response(fmt, body, f"reviews-shop{shop_id}")
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    except Exception as e:
+        return jsonify(error=str(e)), 500
+
+# --- BULK CATALOG IMPORT / EXPORT ---
+@bp.route('/catalog/import', methods=['POST'])
+def import_shop_catalog():
+    """
+    Upserts cakes and flavors from a CSV or NDJSON body (see catalog_io.py),
+    read as a stream. ?format=csv|ndjson, else taken from the Content-Type;
+    ?dry_run=1 only validates. Per-line errors are listed in the response.
+    """
+    try:
+        shop_id = get_shop_id()
+        fmt = detect_format(request.args.get('format'), request.content_type)
+        if fmt is None:
+            return jsonify(error="Send text/csv or application/x-ndjson, or pass ?format=csv|ndjson"), 400
+        dry_run = request.args.get('dry_run', '').lower() in ('1', 'true', 'yes')
+        try:
+            records = read_csv(request.stream) if fmt == 'csv' else read_ndjson(request.stream)
+            summary, image_refs = import_catalog(
+                shop_id, records, get_blob_store(),
+                batch_size=current_app.config['CATALOG_IMPORT_BATCH_SIZE'], dry_run=dry_run
+            )
+        except (ValueError, UnicodeDecodeError) as e:
+            return jsonify(error=str(e)), 400
+        for image_ref in image_refs:
+            get_derivatives().submit(image_ref)
+        return jsonify(summary), 200
+    except Exception as e:
+        return jsonify(error=str(e)), 500
+
+@bp.route('/catalog/export', methods=['GET'])
+def export_shop_catalog():
+    """Streams the shop's catalog as CSV (default) or NDJSON, in the import format."""
+    try:
+        shop_id = get_shop_id()
+        fmt = detect_format(request.args.get('format', 'csv'), None)
+        if fmt is None:
+            return jsonify(error="format must be csv or ndjson"), 400
+        cursor = get_catalog_export_rows(shop_id)
+        body = export_csv(cursor) if fmt == 'csv' else export_ndjson(cursor)
+        return export_response(fmt, body, f"catalog-shop{shop_id}")
+    except Exception as e:
+        return jsonify(error=str(e)), 500
+
 # --- CHAT ROUTES (Unchanged) ---
 @bp.route('/conversations', methods=['GET'])
 def get_conversations():
+    """
+    The shop's inbox, most recent thread first, with each thread's last
+    message and unread count. Query: limit, cursor.
+    """
     try:
         shop_id = get_shop_id()
-        conversations = get_shop_customers_from_orders(shop_id) 
-        return jsonify(conversations), 200
+        return jsonify(get_shop_inbox(shop_id, **page_args())), 200
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    except Exception as e:
+        return jsonify(error=str(e)), 500
+@bp.route('/chat/<int:customer_id>/read', methods=['POST'])
+def mark_shop_chat_read(customer_id):
+    """Body (optional): {"last_message_id"} -- the newest message the shopkeeper has seen."""
+    try:
+        shop_id = get_shop_id()
+        last_message_id = (request.get_json(silent=True) or {}).get('last_message_id')
+        if last_message_id is not None and not isinstance(last_message_id, int):
+            return jsonify(error="last_message_id must be an integer"), 400
+        unread = mark_conversation_read(shop_id, customer_id, 'shop', last_message_id)
+        if unread is None:
+            return jsonify(error="Conversation not found"), 404
+        return jsonify(unread=unread), 200
     except Exception as e:
         return jsonify(error=str(e)), 500
 @bp.route('/chat/<int:customer_id>', methods=['GET'])
 def get_shop_chat_history(customer_id):
     try:
         shop_id = get_shop_id()
-        history = get_chat_history(shop_id, customer_id)
-        return jsonify(history), 200
+        page = get_chat_history(shop_id, customer_id, **page_args(), encoded=True)
+        return json_response(page)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
     except Exception as e:
-        return jsonify(error=str(e)), 500
\ No newline at end of file
+        return jsonify(error=str(e)), 500
+@bp.route('/customers/<int:customer_id>/presence', methods=['GET'])
+def get_customer_presence(customer_id):
+    """
+    Whether a customer is connected to chat, and on how many tabs.
+    """
+    presence = get_presence()
+    sessions = presence.user_session_count(customer_id)
+    return jsonify(customer_id=customer_id, online=sessions > 0, sessions=sessions), 200
\ No newline at end of file
@@ -0,0 +1,239 @@
+import functools
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from flask import current_app
+
+# Opt-in SQL statement tracing (DB_TRACE=1), for the dev server.
+#
+# With tracing on, the connection pools open TracingConnections. Every
+# statement is timed and reduced to a fingerprint: literals become "?",
+# IN lists and multi-row VALUES collapse, whitespace and comments go, so
+# "WHERE id IN (?, ?, ?)" and "WHERE id IN (?, ?)" add up as one query.
+# A statement's time is its execute() plus the fetchone/fetchmany/fetchall
+# calls made on its cursor (rows pulled by iterating the cursor are not
+# timed). Per fingerprint we keep calls, total/mean/max time and the
+# EXPLAIN QUERY PLAN taken the first time the fingerprint was seen;
+# /api/stats/sql lists the heaviest ones. Statements slower than
+# DB_SLOW_QUERY_MS are printed with their plan as they happen.
+
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+COMMENT_RE = re.compile(r'--[^\n]*|/\*.*?\*/', re.S)
+NUMBER_RE = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?(?![\w.])')
+PARAM_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+VALUES_ROWS_RE = re.compile(r'(\((?:\?|\.\.\.)(?:\s*,\s*(?:\?|\.\.\.))*\))(?:\s*,\s*\((?:\?|\.\.\.)(?:\s*,\s*(?:\?|\.\.\.))*\))+')
+SPACE_RE = re.compile(r'\s+')
+EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+SORTS = ('total', 'mean', 'max', 'calls')
+# Distinct fingerprints remembered; anything past this is counted under OVERFLOW
+MAX_FINGERPRINTS = 2000
+OVERFLOW = '(other statements)'
+
+
+@functools.lru_cache(maxsize=4096)
+def fingerprint(sql):
+    """Normalizes a statement so that queries differing only in literals or list lengths compare equal."""
+    text = COMMENT_RE.sub(' ', sql)
+    text = STRING_RE.sub('?', text)
+    text = NUMBER_RE.sub('?', text)
+    text = PARAM_LIST_RE.sub('(...)', text)
+    text = VALUES_ROWS_RE.sub(r'\1, ...', text)
+    return SPACE_RE.sub(' ', text).strip().rstrip(';').strip()
+
+def fingerprint_id(text):
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=4).hexdigest()
+
+
+class SqlTracer:
+    def __init__(self, slow_ms=100, top_n=20):
+        self.slow = slow_ms / 1000.0
+        self.top_n = top_n
+        self._lock = threading.Lock()
+        self._table = {}  # fingerprint -> {calls, total, max, slow, plan}
+        self._stats = {'statements': 0, 'slow': 0, 'time': 0.0}
+
+    def _explain(self, conn, sql, parameters):
+        if not sql.lstrip().upper().startswith(EXPLAINABLE):
+            return None
+        try:
+            # A plain cursor, so the EXPLAIN itself is not traced
+            rows = sqlite3.Cursor(conn).execute("EXPLAIN QUERY PLAN " + sql, parameters).fetchall()
+        except (sqlite3.Error, ValueError, TypeError):
+            return None
+        return [row[3] for row in rows]
+
+    def prepare(self, conn, sql, parameters):
+        """Fingerprints `sql` before it runs; explains it if the fingerprint is new."""
+        text = fingerprint(sql)
+        with self._lock:
+            known = text in self._table or len(self._table) >= MAX_FINGERPRINTS
+        if not known:
+            plan = self._explain(conn, sql, parameters)
+            with self._lock:
+                self._table.setdefault(text, {'calls': 0, 'total': 0.0, 'max': 0.0, 'slow': 0, 'plan': plan})
+        return text
+
+    def record(self, text, sql, parameters, elapsed):
+        with self._lock:
+            entry = self._table.get(text)
+            if entry is None:
+                entry = self._table.setdefault(OVERFLOW, {'calls': 0, 'total': 0.0, 'max': 0.0, 'slow': 0, 'plan': None})
+            entry['calls'] += 1
+            entry['total'] += elapsed
+            if elapsed > entry['max']:
+                entry['max'] = elapsed
+            self._stats['statements'] += 1
+            self._stats['time'] += elapsed
+            slow = elapsed >= self.slow
+            if slow:
+                entry['slow'] += 1
+                self._stats['slow'] += 1
+            plan = entry['plan']
+        if slow:
+            self._log_slow(text, sql, parameters, elapsed, plan)
+
+    def _log_slow(self, text, sql, parameters, elapsed, plan):
+        params = repr(parameters)
+        if len(params) > 200:
+            params = params[:200] + '...'
+        print(f"[slow sql] {elapsed * 1000:.1f} ms [{fingerprint_id(text)}] {SPACE_RE.sub(' ', sql).strip()} -- params {params}")
+        for detail in plan or ():
+            print(f"    plan: {detail}")
+
+    def top(self, limit=None, sort='total'):
+        """The heaviest fingerprints, sorted by total, mean or max time, or by calls."""
+        with self._lock:
+            entries = [(text, dict(entry)) for text, entry in self._table.items() if entry['calls']]
+        for _, entry in entries:
+            entry['mean'] = entry['total'] / entry['calls']
+        entries.sort(key=lambda item: item[1][sort], reverse=True)
+        return [
+            {
+                "id": fingerprint_id(text),
+                "fingerprint": text,
+                "calls": entry['calls'],
+                "total_ms": round(entry['total'] * 1000, 3),
+                "mean_ms": round(entry['mean'] * 1000, 3),
+                "max_ms": round(entry['max'] * 1000, 3),
+                "slow": entry['slow'],
+                "plan": entry['plan'],
+            }
+            for text, entry in entries[:limit or self.top_n]
+        ]
+
+    def reset(self):
+        with self._lock:
+            self._table.clear()
+            self._stats = {'statements': 0, 'slow': 0, 'time': 0.0}
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['fingerprints'] = len(self._table)
+        stats['time'] = round(stats['time'], 4)
+        stats['slow_ms'] = self.slow * 1000
+        return stats
+
+
+class TracingCursor(sqlite3.Cursor):
+    _pending = None
+
+    def _add(self, elapsed):
+        if self._pending is not None:
+            self._pending[3] += elapsed
+
+    def _finish(self):
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            self.connection.tracer.record(*pending)
+
+    def _run(self, method, sql, parameters, plan_parameters):
+        self._finish()
+        text = self.connection.tracer.prepare(self.connection, sql, plan_parameters)
+        started = time.perf_counter()
+        try:
+            return method(sql, parameters)
+        finally:
+            self._pending = [text, sql, parameters, time.perf_counter() - started]
+
+    def execute(self, sql, parameters=()):
+        self._run(super().execute, sql, parameters, parameters)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        # Only a list can be peeked at for the plan without consuming it
+        first = seq_of_parameters[0] if isinstance(seq_of_parameters, (list, tuple)) and seq_of_parameters else None
+        self._run(super().executemany, sql, seq_of_parameters, first if first is not None else ())
+        return self
+
+    def executescript(self, sql_script):
+        self._finish()
+        text = fingerprint(sql_script)
+        started = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            self.connection.tracer.record(text, sql_script, (), time.perf_counter() - started)
+
+    def _timed_fetch(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self._add(time.perf_counter() - started)
+
+    def fetchone(self):
+        row = self._timed_fetch(super().fetchone)
+        if row is None:
+            self._finish()
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self._timed_fetch(functools.partial(super().fetchmany, *args, **kwargs))
+        if not rows:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed_fetch(super().fetchall)
+        self._finish()
+        return rows
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        self._finish()
+
+
+class TracingConnection(sqlite3.Connection):
+    """sqlite3 connection factory whose cursors report to self.tracer."""
+    tracer = None
+
+    def cursor(self, factory=None):
+        return super().cursor(factory or TracingCursor)
+
+    # sqlite3.Connection's shortcuts don't go through cursor(), so route them explicitly
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+
+def get_sql_tracer(app=None):
+    app = app or current_app
+    return app.extensions.get('sql_tracer')
+
+def init_app(app):
+    if app.config['DB_TRACE']:
+        app.extensions['sql_tracer'] = SqlTracer(
+            slow_ms=app.config['DB_SLOW_QUERY_MS'],
+            top_n=app.config['DB_TRACE_TOP_N'],
+        )
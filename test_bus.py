@@ -0,0 +1,394 @@
+"""
+Multi-worker tests for the sqlite message bus.
+
+Every worker gets a fake Socket.IO server that records what it would have
+emitted, so the tests can check which worker's sockets an event reached.
+
+  SqliteBusWorkersTest         two SqliteBus instances in this process,
+                               polled by hand
+  CatalogAcrossWorkersTest     two apps on one bus and database: a catalog
+                               write on one must reach the other's caches
+  SeparateProcessWorkersTest   two app workers in their own processes,
+                               tailing the bus file in the background
+
+    python -m pytest test_bus.py
+"""
+import multiprocessing
+import os
+import queue
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+
+from app import create_app
+from app.bus import SqliteBus
+from app.catalog_cache import CATALOG_INVALIDATED, CatalogCache, invalidate_catalog
+from app.config import Config
+from app.db import close_pools
+from app.migrations import migrate
+from app.models import update_cake
+
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), 'schema.sql')
+# Short, so heartbeat expiry can be tested in about a second
+WORKER_TTL = 0.5
+
+
+class RecordingSocketIO:
+    """Just enough of flask_socketio.SocketIO for the bus."""
+
+    def __init__(self):
+        self.emitted = []
+
+    def emit(self, event, data, to=None):
+        self.emitted.append((event, data, to))
+
+    def start_background_task(self, target, *args, **kwargs):
+        thread = threading.Thread(target=target, args=args, kwargs=kwargs, daemon=True)
+        thread.start()
+        return thread
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+
+class SqliteBusWorkersTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'bus.db')
+        self.io_a, self.io_b = RecordingSocketIO(), RecordingSocketIO()
+        self.bus_a = SqliteBus(self.io_a, self.path)
+        self.bus_b = SqliteBus(self.io_b, self.path)
+        # Register both workers without the poller threads; the tests poll by hand
+        for bus in (self.bus_a, self.bus_b):
+            bus._started = True
+            bus._heartbeat()
+
+    def tearDown(self):
+        for bus in (self.bus_a, self.bus_b):
+            bus.close()
+            bus._conn.close()
+        self.tmp.cleanup()
+
+    def test_event_published_on_a_reaches_room_on_b(self):
+        self.bus_a.publish('new_message', {'message': 'hi'}, 'shop_7')
+
+        # A emits to its own sockets directly and does not relay its own event
+        self.assertEqual(self.io_a.emitted, [('new_message', {'message': 'hi'}, 'shop_7')])
+        self.bus_a.poll()
+        self.assertEqual(len(self.io_a.emitted), 1)
+
+        self.assertEqual(self.io_b.emitted, [])
+        self.assertEqual(self.bus_b.poll(), 1)
+        self.assertEqual(self.io_b.emitted, [('new_message', {'message': 'hi'}, 'shop_7')])
+        self.assertEqual(self.bus_b.stats()['relayed'], 1)
+
+        # Already seen: nothing is relayed twice
+        self.assertEqual(self.bus_b.poll(), 0)
+        self.assertEqual(len(self.io_b.emitted), 1)
+
+    def test_presence_on_b_is_visible_on_a(self):
+        self.assertFalse(self.bus_a.presence.is_shop_online(7))
+
+        self.bus_b.presence.connect('sid-b1', 42, 'shopkeeper', shop_id=7)
+        self.bus_b.presence.connect('sid-b2', 42, 'shopkeeper', shop_id=7)
+        self.bus_a.presence.connect('sid-a1', 5, 'customer')
+
+        self.assertTrue(self.bus_a.presence.is_shop_online(7))
+        self.assertTrue(self.bus_a.presence.is_user_online(42))
+        self.assertEqual(self.bus_a.presence.shop_session_count(7), 2)
+        self.assertTrue(self.bus_b.presence.is_user_online(5))
+        stats = self.bus_a.presence.stats()
+        self.assertEqual((stats['sessions'], stats['users'], stats['shops']), (3, 2, 1))
+        self.assertEqual(stats['local_sessions'], 1)
+
+        self.bus_b.presence.disconnect('sid-b1')
+        self.assertEqual(self.bus_a.presence.shop_session_count(7), 1)
+        self.bus_b.presence.disconnect('sid-b2')
+        self.assertFalse(self.bus_a.presence.is_shop_online(7))
+
+    def test_presence_of_stopped_worker_is_ignored(self):
+        self.bus_b.presence.connect('sid-b1', 42, 'shopkeeper', shop_id=7)
+        self.bus_b.execute("UPDATE bus_workers SET heartbeat_at = ? WHERE worker_id = ?",
+                           (time.time() - self.bus_b.worker_ttl * 2, self.bus_b.worker_id))
+        self.assertFalse(self.bus_a.presence.is_shop_online(7))
+
+    def test_concurrent_queries_while_polling(self):
+        # Request threads query presence while the poller relays; every query
+        # must see its own rows even though they share one connection.
+        self.bus_b.presence.connect('sid-b1', 42, 'shopkeeper', shop_id=7)
+        errors = []
+        stop = threading.Event()
+
+        def poller():
+            while not stop.is_set():
+                self.bus_a.poll()
+
+        def reader():
+            try:
+                for _ in range(300):
+                    if self.bus_a.presence.shop_session_count(7) != 1:
+                        errors.append('wrong count')
+                    self.bus_a.presence.stats()
+            except Exception as e:
+                errors.append(repr(e))
+
+        threads = [threading.Thread(target=poller)] + [threading.Thread(target=reader) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for i in range(50):
+            self.bus_b.publish('order_update', {'i': i}, 'user_5')
+        for thread in threads[1:]:
+            thread.join()
+        stop.set()
+        threads[0].join()
+        self.bus_a.poll()
+
+        self.assertEqual(errors, [])
+        relayed = [data['i'] for event, data, room in self.io_a.emitted]
+        self.assertEqual(relayed, list(range(50)))
+
+    def test_broadcast_reaches_other_workers_handlers(self):
+        cache_a, cache_b = CatalogCache(), CatalogCache()
+        self.bus_a.subscribe(CATALOG_INVALIDATED, lambda data: cache_a.invalidate(data['shop_id']))
+        self.bus_b.subscribe(CATALOG_INVALIDATED, lambda data: cache_b.invalidate(data['shop_id']))
+        self.assertEqual(cache_b.get_or_load('cakes', lambda: b'old', 7), b'old')
+
+        self.bus_a.broadcast(CATALOG_INVALIDATED, {'shop_id': 7})
+        self.bus_a.poll()
+        self.bus_b.poll()
+
+        # The sender invalidates its own cache directly, not through the bus
+        self.assertEqual(cache_a.version(7), 0)
+        self.assertEqual(cache_b.version(7), 1)
+        self.assertEqual(cache_b.get_or_load('cakes', lambda: b'new', 7), b'new')
+        # Notices are not Socket.IO events
+        self.assertEqual(self.io_a.emitted + self.io_b.emitted, [])
+
+    def test_started_worker_relays_in_background(self):
+        io_c = RecordingSocketIO()
+        bus_c = SqliteBus(io_c, self.path, poll_interval=0.01)
+        try:
+            bus_c.start()
+            self.bus_a.publish('new_message', {'message': 'later'}, 'user_9')
+            deadline = time.monotonic() + 2
+            while not io_c.emitted and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(io_c.emitted, [('new_message', {'message': 'later'}, 'user_9')])
+        finally:
+            bus_c.close()
+            time.sleep(0.05)
+            bus_c._conn.close()
+
+
+
+def _worker_config(path, db_path):
+    class WorkerConfig(Config):
+        DATABASE_PATH = db_path
+        MESSAGE_BUS = 'sqlite'
+        MESSAGE_BUS_PATH = path
+        MESSAGE_BUS_POLL_INTERVAL = 0.02
+        METRICS_ENABLED = False
+    return WorkerConfig
+
+
+class CatalogAcrossWorkersTest(unittest.TestCase):
+    """A catalog write on worker A must reach worker B's listing cache and price tables."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        db_path = os.path.join(self.tmp.name, 'app.db')
+        connection = sqlite3.connect(db_path)
+        with open(SCHEMA_PATH) as f:
+            connection.executescript(f.read())
+        migrate(connection)
+        connection.execute("INSERT INTO users (email, password_hash, role) VALUES ('shop@example.com', 'x', 'shopkeeper')")
+        self.shop_id = connection.execute("INSERT INTO shops (owner_id, shop_name) VALUES (1, 'Shop')").lastrowid
+        self.cake_id = connection.execute(
+            "INSERT INTO cakes (name, base_price, shape, shop_id) VALUES ('Choc', 10, 'round', ?)", (self.shop_id,)
+        ).lastrowid
+        connection.execute(
+            "INSERT INTO flavors (cake_id, name, color_hex, price_modifier) VALUES (?, 'Vanilla', '#ffffff', 0)",
+            (self.cake_id,)
+        )
+        connection.commit()
+        connection.close()
+
+        config = _worker_config(os.path.join(self.tmp.name, 'bus.db'), db_path)
+        self.app_a, self.app_b = create_app(config), create_app(config)
+        # Polled by hand instead of by the background task
+        self.bus_b = self.app_b.extensions['bus']
+
+    def tearDown(self):
+        for app in (self.app_a, self.app_b):
+            close_pools(app)
+            app.extensions['bus'].close()
+            app.extensions['bus']._conn.close()
+        self.tmp.cleanup()
+
+    def update_price_on_a(self, base_price):
+        with self.app_a.app_context():
+            self.assertEqual(update_cake(self.cake_id, 'Choc', base_price, 'round', None, self.shop_id), 1)
+
+    def price_on_b(self):
+        with self.app_b.app_context():
+            quote, = self.app_b.extensions['pricing'].quote([{'cake_id': self.cake_id, 'flavor': 'Vanilla', 'size': '1kg'}])
+        return quote['price']
+
+    def test_listing_cache_follows_other_worker(self):
+        cache_b = self.app_b.extensions['catalog_cache']
+        self.assertEqual(cache_b.get_or_load('cakes', lambda: b'old', self.shop_id), b'old')
+
+        self.update_price_on_a(15)
+        self.bus_b.poll()
+
+        self.assertEqual(cache_b.version(self.shop_id), 1)
+        self.assertEqual(cache_b.get_or_load('cakes', lambda: b'new', self.shop_id), b'new')
+
+    def test_prices_follow_other_worker(self):
+        self.assertEqual(self.price_on_b(), 20.0)
+
+        self.update_price_on_a(15)
+        # Until B's bus relays the notice it still prices from its cached table
+        self.assertEqual(self.price_on_b(), 20.0)
+        self.bus_b.poll()
+        self.assertEqual(self.price_on_b(), 25.0)
+
+
+class QueueSocketIO(RecordingSocketIO):
+    """Reports emits to the test process."""
+
+    def __init__(self, name, results):
+        super().__init__()
+        self.name = name
+        self.results = results
+
+    def emit(self, event, data, to=None):
+        self.results.put((self.name, 'emit', (event, data, to)))
+
+
+def _run_worker(name, path, db_path, commands, results):
+    """Body of a worker process: a whole app whose bus the test drives through `commands`."""
+    app = create_app(_worker_config(path, db_path))
+    bus = app.extensions['bus']
+    bus.socketio = QueueSocketIO(name, results)
+    bus.worker_ttl = WORKER_TTL
+    bus.start()
+    results.put((name, 'ready', None))
+    while True:
+        command, args = commands.get()
+        value = None
+        if command == 'crash':
+            os._exit(0)  # no close(): the presence rows stay until the heartbeat expires
+        elif command == 'stop':
+            bus.close()
+            results.put((name, command, None))
+            return
+        elif command == 'connect':
+            bus.presence.connect(*args)
+        elif command == 'publish':
+            bus.publish(*args)
+        elif command == 'shop_online':
+            value = bus.presence.is_shop_online(*args)
+        elif command == 'invalidate':
+            with app.app_context():
+                invalidate_catalog(*args)
+        elif command == 'catalog_version':
+            value = app.extensions['catalog_cache'].version(*args)
+        results.put((name, command, value))
+
+
+class SeparateProcessWorkersTest(unittest.TestCase):
+    """Two app workers in their own processes, each with its own connection to one bus file."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'bus.db')
+        context = multiprocessing.get_context('spawn')
+        self.results = context.Queue()
+        self.commands = {}
+        self.processes = {}
+        self.pending = []
+        for name in ('a', 'b'):
+            self.commands[name] = context.Queue()
+            self.processes[name] = context.Process(
+                target=_run_worker, daemon=True,
+                args=(name, self.path, os.path.join(self.tmp.name, 'app.db'), self.commands[name], self.results)
+            )
+            self.processes[name].start()
+        for name in ('a', 'b'):
+            self.wait_for(name, 'ready', timeout=30)
+
+    def tearDown(self):
+        for name, process in self.processes.items():
+            if process.is_alive():
+                self.commands[name].put(('stop', ()))
+                process.join(5)
+            if process.is_alive():
+                process.terminate()
+        self.tmp.cleanup()
+
+    def wait_for(self, name, kind, timeout=5):
+        """The value of the next (name, kind) result; other results are kept for later."""
+        deadline = time.monotonic() + timeout
+        while True:
+            for index, (got_name, got_kind, value) in enumerate(self.pending):
+                if (got_name, got_kind) == (name, kind):
+                    del self.pending[index]
+                    return value
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.fail(f"worker {name} sent no {kind}")
+            try:
+                self.pending.append(self.results.get(timeout=remaining))
+            except queue.Empty:
+                pass
+
+    def call(self, name, command, *args):
+        self.commands[name].put((command, args))
+        return self.wait_for(name, command)
+
+    def test_event_and_presence_cross_processes(self):
+        self.call('b', 'connect', 'sid-b1', 42, 'shopkeeper', 7)
+        self.assertTrue(self.call('a', 'shop_online', 7))
+
+        self.call('a', 'publish', 'new_message', {'message': 'hi'}, 'shop_7')
+        self.assertEqual(self.wait_for('a', 'emit'), ('new_message', {'message': 'hi'}, 'shop_7'))
+        self.assertEqual(self.wait_for('b', 'emit'), ('new_message', {'message': 'hi'}, 'shop_7'))
+
+        # B's heartbeats keep its sessions visible past the worker TTL
+        time.sleep(WORKER_TTL * 3)
+        self.assertTrue(self.call('a', 'shop_online', 7))
+
+    def test_catalog_invalidation_crosses_processes(self):
+        self.assertEqual(self.call('b', 'catalog_version', 7), 0)
+        self.call('a', 'invalidate', 7)
+        self.assertEqual(self.call('a', 'catalog_version', 7), 1)
+        deadline = time.monotonic() + 5
+        while self.call('b', 'catalog_version', 7) != 1:
+            self.assertLess(time.monotonic(), deadline, "worker b never saw the invalidation")
+            time.sleep(0.02)
+
+    def test_presence_of_crashed_worker_expires(self):
+        self.call('b', 'connect', 'sid-b1', 42, 'shopkeeper', 7)
+        self.assertTrue(self.call('a', 'shop_online', 7))
+
+        self.commands['b'].put(('crash', ()))
+        self.processes['b'].join(5)
+        time.sleep(WORKER_TTL * 1.5)
+        self.assertFalse(self.call('a', 'shop_online', 7))
+
+        # A's housekeeping purges the dead worker's rows a few TTLs later
+        connection = sqlite3.connect(self.path)
+        try:
+            deadline = time.monotonic() + 5
+            while connection.execute("SELECT COUNT(*) FROM bus_presence").fetchone()[0]:
+                self.assertLess(time.monotonic(), deadline, "presence rows of the crashed worker were never purged")
+                time.sleep(0.05)
+        finally:
+            connection.close()
+
+if __name__ == '__main__':
+    unittest.main()
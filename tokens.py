@@ -0,0 +1,157 @@
+import base64
+import functools
+import hashlib
+import hmac
+import json
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, g, jsonify, request
+
+# Stateless session tokens.
+#
+# A token is <payload>.<signature>, both base64url: the payload is the JSON
+# {"uid", "role", "shop", "exp"} and the signature its HMAC-SHA256 under
+# SECRET_KEY. Nothing is stored server-side; changing SECRET_KEY logs
+# everybody out. The identity in a token is what handlers trust, instead of
+# user/shop ids sent in URLs or bodies.
+
+
+class InvalidTokenError(ValueError):
+    pass
+
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+class TokenSigner:
+    """
+    Issues and verifies tokens. Verified tokens are kept in a small LRU, so
+    a client sending the same token on every request costs one dict lookup
+    (plus the expiry check) instead of an HMAC and a JSON decode.
+    """
+
+    def __init__(self, secret_key, ttl=7 * 24 * 3600, cache_size=1024):
+        self._key = secret_key.encode('utf-8')
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self._cache = OrderedDict()  # token -> identity
+        self._lock = threading.Lock()
+        self._stats = {'issued': 0, 'hits': 0, 'misses': 0, 'rejected': 0}
+
+    def _sign(self, payload):
+        return _b64encode(hmac.new(self._key, payload.encode('utf-8'), hashlib.sha256).digest())
+
+    def issue(self, user_id, role, shop_id=None):
+        claims = {"uid": user_id, "role": role, "shop": shop_id, "exp": int(time.time()) + self.ttl}
+        payload = _b64encode(json.dumps(claims, separators=(',', ':')).encode('utf-8'))
+        with self._lock:
+            self._stats['issued'] += 1
+        return f"{payload}.{self._sign(payload)}"
+
+    def verify(self, token):
+        """Returns {"user_id", "role", "shop_id", "exp"} or raises InvalidTokenError."""
+        with self._lock:
+            identity = self._cache.get(token)
+            if identity is not None:
+                if identity['exp'] > time.time():
+                    self._cache.move_to_end(token)
+                    self._stats['hits'] += 1
+                    return identity
+                del self._cache[token]
+            self._stats['misses'] += 1
+
+        try:
+            identity = self._decode(token)
+        except InvalidTokenError:
+            with self._lock:
+                self._stats['rejected'] += 1
+            raise
+
+        with self._lock:
+            self._cache[token] = identity
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return identity
+
+    def _decode(self, token):
+        payload, sep, signature = (token or '').partition('.')
+        if not sep or not hmac.compare_digest(signature, self._sign(payload)):
+            raise InvalidTokenError("Invalid token")
+        try:
+            claims = json.loads(_b64decode(payload))
+        except ValueError:
+            raise InvalidTokenError("Invalid token")
+        if claims.get('exp', 0) <= time.time():
+            raise InvalidTokenError("Token expired")
+        return {"user_id": claims['uid'], "role": claims['role'], "shop_id": claims.get('shop'), "exp": claims['exp']}
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['cached'] = len(self._cache)
+        return stats
+
+
+def get_signer():
+    return current_app.extensions['token_signer']
+
+def issue_token(user):
+    return get_signer().issue(user['id'], user['role'], user['shop_id'])
+
+def load_identity():
+    """
+    before_request hook: verifies the Bearer token, if any, and sets
+    g.identity (None for anonymous requests or bad tokens).
+    """
+    g.identity = None
+    header = request.headers.get('Authorization', '')
+    if header.startswith('Bearer '):
+        try:
+            g.identity = get_signer().verify(header[len('Bearer '):].strip())
+        except InvalidTokenError:
+            pass
+
+def identity_error(role=None):
+    """
+    Returns a 401/403 response if the request has no valid token or the
+    token's role is not `role`, else None. CORS preflights carry no
+    Authorization header and are let through.
+    """
+    if request.method == 'OPTIONS':
+        return None
+    identity = g.get('identity')
+    if identity is None:
+        return jsonify(error="Authentication required"), 401
+    if role and identity['role'] != role:
+        return jsonify(error="Not allowed for this account"), 403
+    return None
+
+def require_identity(role=None):
+    """
+    Route decorator around identity_error(). For customers, a view argument
+    named customer_id must also be the caller's own id.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            error = identity_error(role)
+            if error is not None:
+                return error
+            if role == 'customer' and kwargs.get('customer_id', g.identity['user_id']) != g.identity['user_id']:
+                return jsonify(error="Not allowed for this account"), 403
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def init_app(app):
+    app.extensions['token_signer'] = TokenSigner(
+        app.config['SECRET_KEY'],
+        ttl=app.config['TOKEN_TTL'],
+        cache_size=app.config['TOKEN_CACHE_SIZE'],
+    )
+    app.before_request(load_identity)